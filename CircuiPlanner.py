@@ -1,17 +1,89 @@
+import time
+IMPORTED = time.perf_counter()  # Start of the clock for --startup-time, before the heavier imports
+
+import argparse
+import math
 import os
 import tkinter as tk
-from tkinter import colorchooser
-from PIL import Image, ImageTk, ImageDraw, ImageColor
+from tkinter import colorchooser, filedialog, messagebox, simpledialog
+from PIL import ImageTk
+
+from autosave import Autosaver
+from board import make_board
+from components import LIBRARY, ROTATIONS, Components
+from export import PngExporter, compose
+from history import Delta, History
+from icons import IconAtlas
+from nets import Nets
+from profiler import Profiler
+from project import ChunkLoader, ProjectError, ProjectFile
+from render import RENDERERS, BackgroundCache, ComponentView, Overlay, SelectionView, checkerboard, mip_level
+from scheduler import FrameScheduler
+from selection import Block, clip_box
+from text import FONTS, labels_cells
+from tools import bresenham, cells_bbox, flood_fill, line_cells
 
 
 # Configuration
-COL_NUM = 180
+COL_NUM = 180  # Boards over board.SPARSE_THRESHOLD cells are stored as sparse tiles
 ROW_NUM = 140
 PIXEL_SIZE = 10  # Size of each square in pixels
-MIN_PIXEL_SIZE = 2   # Minimum pixel size for zoom-out limit
+VIEW_WIDTH = 1200  # Largest canvas size the window opens with, in screen pixels; it then follows the window
+VIEW_HEIGHT = 900
+VIEW_MARGIN = 0.5  # Part of the view rendered beyond each of its edges, so short pans redraw nothing
+MIN_PIXEL_SIZE = 2   # Smallest pixel size reached in ZOOM_STEP steps
 MAX_PIXEL_SIZE = 20  # Maximum pixel size for zoom-in limit
-CANVAS_X = 0
-CANVAS_Y = 0
+ZOOM_STEP = 2  # Pixel size change per scroll step
+MIN_ZOOM = 1 / 16  # Zoom-out limit; below MIN_PIXEL_SIZE each step halves the pixel size (1, 1/2, 1/4...)
+FILL_CONNECTIVITY = 4  # 4 fills through edges only, 8 also through corners
+SHIFT_MASK = 0x0001  # Shift bit of event.state; Shift+click with the bucket replaces a color everywhere
+SELECT_COLOR = "#ff00ff"  # Overlay color of the cells highlighted by a right click in Colorpick mode
+NET_CONNECTIVITY = 4  # 4 connects wire cells through edges only, 8 also through corners
+NET_COLOR = "#00ffff"  # Overlay color of the net highlighted by a right click in Line mode
+TEXT_FONT = "3x5"  # Font of the Text tool, a key of text.FONTS
+TEXT_SIZE = 1  # Cells per font pixel for bitmap fonts, pixel height for the others
+TARGET_FPS = 60  # Motion events are coalesced and handled at most this many times per second
+UNDO_MEMORY = 16 * 1024 * 1024  # Bytes the undo history may use before the oldest steps are dropped
+AUTOSAVE_INTERVAL = 60_000  # ms between autosaves, 0 turns autosave off
+AUTOSAVE_KEEP = 5  # Autosaves kept per project, older ones are deleted; None keeps them all
+AUTOSAVE_DIR = "Autosave"  # Where autosaves are written, as <project name>-<date>-<time>.cpl
+LOAD_BATCH = 16  # Project chunks loaded per idle step after the visible ones
+PROJECT_TYPES = [("CircuiPlanner project", "*.cpl"), ("All files", "*.*")]
+EXPORT_PATH = "pixel_art.png"  # Where Save writes the PNG until Download picks another path
+EXPORT_COMPRESSION = 6  # PNG compression level, 0 (fastest) to 9 (smallest)
+PROFILE = False  # Start with the profiler on, F12 toggles it and Shift+F12 writes PROFILE_TRACE
+PROFILE_TRACE = "profile_trace.json"  # Chrome trace-event file, open it in chrome://tracing or Perfetto
+RENDERER = "bitmap"  # "bitmap" draws the board as one image, "items" as one rectangle per cell
+# Toolbar icons by key, as file names in Icons/ (kept together in Icons/atlas.png)
+ICONS = {'move': "arrows", 'save': "disk", 'download': "download", 'erase': "eraser", 'colorpick': "eye-dropper",
+         'bucket': "fill", 'color': "palette", 'line': "plug-connection", 'point': "pen-clip", 'add': "plus-hexagon",
+         'open': "subfolder", 'text': "text"}
+# Handlers by event, looked up by name when bound so the profiler can put its wrappers in between
+CANVAS_EVENTS = {"<Button-1>": "left_mouse_click", "<ButtonRelease-1>": "left_mouse_release",
+                 "<Button-2>": "mid_mouse_click", "<ButtonRelease-2>": "mid_mouse_release",
+                 "<Button-3>": "right_mouse_click", "<MouseWheel>": "scroll_action", "<Motion>": "mouse_move",
+                 "<B1-Motion>": "left_mouse_hold", "<B2-Motion>": "mid_mouse_hold", "<B3-Motion>": "right_mouse_hold",
+                 "<Configure>": "follow_view"}
+KEY_EVENTS = {"<Control-z>": "undo", "<Control-y>": "redo", "<Control-Z>": "redo", "<Control-s>": "save_project",
+              "<Control-o>": "open_file", "<F12>": "toggle_profiler", "<Shift-F12>": "export_profile",
+              # Move mode: the selection
+              "<Control-c>": "copy_selection", "<Control-x>": "cut_selection", "<Control-v>": "paste_selection",
+              "<Delete>": "delete_selection", "<Escape>": "clear_selection", "<r>": "rotate_selection",
+              "<R>": "rotate_selection", "<m>": "mirror_selection", "<M>": "mirror_selection"}
+
+
+def zoom_levels():
+    """Return every pixel size the view can zoom to, smallest first.
+
+    Sizes under one pixel per cell are powers of two, the mipmap levels the
+    bitmap renderer keeps.
+    """
+    fractions = []
+    size = 1
+    while size >= MIN_ZOOM and size < MIN_PIXEL_SIZE:
+        fractions.insert(0, size)
+        size /= 2
+    return fractions + list(range(MIN_PIXEL_SIZE, MAX_PIXEL_SIZE + 1, ZOOM_STEP))
 
 
 class PixelArtApp:
@@ -19,415 +91,878 @@ class PixelArtApp:
         self.root = root
         self.root.title("CircuiPlanner")
         self.root.state('zoomed')
-        
-        self.color = "#000000"  # Default color (black)
-        self.action = "Point"
-        
-        self.previous_pos = None
 
         """Create the toolbar."""
         # Create toolbar on the left
         self.toolbar = tk.Frame(root, width=60, bg="lightgray")
         self.toolbar.pack(side="left", fill="y")
 
-        # Load or create icons for toolbar
+        # Load icons for toolbar
         self.load_icons()
         
         # Move button
-        self.move_button = tk.Button(self.toolbar, image=self.icons['move'][1], command=self.move_mode, bg="lightgray", relief="flat")
+        self.move_button = tk.Button(self.toolbar, image=self.icons.get('move'), command=self.move_mode, bg="lightgray", relief="flat")
         self.move_button.pack(padx=4, pady=10)
         
         # Point button
-        self.point_button = tk.Button(self.toolbar, image=self.icons['point'][2], command=self.point_mode, bg="lightgray", relief="groove")
+        self.point_button = tk.Button(self.toolbar, image=self.icons.get('point', selected=True), command=self.point_mode, bg="lightgray", relief="groove")
         self.point_button.pack(padx=4, pady=10)
         
         # Add button
-        self.add_button = tk.Button(self.toolbar, image=self.icons['add'][1], command=self.add_mode, bg="lightgray", relief="flat")
+        self.add_button = tk.Button(self.toolbar, image=self.icons.get('add'), command=self.add_mode, bg="lightgray", relief="flat")
         self.add_button.pack(padx=4, pady=10)
         
         # Line button
-        self.line_button = tk.Button(self.toolbar, image=self.icons['line'][1], command=self.line_mode, bg="lightgray", relief="flat")
+        self.line_button = tk.Button(self.toolbar, image=self.icons.get('line'), command=self.line_mode, bg="lightgray", relief="flat")
         self.line_button.pack(padx=4, pady=10)
         
         # Erase button
-        self.erase_button = tk.Button(self.toolbar, image=self.icons['erase'][1], command=self.erase_mode, bg="lightgray", relief="flat")
+        self.erase_button = tk.Button(self.toolbar, image=self.icons.get('erase'), command=self.erase_mode, bg="lightgray", relief="flat")
         self.erase_button.pack(padx=4, pady=10)
         
         # Color selection button
-        self.color_button = tk.Button(self.toolbar, image=self.icons['color'][1], command=self.choose_color, bg="lightgray", relief="flat")
+        self.color_button = tk.Button(self.toolbar, image=self.icons.get('color'), command=self.choose_color, bg="lightgray", relief="flat")
         self.color_button.pack(padx=4, pady=10)
         
         # Colorpick button
-        self.colorpick_button = tk.Button(self.toolbar, image=self.icons['colorpick'][1], command=self.colorpick_mode, bg="lightgray", relief="flat")
+        self.colorpick_button = tk.Button(self.toolbar, image=self.icons.get('colorpick'), command=self.colorpick_mode, bg="lightgray", relief="flat")
         self.colorpick_button.pack(padx=4, pady=10)
         
         # Bucket button
-        self.bucket_button = tk.Button(self.toolbar, image=self.icons['bucket'][1], command=self.bucket_mode, bg="lightgray", relief="flat")
+        self.bucket_button = tk.Button(self.toolbar, image=self.icons.get('bucket'), command=self.bucket_mode, bg="lightgray", relief="flat")
         self.bucket_button.pack(padx=4, pady=10)
         
         # Text button
-        self.text_button = tk.Button(self.toolbar, image=self.icons['text'][1], command=self.text_mode, bg="lightgray", relief="flat")
+        self.text_button = tk.Button(self.toolbar, image=self.icons.get('text'), command=self.text_mode, bg="lightgray", relief="flat")
         self.text_button.pack(padx=4, pady=10)
         
         # Save button
-        self.save_button = tk.Button(self.toolbar, image=self.icons['save'][1], command=self.save_image, bg="lightgray", relief="flat")
+        self.save_button = tk.Button(self.toolbar, image=self.icons.get('save'), command=self.save_image, bg="lightgray", relief="flat")
         self.save_button.pack(padx=4, pady=10)
         
         # Download button
-        self.download_button = tk.Button(self.toolbar, image=self.icons['download'][1], command=self.download_image, bg="lightgray", relief="flat")
+        self.download_button = tk.Button(self.toolbar, image=self.icons.get('download'), command=self.download_image, bg="lightgray", relief="flat")
         self.download_button.pack(padx=4, pady=10)
         
         # Open button
-        self.open_button = tk.Button(self.toolbar, image=self.icons['open'][1], command=self.open_file, bg="lightgray", relief="flat")
+        self.open_button = tk.Button(self.toolbar, image=self.icons.get('open'), command=self.open_file, bg="lightgray", relief="flat")
         self.open_button.pack(padx=4, pady=10)
         
         
 
         # Canvas for drawing
-        self.canvas = tk.Canvas(root, width=COL_NUM * PIXEL_SIZE, height=ROW_NUM * PIXEL_SIZE)
-        self.canvas.pack(side="right")
+        # Scroll increments of one pixel let panning translate the view instead of redrawing
+        self.canvas = tk.Canvas(root, width=min(COL_NUM * PIXEL_SIZE, VIEW_WIDTH),
+                                height=min(ROW_NUM * PIXEL_SIZE, VIEW_HEIGHT),
+                                xscrollincrement=1, yscrollincrement=1, confine=False)
+        self.canvas.pack(side="right", expand=True, fill="both")
         
-        # Draw checkered background
-        self.draw_background()
+        self.init_state(self.canvas)
         
-        # Event bindings for canvas
-        self.canvas.bind("<Button-1>", self.left_mouse_click)
-        self.canvas.bind("<Button-2>", self.mid_mouse_click)
-        self.canvas.bind("<ButtonRelease-2>", self.mid_mouse_release)
-        self.canvas.bind("<Button-3>", self.right_mouse_click) 
-        self.canvas.bind("<MouseWheel>", self.scroll_action)
-        self.canvas.bind("<Motion>", self.mouse_move) 
-        self.canvas.bind("<B1-Motion>", self.left_mouse_hold)
-        self.canvas.bind("<B2-Motion>", self.mid_mouse_hold)
-        self.canvas.bind("<B3-Motion>", self.right_mouse_hold)
+        self.bind_events()
+        if PROFILE:
+            self.profiler.toggle()
         
-        # Initialize a grid to keep track of pixel colors
-        self.pixel_colors = [[None for _ in range(COL_NUM)] for _ in range(ROW_NUM)]
+        # Snapshots of the board are written to disk on a worker thread
+        self.autosaver = Autosaver(root, AUTOSAVE_DIR, AUTOSAVE_INTERVAL, AUTOSAVE_KEEP, self.autosaved)
+        # Autosaves of a board never saved are named per session, so two windows don't prune each other's
+        self.untitled = f"untitled-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        if AUTOSAVE_INTERVAL:
+            self.autosaver.start(self.autosave_state)
         
+    def init_state(self, canvas, make_photo=ImageTk.PhotoImage):
+        """Set up the board and everything drawn on the canvas, without creating any widget.
+
+        Benchmarks call this on an app built without Tk, with a recording
+        canvas and a make_photo that needs no display.
+        """
+        self.canvas = canvas
+        self.make_photo = make_photo  # Turns PIL images into something the canvas can show
+        self.color = "#000000"  # Default color (black)
+        self.action = "Point"
+        
+        self.previous_pos = None
+        self.stroke_end = None  # Last cell reached by the current Point/Erase drag
+        
+        # Initialize a board to keep track of pixel colors
+        self.board = make_board(COL_NUM, ROW_NUM)
+        self.renderer = RENDERERS[RENDERER](self.canvas, self.board, make_photo)
+        self.history = History(UNDO_MEMORY)
+        self.nets = None  # Wire connectivity, labeled on first use and then kept up to date
+        self.project = None  # ProjectFile the board was opened from or last saved to
+        self.loader = None   # ChunkLoader while an opened project is still loading
+        
+        # PNG export runs on worker threads, Save reuses the last Download settings
+        self.exporter = PngExporter(self.root)
+        self.export_path = EXPORT_PATH
+        self.export_scale = None  # None exports at the current zoom
+        self.export_compression = EXPORT_COMPRESSION
+        # Placed components, drawn above the board
+        self.components = Components()
+        self.component_view = ComponentView(self.canvas, self.components, make_photo)
+        self.footprint = next(iter(LIBRARY.values()))  # What Add mode places
+        self.grabbed = None  # (placement, offset x, offset y, x, y it was picked up at) while dragging one
+        self.label_text = ""  # Last label written with the Text tool, offered again for the next one
+        # Layer above the board for previews, the board itself is only changed on commit
+        self.overlay = Overlay(self.canvas)
+        # Move mode's rectangle of cells, what it copied, and what a drag in progress is doing
+        self.selection = None  # (x0, y0, x1, y1)
+        self.clipboard = None  # Block
+        self.selecting = None  # ("new", anchor cell) or ("move", block, grab offset x, grab offset y)
+        self.selection_view = SelectionView(self.canvas, make_photo)
+        
+        # Background tiles for the zoom levels already visited
+        self.backgrounds = BackgroundCache(self.load_background, make_photo=make_photo)
+        # Size the canvas opens with in screen pixels, until it is mapped and follows the window
+        self.view_size = (min(math.ceil(COL_NUM * PIXEL_SIZE), VIEW_WIDTH),
+                          min(math.ceil(ROW_NUM * PIXEL_SIZE), VIEW_HEIGHT))
+        self.area = (0, 0, 0, 0)  # (x0, y0, x1, y1) cells the background and board images cover
+        self.profiler = Profiler(self)  # Off until toggled, nothing is timed meanwhile
+        
+        # Draw checkered background and the board on top of it
+        self.update_canvas()
+        
+        # Motion events are merged and handled once per frame
+        self.scheduler = FrameScheduler(self.canvas, TARGET_FPS)
+    
+    
+    def bind_events(self):
+        """(Re)bind the canvas events and keyboard shortcuts to the current handlers."""
+        for sequence, name in CANVAS_EVENTS.items():
+            self.canvas.bind(sequence, getattr(self, name))
+        for sequence, name in KEY_EVENTS.items():
+            self.root.bind(sequence, getattr(self, name))
+    
+    
     def load_icons(self):
         """Load the icons for the toolbar."""
-        self.icons = {'move': ["arrows"], 'save': ["disk"], 'download': ["download"], 'erase': ["eraser"], 'colorpick': ["eye-dropper"], 
-                      'bucket': ["fill"], 'color': ["palette"], 'line': ["plug-connection"], 'point': ["pen-clip"], 'add': ["plus-hexagon"], 
-                      'open': ["subfolder"], 'text': ["text"], }
-        
-        for icon in self.icons:
-            self.icons[icon].append(ImageTk.PhotoImage(Image.open(f"Icons/{self.icons[icon][0]}.png")))
-            self.icons[icon].append(self.paint_icon(f"Icons/{self.icons[icon][0]}.png", '#646464'))
-    
-    
-    def make_background(self, width, height):
-        bgs_list = os.listdir("Backgrounds")
-        if f"{width}x{height}.png" not in bgs_list:
-            image = Image.new("RGB", (width, height), (255, 255, 255))
-            for y in range(height):
-                for x in range(width):
-                    color = (211, 211, 211) if (x + y) % 2 == 0 else (255, 255, 255)
-                    image.putpixel((x, y), color)
-                    
-            image.save(f"Backgrounds/{width}x{height}.png")
+        self.icons = IconAtlas(ICONS)
+
+
+    def load_background(self, width, height):
+        """Return the unscaled background for a board size, drawn in memory faster than a file could be read."""
+        return checkerboard(width, height)
 
 
     def draw_background(self):
-        self.make_background(COL_NUM, ROW_NUM)
-        image = Image.open(f"Backgrounds/{COL_NUM}x{ROW_NUM}.png")
-        resized_image = image.resize((COL_NUM * PIXEL_SIZE, ROW_NUM * PIXEL_SIZE), Image.NEAREST)
-        self.bg_image = ImageTk.PhotoImage(resized_image)
-        
-        self.canvas.delete("all")
-        self.canvas.create_image(CANVAS_X, CANVAS_Y, anchor="nw", image=self.bg_image)
+        self.canvas.delete("background")
+        x0, y0, x1, y1 = self.area
+        if x0 >= x1 or y0 >= y1:
+            return
+        self.bg_image = self.backgrounds.get(x0, y0, x1, y1, PIXEL_SIZE)
+        self.canvas.create_image(x0 * PIXEL_SIZE, y0 * PIXEL_SIZE, anchor="nw", image=self.bg_image,
+                                 tags="background")
+        self.canvas.tag_lower("background")
     
     
     def update_canvas(self):
-        # Resize the canvas according to the new PIXEL_SIZE
-        self.canvas.config(width=COL_NUM * PIXEL_SIZE, height=ROW_NUM * PIXEL_SIZE)
+        # The canvas keeps the window's size, only what it shows changes
+        self.canvas.delete("all")
+        self.area = self.view_area()
         self.draw_background()
-        for y in range(ROW_NUM):
-            for x in range(COL_NUM):
-                color = self.pixel_colors[y][x]
-                if color:
-                    self.paint_pixel((x * PIXEL_SIZE, y * PIXEL_SIZE), color)
+        self.renderer.redraw(PIXEL_SIZE, self.area)
+        self.component_view.redraw(PIXEL_SIZE)
+        self.overlay.redraw(PIXEL_SIZE)
+        self.selection_view.redraw(PIXEL_SIZE)
+        if self.profiler.visible:
+            self.profiler.draw()  # Deleted with everything else
+                    
+    
+    def canvas_item_count(self):
+        """Return the number of items on the canvas (background plus board items)."""
+        return len(self.canvas.find_all())
+    
+    
+    def toggle_profiler(self, event=None):
+        self.profiler.toggle()
+    
+    
+    def export_profile(self, event=None):
+        """Write what the profiler recorded as a Chrome trace."""
+        self.profiler.export_trace(PROFILE_TRACE)
+        print(f"Profile saved as {PROFILE_TRACE}")
                     
     
     def move_background(self, pos):
-        global CANVAS_X
-        global CANVAS_Y
-        
         if self.previous_pos is not None:
-            CANVAS_X += (pos[0]-self.previous_pos[0])
-            CANVAS_Y += (pos[1]-self.previous_pos[1])
-            self.update_canvas()
-            self.previous_pos = pos
-        else:
-            self.previous_pos = pos
-        
-        
-        
-        """
-        try:
-            CANVAS_X += (pos[0]-self.previous_pos[0])
-            CANVAS_Y += (pos[1]-self.previous_pos[1])
-            self.draw_background()
-            self.previous_pos = pos
-        except AttributeError or TypeError:
-            self.previous_pos = pos"""
-
+            dx, dy = pos[0]-self.previous_pos[0], pos[1]-self.previous_pos[1]
+            # Scroll the view, the board is only drawn again once the view leaves the area rendered
+            self.canvas.xview_scroll(-dx, "units")
+            self.canvas.yview_scroll(-dy, "units")
+            self.follow_view()
+        self.previous_pos = pos
     
-    def paint_icon(self, path, color):
-        """Open the icon and change its color."""
-        # Load the original icon image
-        img = Image.open(path).convert("RGBA")
-        
-        # Process each pixel to replace black with the selected color
-        data = img.getdata()
-        new_data = []
-        for pixel in data:
-            # Check if pixel is black
-            if pixel[:3] == (0, 0, 0):  # Black in RGB
-                new_data.append((*ImageColor.getrgb(color), pixel[3]))  # Replace with chosen color and original alpha
-            else:
-                new_data.append(pixel)  # Keep other colors unchanged
-
-        img.putdata(new_data)
-
-        # Return the new icon
-        return ImageTk.PhotoImage(img)
+    
+    def view_area(self):
+        """Return the (x0, y0, x1, y1) cells to render: the view and VIEW_MARGIN of it around, cut to the board."""
+        x0, y0, x1, y1 = self.visible_cells()
+        margin_x, margin_y = int((x1 - x0) * VIEW_MARGIN) + 1, int((y1 - y0) * VIEW_MARGIN) + 1
+        x0, y0, x1, y1 = x0 - margin_x, y0 - margin_y, x1 + margin_x, y1 + margin_y
+        if PIXEL_SIZE < 1:
+            # Zoomed out, areas start on whole mipmap pixels
+            factor = 2 ** mip_level(PIXEL_SIZE)
+            x0, y0 = x0 // factor * factor, y0 // factor * factor
+        return clip_box((x0, y0, x1, y1), COL_NUM, ROW_NUM) or (0, 0, 0, 0)
     
     
+    def follow_view(self, event=None):
+        """Render a new area once the view was panned or resized out of the one drawn."""
+        visible = clip_box(self.visible_cells(), COL_NUM, ROW_NUM)
+        x0, y0, x1, y1 = self.area
+        if visible is None or (x0 <= visible[0] and y0 <= visible[1] and visible[2] <= x1 and visible[3] <= y1):
+            return
+        self.area = self.view_area()
+        if self.loader is not None:
+            self.loader.ensure(*self.area)
+            self.report_damaged()
+        self.draw_background()
+        self.renderer.show(self.area)
+    
+    
+    def canvas_pos(self, event):
+        """Convert the screen position of an event to canvas coordinates, accounting for the pan offset."""
+        return int(self.canvas.canvasx(event.x)), int(self.canvas.canvasy(event.y))
+    
+    
+    def cell_at(self, pos):
+        """Return the (x, y) cell under a canvas position, at any zoom."""
+        return int(pos[0] // PIXEL_SIZE), int(pos[1] // PIXEL_SIZE)
+
+    
     def update_toolbar(self):
-        self.move_button.config(image=self.icons['move'][1], relief="flat")
-        self.point_button.config(image=self.icons['point'][1], relief="flat")
-        self.add_button.config(image=self.icons['add'][1], relief="flat")
-        self.line_button.config(image=self.icons['line'][1], relief="flat")
-        self.erase_button.config(image=self.icons['erase'][1], relief="flat")
-        self.colorpick_button.config(image=self.icons['colorpick'][1], relief="flat")
-        self.bucket_button.config(image=self.icons['bucket'][1], relief="flat")
-        self.text_button.config(image=self.icons['text'][1], relief="flat")
-        self.save_button.config(image=self.icons['save'][1], relief="flat")
-        self.download_button.config(image=self.icons['download'][1], relief="flat")
-        self.open_button.config(image=self.icons['open'][1], relief="flat")
+        # Drop any unfinished preview when switching tools
+        self.overlay.clear()
+        self.line_start = None
+        self.set_selection(None)
+        self.move_button.config(image=self.icons.get('move'), relief="flat")
+        self.point_button.config(image=self.icons.get('point'), relief="flat")
+        self.add_button.config(image=self.icons.get('add'), relief="flat")
+        self.line_button.config(image=self.icons.get('line'), relief="flat")
+        self.erase_button.config(image=self.icons.get('erase'), relief="flat")
+        self.colorpick_button.config(image=self.icons.get('colorpick'), relief="flat")
+        self.bucket_button.config(image=self.icons.get('bucket'), relief="flat")
+        self.text_button.config(image=self.icons.get('text'), relief="flat")
+        self.save_button.config(image=self.icons.get('save'), relief="flat")
+        self.download_button.config(image=self.icons.get('download'), relief="flat")
+        self.open_button.config(image=self.icons.get('open'), relief="flat")
         
 
     def paint_pixel(self, pos, color=None):
         if not color:
             color = self.color
-        if 0 < pos[0] < COL_NUM * PIXEL_SIZE and 0 < pos[1] < ROW_NUM * PIXEL_SIZE:
+        if 0 <= pos[0] < COL_NUM * PIXEL_SIZE and 0 <= pos[1] < ROW_NUM * PIXEL_SIZE:
             """Paint a pixel on the canvas and store its color in the grid."""
-            x, y = pos[0] // PIXEL_SIZE, pos[1] // PIXEL_SIZE
-            self.canvas.create_rectangle(
-                x * PIXEL_SIZE, y * PIXEL_SIZE,
-                (x + 1) * PIXEL_SIZE, (y + 1) * PIXEL_SIZE,
-                fill=color, outline=color
-            )
-            self.pixel_colors[y][x] = color
+            x, y = self.cell_at(pos)
+            self.set_cells([(x, y)], color)
 
 
     def erase_pixel(self, pos):
-        if 0 < pos[0] < COL_NUM * PIXEL_SIZE and 0 < pos[1] < ROW_NUM * PIXEL_SIZE:
+        if 0 <= pos[0] < COL_NUM * PIXEL_SIZE and 0 <= pos[1] < ROW_NUM * PIXEL_SIZE:
             """Erase a pixel from the canvas by setting it to transparent."""
-            x, y = pos[0] // PIXEL_SIZE, pos[1] // PIXEL_SIZE
-            # Draw over the pixel with the background color
-            bg_color = "#D3D3D3" if (x + y) % 2 == 0 else "#FFFFFF"
-            self.canvas.create_rectangle(
-                x * PIXEL_SIZE, y * PIXEL_SIZE,
-                (x + 1) * PIXEL_SIZE, (y + 1) * PIXEL_SIZE,
-                fill=bg_color, outline=bg_color
-            )
+            x, y = self.cell_at(pos)
             # Set pixel to transparent in the data grid
-            self.pixel_colors[y][x] = None
+            self.set_cells([(x, y)], None)
+    
+    
+    def set_cells(self, cells, color):
+        """Set some (x, y) cells to a color, record it for undo and draw it in one batch."""
+        if not cells:
+            return
+        self.ensure_loaded(*cells_bbox(cells))
+        delta = Delta.from_cells(self.board, cells, color)
+        delta.apply(self.board)
+        self.history.record(delta)
+        if self.nets is not None:
+            self.nets.update_cells(cells)
+        self.renderer.draw_cells(cells)
+    
+    
+    def draw_stroke(self, samples):
+        """Paint or erase along the mouse path of a drag, filling the gaps between samples."""
+        color = self.color if self.action == "Point" else None
+        cells = []
+        for pos in samples:
+            cell = self.cell_at(pos)
+            if self.stroke_end is None:
+                cells.append(cell)
+            else:
+                cells.extend(bresenham(self.stroke_end, cell)[1:])
+            self.stroke_end = cell
+        cells = [cell for cell in cells if self.board.in_bounds(*cell)]
+        # One render update for everything painted this frame
+        self.set_cells(cells, color)
+    
+    
+    def fill_area(self, pos):
+        if 0 <= pos[0] < COL_NUM * PIXEL_SIZE and 0 <= pos[1] < ROW_NUM * PIXEL_SIZE:
+            """Fill the area of same-colored pixels around pos with the selected color."""
+            x, y = self.cell_at(pos)
+            # The filled area can reach anywhere on the board
+            self.finish_loading()
+            old = self.board.value(x, y)
+            spans = flood_fill(self.board, x, y, self.color, FILL_CONNECTIVITY)
+            self.history.record(Delta.from_spans(self.board, spans, old, self.color))
+            if self.nets is not None:
+                self.nets.update_spans(spans)
+            # One render update for the whole fill
+            self.renderer.draw_spans(spans)
+    
+    
+    def replace_color(self, pos):
+        if 0 <= pos[0] < COL_NUM * PIXEL_SIZE and 0 <= pos[1] < ROW_NUM * PIXEL_SIZE:
+            """Repaint every cell of the color under pos with the selected color, as one undoable step."""
+            self.finish_loading()
+            old = self.board.value(*self.cell_at(pos))
+            # Only the cells inside the color's box are looked at
+            spans = self.board.color_spans(self.board.palette.colors[old])
+            if not spans or self.board.palette.find(self.color) == old:
+                return
+            delta = Delta.from_spans(self.board, spans, old, self.color)
+            delta.apply(self.board)
+            self.history.record(delta)
+            if self.nets is not None:
+                self.nets.update_spans(spans)
+            self.renderer.draw_spans(spans)
+    
+    
+    def pick_color(self, pos):
+        if 0 <= pos[0] < COL_NUM * PIXEL_SIZE and 0 <= pos[1] < ROW_NUM * PIXEL_SIZE:
+            color = self.board.get(*self.cell_at(pos))
+            if color:
+                self.set_color(color)
+    
+    
+    def select_color(self, pos):
+        if 0 <= pos[0] < COL_NUM * PIXEL_SIZE and 0 <= pos[1] < ROW_NUM * PIXEL_SIZE:
+            """Highlight every cell of the color under pos on the overlay."""
+            self.finish_loading()
+            color = self.board.get(*self.cell_at(pos))
+            spans = self.board.color_spans(color) if color else []
+            self.overlay.set({(x, y): SELECT_COLOR for y, x0, x1 in spans for x in range(x0, x1)})
+    
+    
+    def net_index(self):
+        """Return the wire connectivity of the board, labeling it on first use."""
+        if self.nets is None:
+            self.finish_loading()
+            self.nets = Nets(self.board, NET_CONNECTIVITY)
+        return self.nets
+    
+    
+    def show_net(self, pos):
+        if 0 <= pos[0] < COL_NUM * PIXEL_SIZE and 0 <= pos[1] < ROW_NUM * PIXEL_SIZE:
+            """Highlight the whole net under pos on the overlay."""
+            nets = self.net_index()
+            net = nets.net_at(*self.cell_at(pos))
+            self.overlay.set({cell: NET_COLOR for cell in nets.net_cells(net)})
+            if net:
+                self.root.title(f"CircuiPlanner - net {net}, {nets.net_size(net)} cells")
+            else:
+                self.root.title("CircuiPlanner")
+    
+    
+    def fits(self, footprint, x, y, rotation, mirror, ignore=None):
+        """Tell whether a footprint placed this way stays on the board without covering another component."""
+        width, height = footprint.size(rotation)
+        if x < 0 or y < 0 or x + width > COL_NUM or y + height > ROW_NUM:
+            return False
+        return not self.components.collisions(footprint, x, y, rotation, mirror, ignore)
+    
+    
+    def place_component(self, pos, remove=False):
+        """Pick up the component under pos, or place the selected footprint there if it is free."""
+        x, y = self.cell_at(pos)
+        placement = self.components.at(x, y)
+        if placement is None:
+            if not remove and self.fits(self.footprint, x, y, 0, False):
+                self.component_view.draw(self.components.add(self.footprint, x, y))
+        elif remove:
+            self.components.remove(placement)
+            self.component_view.delete(placement)
+        else:
+            self.grabbed = (placement, x - placement.x, y - placement.y, placement.x, placement.y)
+    
+    
+    def drag_component(self, pos):
+        placement, dx, dy, _, _ = self.grabbed
+        x, y = self.cell_at(pos)
+        x, y = x - dx, y - dy
+        if (x, y) != (placement.x, placement.y):
+            self.components.move(placement, x, y)
+            self.component_view.draw(placement)
+    
+    
+    def drop_component(self):
+        """Leave the dragged component where it is, or send it back if it does not fit there."""
+        placement, _, _, x, y = self.grabbed
+        self.grabbed = None
+        if not self.fits(placement.footprint, placement.x, placement.y, placement.rotation, placement.mirror,
+                         placement.id):
+            self.components.move(placement, x, y)
+            self.component_view.draw(placement)
+    
+    
+    def turn_component(self, pos, mirror=False):
+        """Rotate the component under pos a quarter turn clockwise, or mirror it, if it still fits."""
+        placement = self.components.at(*self.cell_at(pos))
+        if placement is None:
+            return
+        rotation, flipped = placement.rotation, placement.mirror
+        if mirror:
+            flipped = not flipped
+        else:
+            rotation = ROTATIONS[(ROTATIONS.index(rotation) + 1) % len(ROTATIONS)]
+        if self.fits(placement.footprint, placement.x, placement.y, rotation, flipped, placement.id):
+            self.components.move(placement, placement.x, placement.y, rotation, flipped)
+            self.component_view.draw(placement)
+    
+    
+    def place_label(self, pos):
+        """Ask for a label and write it onto the board with its top left corner at pos."""
+        if 0 <= pos[0] < COL_NUM * PIXEL_SIZE and 0 <= pos[1] < ROW_NUM * PIXEL_SIZE:
+            text = simpledialog.askstring("Text", "Label:", initialvalue=self.label_text)
+            if text:
+                self.label_text = text
+                self.stamp_labels([(text, *self.cell_at(pos), self.color,
+                                    FONTS[TEXT_FONT], TEXT_SIZE)])
+    
+    
+    def stamp_labels(self, labels):
+        """Write (text, x, y, color, font, size) labels onto the board as one undo step and one redraw."""
+        groups = labels_cells(labels, COL_NUM, ROW_NUM)
+        cells = [cell for group in groups.values() for cell in group]
+        if not cells:
+            return
+        self.ensure_loaded(*cells_bbox(cells))
+        deltas = []
+        for color, group in groups.items():
+            delta = Delta.from_cells(self.board, group, color)
+            delta.apply(self.board)
+            deltas.append(delta)
+        self.history.push(deltas)
+        if self.nets is not None:
+            self.nets.update_cells(cells)
+        self.renderer.draw_cells(cells)
+    
+    
+    def set_selection(self, box):
+        self.selection = box
+        self.selecting = None
+        self.selection_view.show(box)
+    
+    
+    def select_start(self, pos):
+        """Pick up the selected cells if pos is inside the selection, otherwise start a new one there."""
+        x, y = self.cell_at(pos)
+        box = self.selection
+        if box and box[0] <= x < box[2] and box[1] <= y < box[3]:
+            self.ensure_loaded(*box)
+            self.selecting = ("move", Block.from_board(self.board, *box), x - box[0], y - box[1])
+        elif 0 <= x < COL_NUM and 0 <= y < ROW_NUM:
+            self.set_selection((x, y, x + 1, y + 1))
+            self.selecting = ("new", (x, y))
+    
+    
+    def select_drag(self, pos):
+        """Stretch the new selection to pos, or show the picked up cells moved along with the mouse."""
+        x, y = self.cell_at(pos)
+        if self.selecting[0] == "new":
+            ax, ay = self.selecting[1]
+            self.selection = clip_box((min(ax, x), min(ay, y), max(ax, x) + 1, max(ay, y) + 1), COL_NUM, ROW_NUM)
+            self.selection_view.show(self.selection)
+        else:
+            _, block, dx, dy = self.selecting
+            x, y = x - dx, y - dy
+            self.selection_view.show((x, y, x + block.width, y + block.height), block)
+    
+    
+    def select_end(self):
+        """Finish a drag: keep the new selection, or move the picked up cells where they were dropped."""
+        selecting, box = self.selecting, self.selection_view.box
+        if selecting[0] == "move" and box != self.selection:
+            block = selecting[1]
+            x0, y0 = self.selection[:2]
+            self.write_blocks([(x0, y0, Block.empty(block.width, block.height, self.board.palette)),
+                               (box[0], box[1], block)])
+        self.set_selection(clip_box(box, COL_NUM, ROW_NUM) if box else None)
+    
+    
+    def write_blocks(self, writes):
+        """Write (x, y, block) blocks in order as one undo step, then redraw the rectangles they covered."""
+        deltas, boxes = [], []
+        for x, y, block in writes:
+            self.ensure_loaded(x, y, x + block.width, y + block.height)
+            delta, box = block.write(self.board, x, y)
+            if delta:
+                deltas.append(delta)
+                boxes.append(box)
+        if not deltas:
+            return
+        self.history.push(deltas)
+        for box in boxes:
+            if self.nets is not None:
+                self.nets.update_rect(*box)
+            self.renderer.draw_rect(*box)
+    
+    
+    def selected_block(self):
+        """Return the selected cells as a block, or None outside Move mode or without a selection."""
+        if self.action != "Move" or self.selection is None:
+            return None
+        self.scheduler.flush()
+        self.ensure_loaded(*self.selection)
+        return Block.from_board(self.board, *self.selection)
+    
+    
+    def copy_selection(self, event=None):
+        block = self.selected_block()
+        if block is not None:
+            self.clipboard = block
+    
+    
+    def cut_selection(self, event=None):
+        self.copy_selection()
+        self.delete_selection()
+    
+    
+    def delete_selection(self, event=None):
+        block = self.selected_block()
+        if block is not None:
+            self.write_blocks([(*self.selection[:2], Block.empty(block.width, block.height, self.board.palette))])
+    
+    
+    def clear_selection(self, event=None):
+        self.set_selection(None)
+    
+    
+    def paste_selection(self, event=None):
+        """Paste the copied cells at the top left of the selection, or of the view, and select them."""
+        if self.action != "Move" or self.clipboard is None:
+            return
+        self.scheduler.flush()
+        x, y = self.selection[:2] if self.selection else (max(cell, 0) for cell in self.visible_cells()[:2])
+        block = self.clipboard
+        self.write_blocks([(x, y, block)])
+        self.set_selection(clip_box((x, y, x + block.width, y + block.height), COL_NUM, ROW_NUM))
+    
+    
+    def transform_selection(self, block):
+        """Replace the selected cells by a transformed block of them, centered on the same spot."""
+        x0, y0, x1, y1 = self.selection
+        x = x0 + (x1 - x0 - block.width) // 2
+        y = y0 + (y1 - y0 - block.height) // 2
+        self.write_blocks([(x0, y0, Block.empty(x1 - x0, y1 - y0, self.board.palette)), (x, y, block)])
+        self.set_selection(clip_box((x, y, x + block.width, y + block.height), COL_NUM, ROW_NUM))
+    
+    
+    def rotate_selection(self, event=None):
+        """Turn the selection clockwise by 90 degrees, counterclockwise with Shift."""
+        block = self.selected_block()
+        if block is not None:
+            self.transform_selection(block.rotated(clockwise=not (event and event.state & SHIFT_MASK)))
+    
+    
+    def mirror_selection(self, event=None):
+        """Flip the selection left to right, top to bottom with Shift."""
+        block = self.selected_block()
+        if block is not None:
+            self.transform_selection(block.mirrored(vertical=bool(event and event.state & SHIFT_MASK)))
+    
+    
+    def line_to(self, pos):
+        """Return the cells of the line from line_start to the cell under pos, inside the board."""
+        end = self.cell_at(pos)
+        return [cell for cell in line_cells(self.line_start, end) if self.board.in_bounds(*cell)]
     
     
     def preview_line(self, pos):
-        if 0 < pos[0] < COL_NUM * PIXEL_SIZE and 0 < pos[1] < ROW_NUM * PIXEL_SIZE:
-            """Erase the previous line"""
-            if self.previous_line != []:
-                for pixel in self.previous_line:
-                    if not pixel[2]:
-                        self.erase_pixel((pixel[0], pixel[1]))
-                    else:
-                        self.paint_pixel((pixel[0], pixel[1]), pixel[2])
-            self.previous_line = []
-            
-            """Draw a temporary line"""
-            if (abs(self.line_start[0] - pos[0]) < abs(self.line_start[1] - pos[1]) and 
-                abs(self.line_start[0] - pos[0]) < abs(abs(self.line_start[0] - pos[0]) - abs(self.line_start[1] - pos[1])) ): # Vertical line
-                if self.line_start[1] < pos[1]:
-                    a, b = self.line_start[1]-PIXEL_SIZE, pos[1]
-                else:
-                    a, b = pos[1]-PIXEL_SIZE, self.line_start[1]
-                    
-                for posy in range(a, b):
-                    if posy % PIXEL_SIZE == 0:
-                        self.previous_line.append([self.line_start[0], posy, self.pixel_colors[posy // PIXEL_SIZE][self.line_start[0] // PIXEL_SIZE]])
-                        self.paint_pixel((self.line_start[0], posy))
-                        
-                        
-            elif (abs(self.line_start[1] - pos[1]) < abs(self.line_start[0] - pos[0]) and 
-                  abs(self.line_start[1] - pos[1]) < abs(abs(self.line_start[0] - pos[0]) - abs(self.line_start[1] - pos[1])) ): # Horizontal line
-                if self.line_start[0] < pos[0]:
-                    a, b = self.line_start[0]-PIXEL_SIZE, pos[0]
-                else:
-                    a, b = pos[0]-PIXEL_SIZE, self.line_start[0]
-                    
-                for posx in range(a, b):
-                    if posx % PIXEL_SIZE == 0:
-                        self.previous_line.append([posx, self.line_start[1], self.pixel_colors[self.line_start[1] // PIXEL_SIZE][posx // PIXEL_SIZE]])
-                        self.paint_pixel((posx, self.line_start[1]))
-            
-            else: # Diagonal line
-                relative_pos = (pos[0]-self.line_start[0], pos[1]-self.line_start[1])
-                try:
-                    multx, multy = relative_pos[0]/abs(relative_pos[0]), relative_pos[1]/abs(relative_pos[1])
-                except ZeroDivisionError:
-                    multx, multy = 1, 1
-                deviation = (abs(relative_pos[0]) + abs(relative_pos[1]))/2
-                current_deviation = 0
-                while current_deviation <= deviation:
-                    pointx, pointy = int(self.line_start[0]+(current_deviation*multx)), int(self.line_start[1]+(current_deviation*multy))
-                    self.previous_line.append([pointx, pointy, self.pixel_colors[pointy // PIXEL_SIZE][pointx // PIXEL_SIZE]])
-                    self.paint_pixel((pointx, pointy))
-                    current_deviation += PIXEL_SIZE
+        if 0 <= pos[0] < COL_NUM * PIXEL_SIZE and 0 <= pos[1] < ROW_NUM * PIXEL_SIZE:
+            """Show a temporary line on the overlay, redrawing only the cells that changed"""
+            self.overlay.set({cell: self.color for cell in self.line_to(pos)})
                 
     
     def draw_line(self, pos):
-        if 0 < pos[0] < COL_NUM * PIXEL_SIZE and 0 < pos[1] < ROW_NUM * PIXEL_SIZE:
-            
-            if (abs(self.line_start[0] - pos[0]) < abs(self.line_start[1] - pos[1]) and 
-                abs(self.line_start[0] - pos[0]) < abs(abs(self.line_start[0] - pos[0]) - abs(self.line_start[1] - pos[1])) ): # Vertical line
-                if self.line_start[1] < pos[1]:
-                    a, b = self.line_start[1]-PIXEL_SIZE, pos[1]
-                else:
-                    a, b = pos[1]-PIXEL_SIZE, self.line_start[1]
-                    
-                for posy in range(a, b):
-                    if posy % PIXEL_SIZE == 0:
-                        self.paint_pixel((self.line_start[0], posy))          
-                        
-            elif (abs(self.line_start[1] - pos[1]) < abs(self.line_start[0] - pos[0]) and 
-                  abs(self.line_start[1] - pos[1]) < abs(abs(self.line_start[0] - pos[0]) - abs(self.line_start[1] - pos[1])) ): # Horizontal line
-                if self.line_start[0] < pos[0]:
-                    a, b = self.line_start[0]-PIXEL_SIZE, pos[0]
-                else:
-                    a, b = pos[0]-PIXEL_SIZE, self.line_start[0]
-                    
-                for posx in range(a, b):
-                    if posx % PIXEL_SIZE == 0:
-                        self.paint_pixel((posx, self.line_start[1]))
-            
-            else: # Diagonal line
-                relative_pos = (pos[0]-self.line_start[0], pos[1]-self.line_start[1])
-                try:
-                    multx, multy = relative_pos[0]/abs(relative_pos[0]), relative_pos[1]/abs(relative_pos[1])
-                except ZeroDivisionError:
-                    multx, multy = 1, 1
-                deviation = (abs(relative_pos[0]) + abs(relative_pos[1]))/2
-                current_deviation = 0
-                while current_deviation <= deviation:
-                    pointx, pointy = int(self.line_start[0]+(current_deviation*multx)), int(self.line_start[1]+(current_deviation*multy))
-                    self.paint_pixel((pointx, pointy))
-                    current_deviation += PIXEL_SIZE
-            
+        if 0 <= pos[0] < COL_NUM * PIXEL_SIZE and 0 <= pos[1] < ROW_NUM * PIXEL_SIZE:
+            self.overlay.clear()
+            self.set_cells(self.line_to(pos), self.color)
             self.line_start = None
 
     
     def move_mode(self):
         self.action = "Move"
         self.update_toolbar()
-        self.move_button.config(image=self.icons['move'][2], relief="groove")
-        pass
+        self.move_button.config(image=self.icons.get('move', selected=True), relief="groove")
     
     def point_mode(self):
         self.action = "Point"
         self.update_toolbar()
-        self.point_button.config(image=self.icons['point'][2], relief="groove")
+        self.point_button.config(image=self.icons.get('point', selected=True), relief="groove")
         pass
     
     def erase_mode(self):
         self.action = "Erase"
         self.update_toolbar()
-        self.erase_button.config(image=self.icons['erase'][2], relief="groove")
+        self.erase_button.config(image=self.icons.get('erase', selected=True), relief="groove")
         pass
     
     def colorpick_mode(self):
         self.action = "Colorpick"
         self.update_toolbar()
-        self.colorpick_button.config(image=self.icons['colorpick'][2], relief="groove")
+        self.colorpick_button.config(image=self.icons.get('colorpick', selected=True), relief="groove")
         pass
     
     def bucket_mode(self):
         self.action = "Bucket"
         self.update_toolbar()
-        self.bucket_button.config(image=self.icons['bucket'][2], relief="groove")
+        self.bucket_button.config(image=self.icons.get('bucket', selected=True), relief="groove")
         pass
     
     def line_mode(self):
         self.action = "Line"
         self.update_toolbar()
-        self.line_button.config(image=self.icons['line'][2], relief="groove")
-        self.line_start = None
+        self.line_button.config(image=self.icons.get('line', selected=True), relief="groove")
     
     def add_mode(self):
+        if self.action == "Add":
+            # Clicking Add again picks the next footprint of the library
+            names = list(self.components.library)
+            self.footprint = self.components.library[names[(names.index(self.footprint.name) + 1) % len(names)]]
         self.action = "Add"
         self.update_toolbar()
-        self.add_button.config(image=self.icons['add'][2], relief="groove")
-        pass
+        self.add_button.config(image=self.icons.get('add', selected=True), relief="groove")
+        self.root.title(f"CircuiPlanner - {self.footprint.name}")
     
-    def open_file(self):
-        self.action = "Open"
-        self.update_toolbar()
-        self.open_button.config(image=self.icons['open'][2], relief="groove")
-        pass
+    def open_file(self, event=None):
+        """Ask for a project file and open it."""
+        path = filedialog.askopenfilename(filetypes=PROJECT_TYPES)
+        if path:
+            self.load_project(path)
     
     def text_mode(self):
         self.action = "Text"
         self.update_toolbar()
-        self.text_button.config(image=self.icons['text'][2], relief="groove")
-        pass
+        self.text_button.config(image=self.icons.get('text', selected=True), relief="groove")
     
     def choose_color(self):
         """Open color chooser dialog to select color."""
         color = colorchooser.askcolor()[1]
         if color:
-            self.color = color
-            self.color_icon = self.paint_icon("Icons/palette.png", color)
-            self.color_button.config(image=self.color_icon)
+            self.set_color(color)
+    
+    
+    def set_color(self, color):
+        self.color = color
+        self.color_icon = self.icons.tinted("color", color)
+        self.color_button.config(image=self.color_icon)
+    
+    
+    def project_meta(self):
+        """Everything besides the cells that a project file keeps."""
+        placements, footprints = self.components.to_meta()
+        return {"color": self.color, "components": placements, "footprints": footprints,
+                "metadata": {"app": "CircuiPlanner"}}
+    
+    
+    def save_project(self, event=None):
+        """Save the project, only rewriting the parts of the file that changed."""
+        if self.project is None:
+            path = filedialog.asksaveasfilename(defaultextension=".cpl", filetypes=PROJECT_TYPES)
+            if not path:
+                return
+            self.project = ProjectFile(path)
+        # Saving releases the file, so everything still on disk has to be read first
+        self.finish_loading()
+        self.project.save(self.board, self.project_meta())
+    
+    
+    def autosave_state(self):
+        """Return what the autosaver should save, or None while part of the board is still on disk."""
+        if self.loader is not None:
+            return None
+        if self.project is None:
+            return self.board, self.project_meta(), self.untitled, 0
+        name = os.path.splitext(os.path.basename(self.project.path))[0]
+        return self.board, self.project_meta(), name, self.project.saved_generation
+    
+    
+    def autosaved(self, path, error):
+        if error:
+            print(f"Autosave to {path} failed: {error}")
+    
+    
+    def load_project(self, path):
+        """Open a project, showing the visible part right away and loading the rest while idle."""
+        global COL_NUM
+        global ROW_NUM
+        try:
+            project, board, meta = ProjectFile.open(path)
+        except (OSError, ProjectError) as error:
+            messagebox.showerror("CircuiPlanner", str(error))
+            return
+        if self.project is not None:
+            self.project.close()
+        self.project = project
+        self.loader = ChunkLoader(project, board)
+        self.board = board
+        self.renderer = RENDERERS[RENDERER](self.canvas, self.board, self.make_photo)
+        self.history = History(UNDO_MEMORY)
+        self.nets = None
+        COL_NUM, ROW_NUM = board.width, board.height
+        if meta.get("color"):
+            self.set_color(meta["color"])
+        self.components = Components.from_meta(meta.get("components", []), meta.get("footprints", []))
+        self.component_view = ComponentView(self.canvas, self.components, self.make_photo)
+        self.set_selection(None)
+        
+        self.loader.ensure(*self.visible_cells())
+        self.update_canvas()
+        self.report_damaged()
+        self.root.after_idle(self.load_in_background)
+    
+    
+    def visible_cells(self):
+        """Return the (x0, y0, x1, y1) rectangle of cells currently in view."""
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if width <= 1:
+            width, height = self.view_size  # Not mapped yet
+        x0, y0 = self.cell_at((self.canvas.canvasx(0), self.canvas.canvasy(0)))
+        x1, y1 = self.cell_at((self.canvas.canvasx(width), self.canvas.canvasy(height)))
+        return x0, y0, x1 + 1, y1 + 1
+    
+    
+    def load_in_background(self):
+        """Load a batch of the chunks that are still on disk, then come back for more."""
+        if self.loader is None:
+            return
+        self.draw_chunks(self.loader.load_some(LOAD_BATCH))
+        self.report_damaged()
+        if self.loader.done:
+            self.loader = None
+        else:
+            self.root.after(1, self.load_in_background)
+    
+    
+    def ensure_loaded(self, x0, y0, x1, y1):
+        """Load the chunks of a rectangle that are still on disk, before it is edited."""
+        if self.loader is not None:
+            self.draw_chunks(self.loader.ensure(x0, y0, x1, y1))
+            self.report_damaged()
+    
+    
+    def finish_loading(self):
+        if self.loader is not None:
+            self.draw_chunks(self.loader.finish())
+            self.report_damaged()
+            self.loader = None
+    
+    
+    def report_damaged(self):
+        """Show the chunks the loader could not read, which are left empty, once."""
+        errors = self.loader.errors
+        if errors:
+            more = f"\n({len(errors) - 1} more damaged chunks)" if len(errors) > 1 else ""
+            messagebox.showerror("CircuiPlanner", f"{errors[0]}{more}")
+            errors.clear()
+    
+    
+    def draw_chunks(self, chunks):
+        for chunk in chunks:
+            self.renderer.draw_rect(*self.board.chunk_rect(*chunk))
 
 
     def save_image(self):
-        """Save the current pixel art as a PNG file."""
-        image = Image.new("RGBA", (COL_NUM, ROW_NUM), (255, 255, 255, 0))  # RGBA with transparent background
-        
-        for y in range(ROW_NUM):
-            for x in range(COL_NUM):
-                color = self.pixel_colors[y][x]
-                if color is not None:  # Only draw non-transparent pixels
-                    image.putpixel((x, y), self.hex_to_rgba(color))
-        
-        image = image.resize((COL_NUM * PIXEL_SIZE, ROW_NUM * PIXEL_SIZE), Image.NEAREST)
-        image.save("pixel_art.png")
-        print("Image saved as pixel_art.png")
+        """Save the current pixel art as a PNG file, without blocking the UI."""
+        self.finish_loading()
+        image = compose(self.board, self.components)  # RGBA with transparent background, detached from the board
+        scale = self.export_scale or max(PIXEL_SIZE, 1)
+        self.exporter.export(image, self.export_path, scale, self.export_compression, self.image_saved)
         
     def download_image(self):
-        self.action = "Download"
-        self.update_toolbar()
-        self.download_button.config(image=self.icons['download'][2], relief="groove")
-        pass
+        """Ask where, how large and how compressed to export the PNG, then save it."""
+        path = filedialog.asksaveasfilename(defaultextension=".png", initialfile=os.path.basename(self.export_path),
+                                            filetypes=[("PNG image", "*.png")])
+        if not path:
+            return
+        scale = simpledialog.askinteger("Export", "Pixels per cell:", initialvalue=self.export_scale or max(PIXEL_SIZE, 1),
+                                        minvalue=1, maxvalue=100)
+        if not scale:
+            return
+        compression = simpledialog.askinteger("Export", "Compression level (0 fastest, 9 smallest):",
+                                              initialvalue=self.export_compression, minvalue=0, maxvalue=9)
+        if compression is None:
+            return
+        self.export_path, self.export_scale, self.export_compression = path, scale, compression
+        self.save_image()
+    
+    def image_saved(self, path, error):
+        """Report the end of an export, on the Tk thread."""
+        if error:
+            messagebox.showerror("CircuiPlanner", f"Could not save {path}: {error}")
+        else:
+            print(f"Image saved as {path}")
     
     
     
     def left_mouse_click(self, event):
+        self.scheduler.flush()  # Handle queued motion before the click
         action = self.action
-        if action == "Point":
-            self.paint_pixel((event.x, event.y))
-        elif action == "Erase":
-            self.erase_pixel((event.x, event.y))
+        if action in ("Point", "Erase"):
+            pos = self.canvas_pos(event)
+            # A drag starting here continues the stroke from this cell, and is undone as one step
+            self.stroke_end = self.cell_at(pos)
+            self.history.begin_group()
+            if action == "Point":
+                self.paint_pixel(pos)
+            else:
+                self.erase_pixel(pos)
+        elif action == "Bucket":
+            if event.state & SHIFT_MASK:
+                self.replace_color(self.canvas_pos(event))
+            else:
+                self.fill_area(self.canvas_pos(event))
+        elif action == "Colorpick":
+            self.pick_color(self.canvas_pos(event))
+        elif action == "Add":
+            self.place_component(self.canvas_pos(event), remove=bool(event.state & SHIFT_MASK))
+        elif action == "Text":
+            self.place_label(self.canvas_pos(event))
+        elif action == "Move":
+            self.select_start(self.canvas_pos(event))
         elif action == "Line":
             if not self.line_start:
-                self.previous_line = []
-                self.line_start = event.x, event.y
-                self.preview_line((event.x, event.y))
+                pos = self.canvas_pos(event)
+                self.line_start = self.cell_at(pos)
+                self.preview_line(pos)
             else:
-                self.draw_line((event.x, event.y))
-                self.previous_line = []
+                self.draw_line(self.canvas_pos(event))
+    
+    
+    def left_mouse_release(self, event):
+        self.scheduler.flush()
+        if self.grabbed:
+            self.drop_component()
+        if self.selecting:
+            self.select_end()
+        self.stroke_end = None
+        self.history.end_group()
+    
+    
+    def undo(self, event=None):
+        self.scheduler.flush()
+        bbox = self.history.undo(self.board)
+        if bbox:
+            if self.nets is not None:
+                self.nets.update_rect(*bbox)
+            self.renderer.draw_rect(*bbox)
+    
+    
+    def redo(self, event=None):
+        self.scheduler.flush()
+        bbox = self.history.redo(self.board)
+        if bbox:
+            if self.nets is not None:
+                self.nets.update_rect(*bbox)
+            self.renderer.draw_rect(*bbox)
     
     
     def mid_mouse_click(self, event):
@@ -435,40 +970,58 @@ class PixelArtApp:
     
     
     def mid_mouse_release(self, event):
+        self.scheduler.flush()
         self.previous_pos = None
     
     
     def right_mouse_click(self, event):
-        pass
+        if self.action == "Colorpick":
+            self.select_color(self.canvas_pos(event))
+        elif self.action == "Line" and not self.line_start:
+            self.show_net(self.canvas_pos(event))
+        elif self.action == "Add":
+            self.turn_component(self.canvas_pos(event), mirror=bool(event.state & SHIFT_MASK))
     
     
     def scroll_action(self, event):
         global PIXEL_SIZE
-        if event.delta > 0 and PIXEL_SIZE < MAX_PIXEL_SIZE:  # Scroll up (zoom in)
-            PIXEL_SIZE += 2  # Adjust zoom increment as needed
-            self.update_canvas()
-        elif event.delta < 0 and PIXEL_SIZE > MIN_PIXEL_SIZE:  # Scroll down (zoom out)
-            PIXEL_SIZE -= 2  # Adjust zoom increment as needed
-            self.update_canvas()
+        levels = zoom_levels()
+        i = min(range(len(levels)), key=lambda i: abs(levels[i] - PIXEL_SIZE))
+        if event.delta > 0 and i + 1 < len(levels):  # Scroll up (zoom in)
+            i += 1
+        elif event.delta < 0 and i > 0:  # Scroll down (zoom out)
+            i -= 1
+        else:
+            return
+        PIXEL_SIZE = levels[i]
+        self.update_canvas()
+        
+        # Build the neighbouring zoom levels while the app is idle
+        neighbours = levels[max(i - 1, 0):i] + levels[i + 1:i + 2]
+        self.root.after_idle(self.backgrounds.prewarm, neighbours)
     
     
     def mouse_move(self, event):
         action = self.action
         if action == "Line":
             if self.line_start:
-                self.preview_line((event.x, event.y))
+                # Only the latest position of the frame matters for the preview
+                self.scheduler.post("hover", lambda samples: self.preview_line(samples[-1]), self.canvas_pos(event))
     
     
     def left_mouse_hold(self, event):
         action = self.action
-        if action == "Point":
-            self.paint_pixel((event.x, event.y))
-        elif action == "Erase":
-            self.erase_pixel((event.x, event.y))
+        if action in ("Point", "Erase"):
+            # Keep every sample so the stroke follows the mouse path
+            self.scheduler.post("stroke", self.draw_stroke, self.canvas_pos(event), keep_all=True)
+        elif action == "Add" and self.grabbed:
+            self.scheduler.post("drag", lambda samples: self.drag_component(samples[-1]), self.canvas_pos(event))
+        elif action == "Move" and self.selecting:
+            self.scheduler.post("select", lambda samples: self.select_drag(samples[-1]), self.canvas_pos(event))
     
     
     def mid_mouse_hold(self, event):
-        self.move_background((event.x, event.y))
+        self.scheduler.post("pan", lambda samples: self.move_background(samples[-1]), (event.x, event.y))
     
     
     def right_mouse_hold(self, event):
@@ -476,16 +1029,22 @@ class PixelArtApp:
     
     
 
-    @staticmethod
-    def hex_to_rgba(hex_color):
-        """Convert hex color (#RRGGBB) to RGBA tuple with full opacity."""
-        hex_color = hex_color.lstrip('#')
-        rgb = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-        return rgb + (255,)
-    
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan circuits cell by cell.")
+    parser.add_argument("project", nargs="?", help="project file to open")
+    parser.add_argument("--startup-time", action="store_true", help="print the time from import to the first frame")
+    args = parser.parse_args(argv)
     
+    root = tk.Tk()
+    app = PixelArtApp(root)
+    if args.project:
+        app.load_project(args.project)
+    if args.startup_time:
+        root.update()  # Map the window and draw the first frame
+        print(f"First frame after {(time.perf_counter() - IMPORTED) * 1000:.0f} ms")
+    root.mainloop()
+
 
 # Run the application
-root = tk.Tk()
-app = PixelArtApp(root)
-root.mainloop()
+if __name__ == "__main__":
+    main()
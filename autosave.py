@@ -0,0 +1,133 @@
+import os
+import queue
+import re
+import threading
+import time
+
+from project import encode_chunk, write_project
+
+
+class Autosaver:
+    """Save the board every interval on a worker thread, so a crash loses at most one interval of work.
+
+    On the Tk thread a save only copies the chunks written since the last one
+    (the painted ones for the first save of a board) and the metadata. That
+    snapshot is all the worker reads, so the board can go on changing
+    meanwhile. The worker compresses just those chunks, reuses the compressed
+    data of the others, and writes a complete project file under a temporary
+    name that is then renamed into place. Only the newest keep autosaves of
+    each project name are kept, or all of them if keep is None. A failed
+    save is reported to on_saved and the next one writes every chunk again.
+    """
+
+    def __init__(self, widget, directory="Autosave", interval=60_000, keep=5, on_saved=None):
+        if keep is not None and keep < 1:
+            raise ValueError(f"keep must be at least 1, or None to keep every autosave, not {keep}")
+        self.widget = widget
+        self.directory = directory
+        self.interval = interval  # ms between saves
+        self.keep = keep
+        self.on_saved = on_saved  # Called as on_saved(path, error) on the Tk thread
+        self.source = None
+        self.job = None
+        self.board = None  # Board the snapshots are taken from
+        self.generation = 0  # Board generation at the last snapshot
+        self.meta = None
+        self.full = False  # The next snapshot has to copy every chunk
+        self.failed = False  # Set by the worker when its encoded chunks may be out of date
+        self.snapshots = queue.Queue()
+        self.results = queue.Queue()
+        # Encoded chunks of the board being saved, row-major; only the worker touches them
+        self.chunks = []
+        threading.Thread(target=self._work, daemon=True).start()
+
+    def start(self, source):
+        """Save every interval from now on.
+
+        source() returns (board, meta, name, since), since being the board
+        generation that is already safe on disk, or None to skip a save.
+        """
+        self.source = source
+        self.job = self.widget.after(self.interval, self.tick)
+
+    def stop(self):
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+
+    def tick(self):
+        self.report()
+        state = self.source()
+        if state is not None:
+            self.save(*state)
+        self.job = self.widget.after(self.interval, self.tick)
+
+    def report(self):
+        """Hand the outcome of finished saves to on_saved, on the Tk thread."""
+        while True:
+            try:
+                path, error = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if self.on_saved is not None:
+                self.on_saved(path, error)
+
+    def save(self, board, meta, name, since=0):
+        """Queue a snapshot of what changed since the last one. Returns False if nothing did."""
+        if board is not self.board:
+            # A new or reopened board, the next save writes all of it
+            self.board, self.generation, self.meta, self.full = board, since, meta, True
+        if self.failed:
+            self.failed, self.full = False, True
+        changed = board.changed_chunks(self.generation)
+        if not changed and meta == self.meta:
+            return False
+        if self.full:
+            # The worker starts every chunk out empty, only the painted ones need copying
+            changed = board.painted_chunks()
+        copies = {chunk: board.get_chunk(*chunk) for chunk in changed}
+        # Palette indices are never reassigned, so chunks encoded earlier stay valid with a newer palette
+        palette = board.palette.colors[1:]
+        self.snapshots.put((self.full, board.width, board.height, board.chunk_cols, board.chunk_rows, copies,
+                            dict(meta, palette=palette), name))
+        self.generation, self.meta, self.full = board.generation, meta, False
+        return True
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.cpl")
+
+    def prune(self, name):
+        """Delete all but the newest keep autosaves of a project name."""
+        if self.keep is None:
+            return
+        pattern = re.compile(re.escape(name) + r"-\d{8}-\d{6}\.cpl")
+        saves = sorted(entry for entry in os.listdir(self.directory) if pattern.fullmatch(entry))
+        for entry in saves[:-self.keep]:
+            os.remove(os.path.join(self.directory, entry))
+
+    def _work(self):
+        while True:
+            snapshot = self.snapshots.get()
+            # Fold in the snapshots queued meanwhile, only the latest state needs writing
+            while True:
+                try:
+                    newer = self.snapshots.get_nowait()
+                except queue.Empty:
+                    break
+                snapshot = newer if newer[0] else snapshot[:5] + ({**snapshot[5], **newer[5]},) + newer[6:]
+            full, width, height, chunk_cols, chunk_rows, copies, meta, name = snapshot
+            path = self.path(name)
+            try:
+                if full:
+                    self.chunks = [b""] * (chunk_cols * chunk_rows)
+                for (cx, cy), values in copies.items():
+                    self.chunks[cy * chunk_cols + cx] = encode_chunk(values)
+                os.makedirs(self.directory, exist_ok=True)
+                write_project(path, width, height, self.chunks, meta)
+                self.prune(name)
+            except Exception as error:
+                # Keep the thread alive for the next save, which starts over from a full snapshot
+                self.failed = True
+                self.results.put((path, error))
+            else:
+                self.results.put((path, None))
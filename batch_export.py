@@ -0,0 +1,114 @@
+"""Render CircuiPlanner projects to images from the command line, without a display.
+
+    python batch_export.py boards/*.cpl -o previews --scale 4 --jobs 8
+
+Directories are searched for *.cpl files. Projects are rendered in parallel
+worker processes and every finished file is reported as soon as it is done.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from components import Components
+from export import compose, write_png
+from project import ChunkLoader, ProjectFile
+
+
+PROJECT_SUFFIX = ".cpl"
+# Writers by format name, each called as writer(image, path, scale, compress_level)
+FORMATS = {"png": write_png}
+
+
+def find_projects(paths):
+    """Expand directories into the project files they contain, keeping the order given."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.endswith(PROJECT_SUFFIX)))
+        else:
+            found.append(path)
+    return found
+
+
+def output_path(path, out_dir, fmt):
+    name = os.path.splitext(os.path.basename(path))[0] + "." + fmt
+    return os.path.join(out_dir or os.path.dirname(path), name)
+
+
+def render_project(path, target, fmt="png", scale=1, compress_level=6, components=True):
+    """Load a whole project and write it as an image. Runs in a worker process.
+
+    Returns (path, target, seconds).
+    """
+    start = time.perf_counter()
+    project, board, meta = ProjectFile.open(path)
+    loader = ChunkLoader(project, board)
+    try:
+        loader.finish()
+    finally:
+        project.close()
+    if loader.errors:
+        raise loader.errors[0]
+    placed = Components.from_meta(meta.get("components", []), meta.get("footprints", [])) if components else ()
+    FORMATS[fmt](compose(board, placed), target, scale, compress_level)
+    return path, target, time.perf_counter() - start
+
+
+def render_all(paths, out_dir=None, fmt="png", scale=1, compress_level=6, components=True, jobs=None,
+               out=sys.stderr):
+    """Render every project across a process pool, printing one line per file as it finishes.
+
+    Returns the number of projects that failed.
+    """
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(render_project, path, output_path(path, out_dir, fmt), fmt, scale,
+                               compress_level, components): path for path in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                _, target, seconds = future.result()
+            except Exception as error:
+                # Whatever went wrong with one file, the rest of the batch goes on
+                failed += 1
+                print(f"[{done}/{len(futures)}] {path}: failed: {error}", file=out, flush=True)
+            else:
+                print(f"[{done}/{len(futures)}] {path} -> {target} ({seconds:.2f} s)", file=out, flush=True)
+    return failed
+
+
+def positive_int(text):
+    """Parse a command line count that has to be at least 1."""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render CircuiPlanner projects to images.")
+    parser.add_argument("paths", nargs="+", help="project files, or directories of them")
+    parser.add_argument("-o", "--out-dir", help="where to write the images (default: next to each project)")
+    parser.add_argument("-f", "--format", choices=sorted(FORMATS), default="png")
+    parser.add_argument("-s", "--scale", type=positive_int, default=1, help="pixels per cell (default: 1)")
+    parser.add_argument("-c", "--compression", type=int, default=6, choices=range(10), metavar="0-9",
+                        help="PNG compression level (default: 6)")
+    parser.add_argument("-j", "--jobs", type=positive_int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--no-components", action="store_true", help="leave placed components out")
+    args = parser.parse_args(argv)
+
+    paths = find_projects(args.paths)
+    if not paths:
+        parser.error("no project files found")
+    failed = render_all(paths, args.out_dir, args.format, args.scale, args.compression,
+                        not args.no_components, args.jobs)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,502 @@
+"""Benchmarks for CircuiPlanner's drawing hot paths, run without a display.
+
+    python benchmarks.py                     # run every case and print the timings
+    python benchmarks.py --json out.json     # also write them as JSON
+    python benchmarks.py --save-baseline     # store them as the baseline
+    python benchmarks.py --compare           # flag cases slower than the baseline
+    python benchmarks.py --legacy            # compare against the original per-pixel code
+
+The app runs on a recording canvas instead of tk.Canvas, so the timings
+cover the Python side of each operation plus the number of canvas calls
+it makes, which is what the real canvas would then have to process.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+from collections import Counter
+
+from PIL import Image, ImageColor
+
+import CircuiPlanner
+from export import write_png
+from render import checkerboard, tint_icon
+
+
+SIZES = [(180, 140), (640, 480), (2000, 1500)]  # Board sizes every board case runs on
+HUGE_SIZE = (20000, 20000)  # Sparse board the viewing cases also run on
+BASELINE = "benchmarks_baseline.json"
+THRESHOLD = 1.25  # Slowdown against the baseline that counts as a regression
+
+
+class FakePhoto:
+    """Stands in for ImageTk.PhotoImage, keeping the image but needing no Tk."""
+
+    count = 0
+
+    def __init__(self, image):
+        FakePhoto.count += 1
+        self.image = image
+        self.name = f"photo{FakePhoto.count}"
+
+    def __str__(self):
+        return self.name
+
+
+class RecordingCanvas:
+    """Stands in for tk.Canvas: keeps items like the real one does and counts every call."""
+
+    def __init__(self, width=1200, height=900):
+        self.calls = Counter()
+        self.items = {}  # id -> tags
+        self.next_item = 1
+        self.size = (width, height)
+        self.origin = [0, 0]  # Canvas position of the top left corner of the view
+        self.tk = self  # Tk commands such as photo copies go through canvas.tk.call
+
+    def _create(self, kind, tags):
+        self.calls[kind] += 1
+        item = self.next_item
+        self.next_item += 1
+        self.items[item] = tags
+        return item
+
+    def create_rectangle(self, *coords, tags=(), **options):
+        return self._create("create_rectangle", tags)
+
+    def create_image(self, *coords, tags=(), **options):
+        return self._create("create_image", tags)
+
+    def delete(self, tag):
+        self.calls["delete"] += 1
+        if tag == "all":
+            self.items.clear()
+        elif isinstance(tag, int):
+            self.items.pop(tag, None)
+        else:
+            for item in [item for item, tags in self.items.items() if tags == tag]:
+                del self.items[item]
+
+    def call(self, *args):
+        self.calls["tk.call"] += 1
+
+    def after(self, delay, function=None, *args):
+        self.calls["after"] += 1
+        return "after#"
+
+    def _count(name):
+        def method(self, *args, **options):
+            self.calls[name] += 1
+        return method
+
+    itemconfig = _count("itemconfig")
+    coords = _count("coords")
+    tag_raise = _count("tag_raise")
+    tag_lower = _count("tag_lower")
+    config = _count("config")
+    after_cancel = _count("after_cancel")
+    del _count
+
+    def xview_scroll(self, units, what):
+        self.calls["xview_scroll"] += 1
+        self.origin[0] += units
+
+    def yview_scroll(self, units, what):
+        self.calls["yview_scroll"] += 1
+        self.origin[1] += units
+
+    def canvasx(self, x):
+        return x + self.origin[0]
+
+    def canvasy(self, y):
+        return y + self.origin[1]
+
+    def winfo_width(self):
+        return self.size[0]
+
+    def winfo_height(self):
+        return self.size[1]
+
+
+class FakeRoot:
+    def title(self, text):
+        pass
+
+    def after(self, delay, function=None, *args):
+        return "after#"
+
+    def after_idle(self, function, *args):
+        return "after#"
+
+
+def make_app(cols, rows, pixel_size):
+    """Build the app's state on a recording canvas, without any widget."""
+    CircuiPlanner.COL_NUM, CircuiPlanner.ROW_NUM = cols, rows
+    CircuiPlanner.PIXEL_SIZE = pixel_size
+    app = CircuiPlanner.PixelArtApp.__new__(CircuiPlanner.PixelArtApp)
+    app.root = FakeRoot()
+    app.init_state(RecordingCanvas(), make_photo=FakePhoto)
+    return app
+
+
+def best_of(function, repeat=5, number=1):
+    """Return the fastest time of a call in seconds."""
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number
+
+
+def measure(app, function, repeat=5):
+    """Return (seconds, canvas calls per run) for a case."""
+    app.canvas.calls.clear()
+    seconds = best_of(function, repeat)
+    calls = sum(app.canvas.calls.values()) // repeat
+    return seconds, calls
+
+
+# Board cases, each a function of the app returning a function that runs the workload once
+
+def stroke_samples(app, count=200):
+    """Mouse positions of a diagonal zigzag drag across the board, in canvas pixels."""
+    size = CircuiPlanner.PIXEL_SIZE
+    cols, rows = app.board.width, app.board.height
+    return [((i * 7) % cols * size + size // 2, (i * 3 + (i % 5) * 4) % rows * size + size // 2)
+            for i in range(count)]
+
+
+def case_stroke(app, action):
+    samples = stroke_samples(app)
+
+    def run():
+        app.action = action
+        app.stroke_end = None
+        app.history.begin_group()
+        # A frame's worth of coalesced samples at a time, as the scheduler delivers them
+        for i in range(0, len(samples), 4):
+            app.draw_stroke(samples[i:i + 4])
+        app.history.end_group()
+    return run
+
+
+def case_pan(app):
+    """Drag the view around a little and back, within the area rendered around it."""
+    path = [(i % 50, i // 10) for i in range(250)]
+    path += path[::-1]
+
+    def run():
+        app.previous_pos = None
+        for pos in path:
+            app.move_background(pos)
+    return run
+
+
+def case_pan_across(app):
+    """Drag the view far to the right and down and back, rendering new areas on the way."""
+    path = [(-i * 40, -i * 30) for i in range(100)]
+    path += path[::-1]
+
+    def run():
+        app.previous_pos = None
+        for pos in path:
+            app.move_background(pos)
+    return run
+
+
+def case_line(app):
+    size = CircuiPlanner.PIXEL_SIZE
+    cols, rows = app.board.width, app.board.height
+
+    def run():
+        app.action = "Line"
+        app.line_start = (1, 1)
+        for i in range(100):
+            app.preview_line(((i * 13) % cols * size, (i * 7) % rows * size))
+        app.draw_line(((cols - 2) * size, (rows - 2) * size))
+    return run
+
+
+def case_fill(app):
+    size = CircuiPlanner.PIXEL_SIZE
+    colors = ["#102030", "#405060"]
+    # The top right corner, away from the line the line case leaves along the diagonal
+    pos = ((app.board.width - 1) * size, 0)
+
+    def run():
+        app.color = colors[0]
+        colors.reverse()
+        app.fill_area(pos)
+    return run
+
+
+def case_fill_fragmented(app, side=400):
+    """Fill a maze of one cell wide corridors, the worst case for a span fill: every span is one cell."""
+    cols, rows = min(side, app.board.width), min(side, app.board.height)
+    # Walls on every other column, open at the bottom and the top in turn, make one serpentine corridor
+    for x in range(1, cols, 2):
+        top = 0 if x % 4 == 1 else 1
+        app.board.fill_rect(x, top, x + 1, top + rows - 1, "#c0c0c0")
+    colors = ["#102030", "#405060"]
+
+    def run():
+        app.color = colors[0]
+        colors.reverse()
+        app.fill_area((0, 0))
+    return run
+
+
+def case_labels(app, count=300):
+    """A full-board annotation pass: part names and values spread over the whole board."""
+    cols, rows = app.board.width, app.board.height
+    font = CircuiPlanner.FONTS[CircuiPlanner.TEXT_FONT]
+    labels = [(f"R{i} {i % 97}K", (i * 37) % cols, (i * 11) % rows, ("#c03030", "#3030c0")[i % 2], font, 1)
+              for i in range(count)]
+    return lambda: app.stamp_labels(labels)
+
+
+def case_move_selection(app):
+    """Select a 100 x 100 block and drag it back and forth, one undo step per drop."""
+    size = CircuiPlanner.PIXEL_SIZE
+    side = min(100, app.board.width // 2, app.board.height)
+    offsets = [side, 0]
+
+    def run():
+        app.action = "Move"
+        app.set_selection((offsets[1], 0, offsets[1] + side, side))
+        app.select_start((offsets[1] * size, 0))
+        app.select_drag((offsets[0] * size, 0))
+        app.select_end()
+        offsets.reverse()
+    return run
+
+
+def case_save_image(app, folder):
+    app.export_path = os.path.join(folder, "bench.png")
+    app.exporter.export = lambda *args: None  # Only the part that runs on the Tk thread
+
+    def run():
+        app.save_image()
+    return run
+
+
+def case_write_png(app, folder):
+    image = app.board.to_image()
+    path = os.path.join(folder, "bench.png")
+    return lambda: write_png(image, path, 1, CircuiPlanner.EXPORT_COMPRESSION)
+
+
+def run_board_cases(cols, rows, folder, only=None):
+    results = {}
+    levels = CircuiPlanner.zoom_levels()
+    # Editing cases run at the smallest stepped zoom, the halved ones only show up in the zoom cases
+    edit_size = CircuiPlanner.MIN_PIXEL_SIZE
+    app = make_app(cols, rows, edit_size)
+    prefix = f"{cols}x{rows}"
+
+    def run(name, make_case, repeat=5, target=app):
+        if only and only not in f"{prefix}/{name}":
+            return
+        seconds, calls = measure(target, make_case(), repeat)
+        results[f"{prefix}/{name}"] = {"seconds": seconds, "canvas_calls": calls}
+
+    run("paint_pixel burst", lambda: case_stroke(app, "Point"))
+    run("erase_pixel burst", lambda: case_stroke(app, "Erase"))
+    run("move_background pan", lambda: case_pan(app))
+    run("move_background pan across", lambda: case_pan_across(app))
+    run("preview_line + draw_line", lambda: case_line(app))
+    run("bucket fill", lambda: case_fill(app))
+    # On a board of its own, so its walls stay out of the other cases
+    maze = make_app(cols, rows, edit_size)
+    run("bucket fill fragmented", lambda: case_fill_fragmented(maze), target=maze)
+    run("stamp 300 labels", lambda: case_labels(app))
+    run("move 100x100 selection", lambda: case_move_selection(app))
+    for pixel_size in levels:
+        def zoom():
+            CircuiPlanner.PIXEL_SIZE = pixel_size
+            return app.update_canvas
+        run(f"update_canvas zoom {pixel_size}", zoom, repeat=3)
+    CircuiPlanner.PIXEL_SIZE = edit_size
+    run("save_image", lambda: case_save_image(app, folder), repeat=3)
+    run("write_png", lambda: case_write_png(app, folder), repeat=3)
+    return results
+
+
+def run_view_cases(cols, rows, only=None):
+    """Open, zoom, pan and paint a board too large to ever be drawn whole, with wires across it."""
+    results = {}
+    prefix = f"{cols}x{rows}"
+    app = make_app(cols, rows, CircuiPlanner.PIXEL_SIZE)
+    for y in range(0, rows, 97):
+        app.board.fill_span(y, 0, cols, "#b87333")
+
+    def run(name, make_case, repeat=5):
+        if only and only not in f"{prefix}/{name}":
+            return
+        seconds, calls = measure(app, make_case(), repeat)
+        results[f"{prefix}/{name}"] = {"seconds": seconds, "canvas_calls": calls}
+
+    for pixel_size in CircuiPlanner.zoom_levels():
+        def zoom():
+            CircuiPlanner.PIXEL_SIZE = pixel_size
+            return app.update_canvas
+        run(f"update_canvas zoom {pixel_size}", zoom, repeat=3)
+    CircuiPlanner.PIXEL_SIZE = CircuiPlanner.MIN_PIXEL_SIZE
+    app.update_canvas()
+    run("move_background pan across", lambda: case_pan_across(app))
+    run("paint_pixel burst", lambda: case_stroke(app, "Point"))
+    return results
+
+
+# Run in a fresh interpreter, so that every import is part of the time
+STARTUP = """
+import time
+start = time.perf_counter()
+import CircuiPlanner, benchmarks
+from icons import IconAtlas
+icons = IconAtlas(CircuiPlanner.ICONS, make_photo=benchmarks.FakePhoto)
+for key in CircuiPlanner.ICONS:
+    icons.get(key)
+benchmarks.make_app(CircuiPlanner.COL_NUM, CircuiPlanner.ROW_NUM, CircuiPlanner.PIXEL_SIZE)
+print(time.perf_counter() - start)
+"""
+
+
+def startup_time(repeat=5):
+    """Return the seconds from importing the app to its first frame being drawn, best of a few runs.
+
+    Everything the window would show is built (toolbar icons, background and
+    board) but on the stand-ins, so the time of Tk itself is left out.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    return min(float(subprocess.run([sys.executable, "-c", STARTUP], cwd=here, check=True, capture_output=True,
+                                    text=True).stdout) for _ in range(repeat))
+
+
+def run_static_cases(only=None):
+    results = {}
+    cases = {
+        "make_background 180x140": lambda: checkerboard(180, 140),
+        "make_background 2000x1500": lambda: checkerboard(2000, 1500),
+        # Startup paints every toolbar icon once; the uncached function measures that cost
+        "paint_icon x12": lambda: [tint_icon.__wrapped__(path, "#646464") for path in sorted(glob.glob("Icons/*.png"))],
+    }
+    for name, function in cases.items():
+        if not only or only in name:
+            results[name] = {"seconds": best_of(function), "canvas_calls": 0}
+    if not only or only in "startup to first frame":
+        results["startup to first frame"] = {"seconds": startup_time(), "canvas_calls": 0}
+    return results
+
+
+def run_all(sizes=SIZES, only=None):
+    results = run_static_cases(only)
+    with tempfile.TemporaryDirectory() as folder:
+        for cols, rows in sizes:
+            results.update(run_board_cases(cols, rows, folder, only))
+    results.update(run_view_cases(*HUGE_SIZE, only))
+    return results
+
+
+def compare(results, baseline):
+    """Return (name, baseline seconds, seconds, ratio) for every case found in both, slowest ratio first."""
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base:
+            rows.append((name, base["seconds"], result["seconds"], result["seconds"] / base["seconds"]))
+    rows.sort(key=lambda row: -row[3])
+    return rows
+
+
+# The original per-pixel implementations, kept for comparison
+
+def legacy_make_background(width, height):
+    """The original per-pixel checkerboard loop, kept for comparison."""
+    image = Image.new("RGB", (width, height), (255, 255, 255))
+    for y in range(height):
+        for x in range(width):
+            color = (211, 211, 211) if (x + y) % 2 == 0 else (255, 255, 255)
+            image.putpixel((x, y), color)
+    return image
+
+
+def legacy_paint_icon(path, color):
+    """The original per-pixel icon tinting loop, kept for comparison."""
+    img = Image.open(path).convert("RGBA")
+    new_data = []
+    for pixel in img.getdata():
+        if pixel[:3] == (0, 0, 0):
+            new_data.append((*ImageColor.getrgb(color), pixel[3]))
+        else:
+            new_data.append(pixel)
+    img.putdata(new_data)
+    return img
+
+
+def bench_background(width=180, height=140):
+    old = best_of(lambda: legacy_make_background(width, height))
+    new = best_of(lambda: checkerboard(width, height))
+    return old, new
+
+
+def bench_icons(color="#646464"):
+    paths = sorted(glob.glob("Icons/*.png"))
+    old = best_of(lambda: [legacy_paint_icon(path, color) for path in paths])
+    new = best_of(lambda: [tint_icon.__wrapped__(path, color) for path in paths])
+    return old, new
+
+
+def print_legacy():
+    for name, bench in (("make_background 180x140", bench_background), ("paint_icon x12", bench_icons)):
+        old, new = bench()
+        print(f"{name:<26} legacy {old * 1000:8.2f} ms   now {new * 1000:8.2f} ms   {old / new:6.1f}x faster")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CircuiPlanner's drawing hot paths.")
+    parser.add_argument("--json", metavar="PATH", help="write the results to PATH")
+    parser.add_argument("--save-baseline", action="store_true", help=f"store the results in {BASELINE}")
+    parser.add_argument("--compare", action="store_true", help=f"compare against {BASELINE}, failing on regressions")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file to save to or compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help=f"slowdown ratio that counts as a regression (default: {THRESHOLD})")
+    parser.add_argument("--only", help="run only the cases whose name contains this text")
+    parser.add_argument("--legacy", action="store_true", help="compare against the original per-pixel code instead")
+    args = parser.parse_args(argv)
+
+    if args.legacy:
+        print_legacy()
+        return 0
+
+    results = run_all(only=args.only)
+    for name, result in results.items():
+        print(f"{name:<44} {result['seconds'] * 1000:10.2f} ms {result['canvas_calls']:8d} canvas calls")
+
+    report = {"python": platform.python_version(), "platform": platform.platform(), "results": results}
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"\nNo baseline at {args.baseline}, store one with --save-baseline first")
+            return 2
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = 0
+        print(f"\nAgainst {args.baseline}:")
+        for name, before, now, ratio in compare(results, baseline):
+            flag = "  REGRESSION" if ratio > args.threshold else ""
+            regressions += bool(flag)
+            print(f"{name:<44} {before * 1000:10.2f} -> {now * 1000:10.2f} ms {ratio:6.2f}x{flag}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,579 @@
+import sys
+from array import array
+
+from PIL import Image, ImageColor
+
+
+EMPTY = 0  # Palette index of a transparent (unpainted) cell
+CELL_TYPE = 'H'  # Array typecode of the cells: 16 bit palette indices
+CHUNK_SIZE = 64  # Cells per side of the square chunks that changes are tracked in
+
+
+class Palette:
+    """Interned table of the colors used on a board.
+
+    Cells store indices into it, index EMPTY being the transparent cell. For
+    every color it keeps the Tk color string, its RGBA bytes, how many cells
+    have it and a box around them, so "where is this color" questions do not
+    need a full board scan. Boxes only grow while painting, so they may be
+    loose after erasing; they are dropped when a color runs out.
+
+    Indices are never reused, so undo history keeps pointing at the right color.
+    """
+
+    MAX_COLORS = 1 << 16
+
+    def __init__(self, colors=()):
+        self.colors = [None]  # index -> "#rrggbb"
+        self.rgba = [bytes(4)]  # index -> RGBA bytes
+        self.counts = [0]
+        self.boxes = [None]  # index -> [x0, y0, x1, y1], exclusive at the far end
+        self.lookup = {None: EMPTY}
+        for color in colors:
+            self.intern(color)
+
+    def __len__(self):
+        return len(self.colors)
+
+    def intern(self, color):
+        """Return the index of a color, adding it to the palette if it is new."""
+        index = self.lookup.get(color)
+        if index is not None:
+            return index
+        key = color.lower()
+        index = self.lookup.get(key)
+        if index is None:
+            if len(self.colors) >= self.MAX_COLORS:
+                raise ValueError(f"A board cannot hold more than {self.MAX_COLORS - 1} colors")
+            index = len(self.colors)
+            self.colors.append(key)
+            self.rgba.append(bytes(ImageColor.getrgb(key)[:3]) + b"\xff")
+            self.counts.append(0)
+            self.boxes.append(None)
+            self.lookup[key] = index
+        self.lookup[color] = index
+        return index
+
+    def find(self, color):
+        """Return the index of a color, or None if it was never used."""
+        index = self.lookup.get(color)
+        if index is None and color is not None:
+            index = self.lookup.get(color.lower())
+        return index
+
+    def reset(self, empty):
+        """Forget every count and box, as when the board is cleared to empty cells."""
+        self.counts = [0] * len(self.colors)
+        self.counts[EMPTY] = empty
+        self.boxes = [None] * len(self.colors)
+
+    def used(self):
+        """Return (color, count) for every color on the board, most used first."""
+        used = [(self.colors[i], count) for i, count in enumerate(self.counts) if i != EMPTY and count]
+        used.sort(key=lambda entry: -entry[1])
+        return used
+
+
+    def grow(self, index, x0, y0, x1, y1):
+        """Widen the box of a color to cover a rectangle."""
+        box = self.boxes[index]
+        if box is None:
+            self.boxes[index] = [x0, y0, x1, y1]
+        else:
+            box[0], box[1] = min(box[0], x0), min(box[1], y0)
+            box[2], box[3] = max(box[2], x1), max(box[3], y1)
+
+    def replace(self, old, new, count):
+        """Account for count cells going from index old to index new."""
+        self.counts[old] -= count
+        self.counts[new] += count
+        if old != EMPTY and not self.counts[old]:
+            self.boxes[old] = None
+
+    def added(self, values, x0, y0, x1, y1):
+        """Account for an array of indices written over a rectangle."""
+        for value, count in _tally(values):
+            self.counts[value] += count
+            if value != EMPTY:
+                self.grow(value, x0, y0, x1, y1)
+
+    def removed(self, values):
+        """Account for an array of indices that was overwritten."""
+        for value, count in _tally(values):
+            self.counts[value] -= count
+            if value != EMPTY and not self.counts[value]:
+                self.boxes[value] = None
+
+
+def _tally(values):
+    """Yield (value, count) for every distinct value of an array, in one pass when they are all the same."""
+    if not values:
+        return
+    first = values[0]
+    count = values.count(first)
+    yield first, count
+    if count != len(values):
+        for value in set(values) - {first}:
+            yield value, values.count(value)
+
+
+class Board:
+    """Grid of cells stored as palette indices in a flat array.
+
+    Cells are addressed in cell space (column, row). Colors go in and out as
+    hex strings (#rrggbb) or None for an empty cell, like the rest of the app;
+    the bulk run, row, rect and chunk methods work on palette indices.
+
+    Every write stamps the CHUNK_SIZE x CHUNK_SIZE chunks it touches with a
+    new generation number, so savers can find what changed since they last ran.
+    """
+
+    def __init__(self, width, height, palette=None):
+        self.width = width
+        self.height = height
+        self.palette = palette or Palette()
+        self.palette.reset(width * height)
+        self.cells = array(CELL_TYPE, [EMPTY]) * (width * height)
+        self.chunk_cols = -(-width // CHUNK_SIZE)
+        self.chunk_rows = -(-height // CHUNK_SIZE)
+        self.generation = 0
+        self.chunk_generations = array('Q', [0]) * (self.chunk_cols * self.chunk_rows)
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def index(self, x, y):
+        return y * self.width + x
+
+
+    # Storage: the only methods that know how cells are laid out in memory
+
+    def _read(self, y, x0, x1):
+        start = y * self.width
+        return self.cells[start + x0:start + x1]
+
+    def _write(self, y, x0, values):
+        start = y * self.width + x0
+        self.cells[start:start + len(values)] = values
+
+    def _get(self, x, y):
+        return self.cells[y * self.width + x]
+
+    def _put(self, x, y, value):
+        self.cells[y * self.width + x] = value
+
+    def _written(self, chunks):
+        """Called with the (cx, cy) chunks that set_values wrote to."""
+
+
+    def value(self, x, y):
+        """Return the palette index of a cell."""
+        return self._get(x, y)
+
+    def get(self, x, y):
+        """Return the color of a cell, or None if it is empty."""
+        return self.palette.colors[self._get(x, y)]
+
+    def set(self, x, y, color):
+        """Set the color of a cell. Passing None erases it."""
+        self.set_values([(x, y)], self.palette.intern(color))
+
+    def set_many(self, cells, color):
+        """Set every (x, y) in cells to the same color."""
+        self.set_values(cells, self.palette.intern(color))
+
+    def set_values(self, cells, value):
+        """Set every (x, y) in cells to the same palette index."""
+        palette = self.palette
+        counts, boxes = palette.counts, palette.boxes
+        chunk_cols = self.chunk_cols
+        self.generation += 1
+        chunks = set()
+        for x, y in cells:
+            old = self._get(x, y)
+            if old == value:
+                continue
+            self._put(x, y, value)
+            counts[old] -= 1
+            counts[value] += 1
+            if old != EMPTY and not counts[old]:
+                boxes[old] = None
+            if value != EMPTY:
+                palette.grow(value, x, y, x + 1, y + 1)
+            chunk = (x // CHUNK_SIZE, y // CHUNK_SIZE)
+            if chunk not in chunks:
+                chunks.add(chunk)
+                self.chunk_generations[chunk[1] * chunk_cols + chunk[0]] = self.generation
+        self._written(chunks)
+
+    def clear(self):
+        self.cells = array(CELL_TYPE, [EMPTY]) * (self.width * self.height)
+        self.palette.reset(self.width * self.height)
+        self.touch(0, 0, self.width, self.height)
+
+
+    def touch(self, x0, y0, x1, y1):
+        """Stamp the chunks overlapping a rectangle of cells with a new generation."""
+        self.generation += 1
+        if x1 <= x0 or y1 <= y0:
+            return
+        first, last = x0 // CHUNK_SIZE, (x1 - 1) // CHUNK_SIZE + 1
+        stamp = array('Q', [self.generation]) * (last - first)
+        for cy in range(y0 // CHUNK_SIZE, (y1 - 1) // CHUNK_SIZE + 1):
+            row = cy * self.chunk_cols
+            self.chunk_generations[row + first:row + last] = stamp
+
+    def touch_spans(self, spans):
+        """Stamp the chunks overlapping some (y, x0, x1) spans with one new generation."""
+        self.generation += 1
+        generations, chunk_cols = self.chunk_generations, self.chunk_cols
+        for cy, first, last in {(y // CHUNK_SIZE, x0 // CHUNK_SIZE, (x1 - 1) // CHUNK_SIZE + 1)
+                                for y, x0, x1 in spans if x0 < x1}:
+            row = cy * chunk_cols
+            generations[row + first:row + last] = array('Q', [self.generation]) * (last - first)
+
+    def changed_chunks(self, since):
+        """Return the (cx, cy) of every chunk written after generation since."""
+        return [divmod(i, self.chunk_cols)[::-1] for i, generation in enumerate(self.chunk_generations)
+                if generation > since]
+
+    def chunk_rect(self, cx, cy):
+        """Return the (x0, y0, x1, y1) cells covered by a chunk, exclusive at the far end."""
+        x0, y0 = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+        return x0, y0, min(x0 + CHUNK_SIZE, self.width), min(y0 + CHUNK_SIZE, self.height)
+
+    def painted_chunks(self):
+        """Return the (cx, cy) of every chunk with a painted cell, row-major, without copying any cells."""
+        blank = memoryview(array(CELL_TYPE, [EMPTY]) * CHUNK_SIZE)
+        painted = []
+        with memoryview(self.cells) as cells:
+            for cy in range(self.chunk_rows):
+                for cx in range(self.chunk_cols):
+                    x0, y0, x1, y1 = self.chunk_rect(cx, cy)
+                    empty = blank[:x1 - x0]
+                    for start in range(y0 * self.width + x0, y1 * self.width, self.width):
+                        if cells[start:start + x1 - x0] != empty:
+                            painted.append((cx, cy))
+                            break
+        return painted
+
+    def get_chunk(self, cx, cy):
+        """Return the palette indices of a chunk as one array, row after row."""
+        chunk = array(CELL_TYPE)
+        for row in self.get_rect(*self.chunk_rect(cx, cy)):
+            chunk.extend(row)
+        return chunk
+
+    def set_chunk(self, cx, cy, values, touch=True):
+        """Write a chunk from an array as returned by get_chunk.
+
+        Loaders pass touch=False, so the chunk does not count as changed.
+        """
+        x0, y0, x1, y1 = self.chunk_rect(cx, cy)
+        width = x1 - x0
+        for y in range(y0, y1):
+            offset = (y - y0) * width
+            self.set_row(y, values[offset:offset + width], x0, touch)
+
+
+    def _rows(self, start, count):
+        """Split a run of flat indices into (y, x0, x1) pieces, one per row."""
+        while count > 0:
+            y, x0 = divmod(start, self.width)
+            x1 = min(self.width, x0 + count)
+            yield y, x0, x1
+            start += x1 - x0
+            count -= x1 - x0
+
+    def get_run(self, start, count):
+        """Return the palette indices of count cells from flat index start, row after row."""
+        run = array(CELL_TYPE)
+        for y, x0, x1 in self._rows(start, count):
+            run.extend(self._read(y, x0, x1))
+        return run
+
+    def set_run(self, start, values):
+        """Overwrite cells from flat index start with palette indices."""
+        offset = 0
+        for y, x0, x1 in self._rows(start, len(values)):
+            self.set_row(y, values[offset:offset + x1 - x0], x0)
+            offset += x1 - x0
+
+    def fill_run(self, start, count, value):
+        """Set count cells from flat index start to one palette index."""
+        for y, x0, x1 in self._rows(start, count):
+            self.set_row(y, array(CELL_TYPE, [value]) * (x1 - x0), x0)
+
+
+    def get_row(self, y, x0=0, x1=None):
+        """Return the palette indices of row y between columns x0 and x1 as an array."""
+        if x1 is None:
+            x1 = self.width
+        return self._read(y, x0, x1)
+
+    def set_row(self, y, values, x0=0, touch=True):
+        """Overwrite part of row y with palette indices, starting at column x0."""
+        x1 = x0 + len(values)
+        old = self._read(y, x0, x1)
+        if old == values:
+            return
+        self.palette.removed(old)
+        self._write(y, x0, values)
+        self.palette.added(values, x0, y, x1, y + 1)
+        if touch:
+            self.touch(x0, y, x1, y + 1)
+
+    def fill_span(self, y, x0, x1, color):
+        """Set columns x0 to x1 (exclusive) of row y to one color."""
+        self.set_row(y, array(CELL_TYPE, [self.palette.intern(color)]) * (x1 - x0), x0)
+
+    def get_rect(self, x0, y0, x1, y1):
+        """Return the palette indices of a rectangle as a list of row arrays."""
+        return [self.get_row(y, x0, x1) for y in range(y0, y1)]
+
+    def set_rect(self, x0, y0, rows):
+        """Write a list of row arrays (as returned by get_rect) back at (x0, y0)."""
+        for offset, values in enumerate(rows):
+            self.set_row(y0 + offset, values, x0)
+
+    def fill_rect(self, x0, y0, x1, y1, color):
+        """Set every cell of a rectangle to one color."""
+        row = array(CELL_TYPE, [self.palette.intern(color)]) * (x1 - x0)
+        for y in range(y0, y1):
+            self.set_row(y, row, x0)
+
+
+    def color_box(self, color):
+        """Return the (x0, y0, x1, y1) box around every cell of a color, or None if none has it."""
+        index = self.palette.find(color)
+        if not index or not self.palette.counts[index]:
+            return None
+        return tuple(self.palette.boxes[index])
+
+    def color_spans(self, color):
+        """Return every run of cells of a color as (y, x0, x1) spans, scanning only inside its box."""
+        box = self.color_box(color)
+        if box is None:
+            return []
+        index = self.palette.find(color)
+        x0, y0, x1, y1 = box
+        spans = []
+        for y in range(y0, y1):
+            row = self._read(y, x0, x1)
+            if index not in row:
+                continue
+            x, end = row.index(index), len(row)
+            while x < end:
+                if row[x] != index:
+                    x += 1
+                    continue
+                start = x
+                while x < end and row[x] == index:
+                    x += 1
+                spans.append((y, x0 + start, x0 + x))
+        return spans
+
+    def painted_in(self, x0, y0, x1, y1):
+        """Tell whether a rectangle of cells may hold a painted cell.
+
+        Only the color boxes are looked at, so the answer can be yes for an
+        empty rectangle, but never no for a painted one.
+        """
+        if x0 >= x1 or y0 >= y1:
+            return False
+        return any(box is not None and box[0] < x1 and box[1] < y1 and box[2] > x0 and box[3] > y0
+                   for box in self.palette.boxes)
+
+    def painted(self):
+        """Yield (x, y, color) for every non-empty cell."""
+        width = self.width
+        colors = self.palette.colors
+        for y in range(self.height):
+            row = self._read(y, 0, width)
+            if row.count(EMPTY) == width:
+                continue
+            for x, value in enumerate(row):
+                if value != EMPTY:
+                    yield x, y, colors[value]
+
+    def to_image(self, x0=0, y0=0, x1=None, y1=None):
+        """Return the board (or a rectangle of it) as an RGBA image with one pixel per cell."""
+        if x1 is None:
+            x1 = self.width
+        if y1 is None:
+            y1 = self.height
+        if (x0, y0, x1, y1) == (0, 0, self.width, self.height):
+            cells = self.cells
+        else:
+            cells = array(CELL_TYPE)
+            for row in self.get_rect(x0, y0, x1, y1):
+                cells.extend(row)
+        return self.indices_to_image(cells, x1 - x0, y1 - y0)
+
+    def indices_to_image(self, cells, width, height):
+        """Turn an array of palette indices into an RGBA image through the palette."""
+        rgba = self.palette.rgba
+        if len(rgba) <= 256:
+            # Every index fits in its low byte, so the cells are a paletted image already
+            data = cells.tobytes()[(0 if sys.byteorder == 'little' else 1)::2]
+            image = Image.frombuffer("P", (width, height), data, "raw", "P", 0, 1)
+            image.putpalette(b"".join(rgba), "RGBA")
+            return image.convert("RGBA")
+        return Image.frombuffer("RGBA", (width, height), b"".join(map(rgba.__getitem__, cells)), "raw", "RGBA", 0, 1)
+
+
+class SparseBoard(Board):
+    """Board made of CHUNK_SIZE x CHUNK_SIZE tiles, allocated on first write and freed once empty.
+
+    It has the same interface as Board, but memory grows with the painted
+    area instead of the board size, so very large mostly empty layouts fit.
+    Tiles line up with the chunks changes are tracked in.
+    """
+
+    def __init__(self, width, height, palette=None):
+        self.width = width
+        self.height = height
+        self.palette = palette or Palette()
+        self.palette.reset(width * height)
+        self.tiles = {}  # (tx, ty) -> array of CHUNK_SIZE * CHUNK_SIZE palette indices
+        self.chunk_cols = -(-width // CHUNK_SIZE)
+        self.chunk_rows = -(-height // CHUNK_SIZE)
+        self.generation = 0
+        self.chunk_generations = array('Q', [0]) * (self.chunk_cols * self.chunk_rows)
+
+    def _tile(self, tx, ty):
+        """Return a tile, allocating it if needed."""
+        tile = self.tiles.get((tx, ty))
+        if tile is None:
+            tile = self.tiles[(tx, ty)] = array(CELL_TYPE, [EMPTY]) * (CHUNK_SIZE * CHUNK_SIZE)
+        return tile
+
+    def _release(self, tx, ty):
+        """Free a tile if nothing is painted on it anymore."""
+        tile = self.tiles.get((tx, ty))
+        if tile is not None and tile.count(EMPTY) == len(tile):
+            del self.tiles[(tx, ty)]
+
+
+    def _read(self, y, x0, x1):
+        ty, offset = divmod(y, CHUNK_SIZE)
+        offset *= CHUNK_SIZE
+        row = array(CELL_TYPE)
+        x = x0
+        while x < x1:
+            tx, local = divmod(x, CHUNK_SIZE)
+            count = min(CHUNK_SIZE - local, x1 - x)
+            tile = self.tiles.get((tx, ty))
+            if tile is None:
+                row.extend(array(CELL_TYPE, [EMPTY]) * count)
+            else:
+                row.extend(tile[offset + local:offset + local + count])
+            x += count
+        return row
+
+    def _write(self, y, x0, values):
+        ty, offset = divmod(y, CHUNK_SIZE)
+        offset *= CHUNK_SIZE
+        x, end = x0, x0 + len(values)
+        while x < end:
+            tx, local = divmod(x, CHUNK_SIZE)
+            count = min(CHUNK_SIZE - local, end - x)
+            part = values[x - x0:x - x0 + count]
+            tile = self.tiles.get((tx, ty))
+            if tile is None and part.count(EMPTY) == count:
+                x += count
+                continue  # Writing nothing into an empty tile
+            tile = self._tile(tx, ty)
+            tile[offset + local:offset + local + count] = part
+            self._release(tx, ty)
+            x += count
+
+    def _get(self, x, y):
+        tile = self.tiles.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if tile is None:
+            return EMPTY
+        return tile[(y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE]
+
+    def _put(self, x, y, value):
+        self._tile(x // CHUNK_SIZE, y // CHUNK_SIZE)[(y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE] = value
+
+    def _written(self, chunks):
+        for tx, ty in chunks:
+            self._release(tx, ty)
+
+    def clear(self):
+        self.tiles = {}
+        self.palette.reset(self.width * self.height)
+        self.touch(0, 0, self.width, self.height)
+
+
+    def painted_chunks(self):
+        return sorted(self.tiles, key=lambda key: (key[1], key[0]))
+
+    def get_chunk(self, cx, cy):
+        x0, y0, x1, y1 = self.chunk_rect(cx, cy)
+        tile = self.tiles.get((cx, cy))
+        if tile is None:
+            return array(CELL_TYPE, [EMPTY]) * ((x1 - x0) * (y1 - y0))
+        if x1 - x0 == CHUNK_SIZE:
+            return tile[:(y1 - y0) * CHUNK_SIZE]
+        chunk = array(CELL_TYPE)
+        for row in range(y1 - y0):
+            chunk.extend(tile[row * CHUNK_SIZE:row * CHUNK_SIZE + x1 - x0])
+        return chunk
+
+
+    def _tiles_in(self, x0, y0, x1, y1):
+        """Yield ((tx, ty), tile) for every allocated tile overlapping a rectangle of cells."""
+        if x0 >= x1 or y0 >= y1:
+            return
+        tx0, ty0 = x0 // CHUNK_SIZE, y0 // CHUNK_SIZE
+        tx1, ty1 = (x1 - 1) // CHUNK_SIZE + 1, (y1 - 1) // CHUNK_SIZE + 1
+        tiles = self.tiles
+        if (tx1 - tx0) * (ty1 - ty0) < len(tiles):
+            # Fewer keys to look up than tiles to go through
+            for ty in range(ty0, ty1):
+                for tx in range(tx0, tx1):
+                    tile = tiles.get((tx, ty))
+                    if tile is not None:
+                        yield (tx, ty), tile
+        else:
+            for (tx, ty), tile in tiles.items():
+                if tx0 <= tx < tx1 and ty0 <= ty < ty1:
+                    yield (tx, ty), tile
+
+    def painted_in(self, x0, y0, x1, y1):
+        for _ in self._tiles_in(x0, y0, x1, y1):
+            return True
+        return False
+
+    def painted(self):
+        colors = self.palette.colors
+        for tx, ty in sorted(self.tiles, key=lambda key: (key[1], key[0])):
+            tile = self.tiles[(tx, ty)]
+            for i, value in enumerate(tile):
+                if value != EMPTY:
+                    y, x = divmod(i, CHUNK_SIZE)
+                    yield tx * CHUNK_SIZE + x, ty * CHUNK_SIZE + y, colors[value]
+
+    def to_image(self, x0=0, y0=0, x1=None, y1=None):
+        if x1 is None:
+            x1 = self.width
+        if y1 is None:
+            y1 = self.height
+        # Only the allocated tiles are drawn, on top of a transparent image
+        image = Image.new("RGBA", (x1 - x0, y1 - y0), (0, 0, 0, 0))
+        for (tx, ty), tile in self._tiles_in(x0, y0, x1, y1):
+            left, top = tx * CHUNK_SIZE, ty * CHUNK_SIZE
+            image.paste(self.indices_to_image(tile, CHUNK_SIZE, CHUNK_SIZE), (left - x0, top - y0))
+        return image
+
+
+SPARSE_THRESHOLD = 4_000_000  # Boards with more cells than this are stored sparsely
+
+
+def make_board(width, height, palette=None):
+    """Return a dense Board, or a SparseBoard for very large sizes."""
+    if width * height > SPARSE_THRESHOLD:
+        return SparseBoard(width, height, palette)
+    return Board(width, height, palette)
@@ -0,0 +1,255 @@
+from functools import lru_cache
+
+from PIL import Image, ImageColor
+
+
+ROTATIONS = (0, 90, 180, 270)  # Clockwise, in degrees
+GRID_SIZE = 16  # Cells per side of the buckets of the spatial index
+
+
+class Footprint:
+    """A reusable component drawing: cells of color plus named pins.
+
+    Footprints are drawn as rows of characters, "." being an empty cell and
+    every other character a key into legend. Cells marked with pin_key are
+    the pins, numbered from 1 in reading order.
+    """
+
+    def __init__(self, name, rows, legend, pin_key="P"):
+        self.name = name
+        self.rows = list(rows)
+        self.legend = dict(legend)
+        self.pin_key = pin_key
+        self.width = max(len(row) for row in self.rows)
+        self.height = len(self.rows)
+        self.cells = {(x, y): legend[key] for y, row in enumerate(self.rows) for x, key in enumerate(row)
+                      if key != "."}
+        self.pins = [(x, y) for y, row in enumerate(self.rows) for x, key in enumerate(row) if key == pin_key]
+        self.shapes = {}  # (rotation, mirror) -> frozenset of cells
+
+    def size(self, rotation):
+        return (self.height, self.width) if rotation in (90, 270) else (self.width, self.height)
+
+    def transform(self, x, y, rotation, mirror):
+        """Map a cell of the footprint to its place once mirrored (left to right first) and rotated."""
+        width, height = self.width, self.height
+        if mirror:
+            x = width - 1 - x
+        if rotation == 90:
+            return height - 1 - y, x
+        if rotation == 180:
+            return width - 1 - x, height - 1 - y
+        if rotation == 270:
+            return y, width - 1 - x
+        return x, y
+
+    def shape(self, rotation, mirror):
+        """Return the cells covered in an orientation, computed once per orientation."""
+        key = (rotation, mirror)
+        shape = self.shapes.get(key)
+        if shape is None:
+            shape = self.shapes[key] = frozenset(self.transform(x, y, rotation, mirror) for x, y in self.cells)
+        return shape
+
+    def image(self):
+        """Return the footprint as an RGBA image with one pixel per cell."""
+        image = Image.new("RGBA", (self.width, self.height), (0, 0, 0, 0))
+        for cell, color in self.cells.items():
+            image.putpixel(cell, ImageColor.getrgb(color)[:3] + (255,))
+        return image
+
+    def to_dict(self):
+        return {"name": self.name, "rows": self.rows, "legend": self.legend, "pin_key": self.pin_key}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["rows"], data["legend"], data.get("pin_key", "P"))
+
+
+PIN = "#b4b4b4"
+LIBRARY = {footprint.name: footprint for footprint in (
+    Footprint("Resistor", ["P#=#P"], {"P": PIN, "#": "#c8a165", "=": "#8b4513"}),
+    Footprint("Capacitor", ["P.P", "###"], {"P": PIN, "#": "#3060c0"}),
+    Footprint("LED", [".#.", "###", "P.P"], {"P": PIN, "#": "#e03030"}),
+    Footprint("Transistor", [".#.", "###", "PPP"], {"P": PIN, "#": "#303030"}),
+    Footprint("DIP-8", ["P.P.P.P", "#######", "#######", "P.P.P.P"], {"P": PIN, "#": "#202020"}),
+    Footprint("Header", ["PPPP"], {"P": PIN}),
+)}
+
+
+@lru_cache(maxsize=256)
+def footprint_image(footprint, rotation, mirror, pixel_size):
+    """Return a footprint rasterized in one orientation at one zoom.
+
+    The result is cached and shared, so callers must not modify it.
+    """
+    image = footprint.image()
+    if mirror:
+        image = image.transpose(Image.FLIP_LEFT_RIGHT)
+    if rotation:
+        # PIL rotates counterclockwise, placements clockwise
+        image = image.transpose({90: Image.ROTATE_270, 180: Image.ROTATE_180, 270: Image.ROTATE_90}[rotation])
+    return image.resize((max(round(image.width * pixel_size), 1), max(round(image.height * pixel_size), 1)),
+                        Image.NEAREST)
+
+
+class Placement:
+    """One footprint placed on the board, with its top left cell at (x, y)."""
+
+    def __init__(self, id, footprint, x, y, rotation=0, mirror=False):
+        self.id = id
+        self.footprint = footprint
+        self.x = x
+        self.y = y
+        self.rotation = rotation
+        self.mirror = mirror
+
+    @property
+    def bbox(self):
+        """The (x0, y0, x1, y1) cells the placement can cover, exclusive at the far end."""
+        width, height = self.footprint.size(self.rotation)
+        return self.x, self.y, self.x + width, self.y + height
+
+    def cells(self):
+        """Return the board cells the placement covers."""
+        return {(self.x + x, self.y + y) for x, y in self.footprint.shape(self.rotation, self.mirror)}
+
+    def covers(self, x, y):
+        return (x - self.x, y - self.y) in self.footprint.shape(self.rotation, self.mirror)
+
+    def pins(self):
+        """Return the board cells of the pins, in pin number order."""
+        footprint = self.footprint
+        return [(self.x + px, self.y + py) for px, py in
+                (footprint.transform(x, y, self.rotation, self.mirror) for x, y in footprint.pins)]
+
+    def to_dict(self):
+        return {"footprint": self.footprint.name, "x": self.x, "y": self.y,
+                "rotation": self.rotation, "mirror": self.mirror}
+
+
+class SpatialGrid:
+    """Uniform grid index of boxes, so point and box queries only look at nearby entries.
+
+    Each entry is listed in every size x size bucket its box overlaps.
+    """
+
+    def __init__(self, size=GRID_SIZE):
+        self.size = size
+        self.buckets = {}  # (gx, gy) -> set of keys
+        self.boxes = {}    # key -> (x0, y0, x1, y1)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _buckets(self, x0, y0, x1, y1):
+        size = self.size
+        for gy in range(y0 // size, (y1 - 1) // size + 1):
+            for gx in range(x0 // size, (x1 - 1) // size + 1):
+                yield gx, gy
+
+    def insert(self, key, box):
+        self.boxes[key] = box
+        for bucket in self._buckets(*box):
+            self.buckets.setdefault(bucket, set()).add(key)
+
+    def remove(self, key):
+        for bucket in self._buckets(*self.boxes.pop(key)):
+            keys = self.buckets[bucket]
+            keys.discard(key)
+            if not keys:
+                del self.buckets[bucket]
+
+    def move(self, key, box):
+        self.remove(key)
+        self.insert(key, box)
+
+    def at(self, x, y):
+        """Return the keys whose box contains a cell."""
+        keys = self.buckets.get((x // self.size, y // self.size), ())
+        return [key for key in keys if _contains(self.boxes[key], x, y)]
+
+    def overlapping(self, box):
+        """Return the keys whose box overlaps a box."""
+        found = set()
+        for bucket in self._buckets(*box):
+            found.update(self.buckets.get(bucket, ()))
+        return [key for key in found if _overlaps(self.boxes[key], box)]
+
+
+def _contains(box, x, y):
+    return box[0] <= x < box[2] and box[1] <= y < box[3]
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class Components:
+    """The components placed on a board, indexed by where they are."""
+
+    def __init__(self, library=LIBRARY):
+        self.library = dict(library)
+        self.placements = {}  # id -> Placement
+        self.grid = SpatialGrid()
+        self.next_id = 1
+
+    def __len__(self):
+        return len(self.placements)
+
+    def __iter__(self):
+        return iter(self.placements.values())
+
+    def add(self, footprint, x, y, rotation=0, mirror=False):
+        placement = Placement(self.next_id, footprint, x, y, rotation, mirror)
+        self.next_id += 1
+        self.placements[placement.id] = placement
+        self.grid.insert(placement.id, placement.bbox)
+        return placement
+
+    def remove(self, placement):
+        del self.placements[placement.id]
+        self.grid.remove(placement.id)
+
+    def move(self, placement, x, y, rotation=None, mirror=None):
+        """Move, rotate or mirror a placement and update the index."""
+        placement.x, placement.y = x, y
+        if rotation is not None:
+            placement.rotation = rotation
+        if mirror is not None:
+            placement.mirror = mirror
+        self.grid.move(placement.id, placement.bbox)
+
+    def at(self, x, y):
+        """Return the placement covering a cell, or None."""
+        for key in self.grid.at(x, y):
+            placement = self.placements[key]
+            if placement.covers(x, y):
+                return placement
+        return None
+
+    def collisions(self, footprint, x, y, rotation=0, mirror=False, ignore=None):
+        """Return the placements that would share a cell with a footprint placed this way."""
+        candidate = Placement(None, footprint, x, y, rotation, mirror)
+        cells = candidate.cells()
+        return [self.placements[key] for key in self.grid.overlapping(candidate.bbox)
+                if key != ignore and not cells.isdisjoint(self.placements[key].cells())]
+
+
+    def to_meta(self):
+        """Return the placements, and the footprints not built in, for a project's metadata."""
+        custom = {placement.footprint.name for placement in self} - LIBRARY.keys()
+        return ([placement.to_dict() for placement in self],
+                [self.library[name].to_dict() for name in sorted(custom)])
+
+    @classmethod
+    def from_meta(cls, placements, footprints=()):
+        components = cls()
+        for data in footprints:
+            footprint = Footprint.from_dict(data)
+            components.library[footprint.name] = footprint
+        for data in placements:
+            footprint = components.library.get(data["footprint"])
+            if footprint is not None:
+                components.add(footprint, data["x"], data["y"], data.get("rotation", 0), data.get("mirror", False))
+        return components
@@ -0,0 +1,76 @@
+import queue
+import threading
+
+from PIL import Image
+
+from components import footprint_image
+
+
+def compose(board, components=()):
+    """Return the board as an RGBA image with one pixel per cell, with the placed components on top."""
+    image = board.to_image()
+    for placement in components:
+        part = footprint_image(placement.footprint, placement.rotation, placement.mirror, 1)
+        image.alpha_composite(part, (placement.x, placement.y))
+    return image
+
+
+def scale_image(image, scale):
+    """Scale an image up by a whole factor, keeping cells sharp."""
+    if scale == 1:
+        return image
+    return image.resize((image.width * scale, image.height * scale), Image.NEAREST)
+
+
+def write_png(image, path, scale=1, compress_level=6):
+    """Scale and encode an image as PNG at path."""
+    scale_image(image, scale).save(path, "PNG", compress_level=compress_level)
+
+
+class PngExporter:
+    """Encode and write PNG files on worker threads, reporting back on the Tk thread.
+
+    Tk must only be used from its own thread, so workers put their result in
+    a queue that is polled with after().
+    """
+
+    POLL_MS = 50
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.results = queue.Queue()
+        self.running = 0
+
+    def export(self, image, path, scale=1, compress_level=6, on_done=None):
+        """Start writing image (already detached from the board) to path.
+
+        on_done(path, error) is called on the Tk thread once the file is
+        written, with error None on success.
+        """
+        worker = threading.Thread(target=self._work, args=(image, path, scale, compress_level, on_done),
+                                  daemon=True)
+        self.running += 1
+        worker.start()
+        if self.running == 1:
+            self.widget.after(self.POLL_MS, self._poll)
+
+    def _work(self, image, path, scale, compress_level, on_done):
+        try:
+            write_png(image, path, scale, compress_level)
+        except Exception as error:
+            # Whatever went wrong, the Tk thread has to hear back or it keeps polling for this file
+            self.results.put((on_done, path, error))
+        else:
+            self.results.put((on_done, path, None))
+
+    def _poll(self):
+        while True:
+            try:
+                on_done, path, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.running -= 1
+            if on_done is not None:
+                on_done(path, error)
+        if self.running:
+            self.widget.after(self.POLL_MS, self._poll)
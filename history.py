@@ -0,0 +1,158 @@
+from array import array
+from collections import deque
+
+
+def _compact(values):
+    """Store a run of values as a single int if they are all the same."""
+    first = values[0]
+    if values.count(first) == len(values):
+        return first
+    return values
+
+
+class Delta:
+    """Cells changed by one edit, as runs of consecutive cell indices with their old and new values.
+
+    Each run is (start, count, old, new), where old and new are either one
+    palette index for the whole run (run-length encoded) or an array of them.
+    """
+
+    RUN_OVERHEAD = 64  # Rough bytes per run for the tuple and its ints
+
+    def __init__(self, runs=None):
+        self.runs = runs or []
+
+    @classmethod
+    def from_cells(cls, board, cells, color):
+        """Build the delta for setting some (x, y) cells to color, reading their current values."""
+        width = board.width
+        new = board.palette.intern(color)
+        runs = []
+        indices = sorted({y * width + x for x, y in cells})
+        i = 0
+        while i < len(indices):
+            # Group consecutive indices into one run
+            j = i + 1
+            while j < len(indices) and indices[j] == indices[j - 1] + 1:
+                j += 1
+            start, count = indices[i], j - i
+            runs.append((start, count, _compact(board.get_run(start, count)), new))
+            i = j
+        return cls(runs)
+
+    @classmethod
+    def from_spans(cls, board, spans, old, color):
+        """Build the delta of (y, x0, x1) spans that went from one old palette index to color."""
+        width = board.width
+        new = board.palette.intern(color)
+        return cls([(y * width + x0, x1 - x0, old, new) for y, x0, x1 in spans])
+
+    @classmethod
+    def from_rows(cls, board, x0, y0, rows):
+        """Build the delta of writing rows of palette indices (as from get_rect) at (x0, y0), one run per row."""
+        width = board.width
+        return cls([((y0 + i) * width + x0, len(values), _compact(board.get_row(y0 + i, x0, x0 + len(values))),
+                     _compact(values)) for i, values in enumerate(rows) if values])
+
+    def __bool__(self):
+        return bool(self.runs)
+
+    @property
+    def nbytes(self):
+        size = 0
+        for _, _, old, new in self.runs:
+            size += self.RUN_OVERHEAD
+            for values in (old, new):
+                if isinstance(values, array):
+                    size += values.itemsize * len(values)
+        return size
+
+    def apply(self, board, undo=False):
+        """Write the new values (or the old ones when undoing) back to the board, one slice per run."""
+        for start, count, old, new in self.runs:
+            values = old if undo else new
+            if isinstance(values, array):
+                board.set_run(start, values)
+            else:
+                board.fill_run(start, count, values)
+
+    def bbox(self, width):
+        """Return the (x0, y0, x1, y1) box around every changed cell, exclusive at the far end."""
+        x0 = y0 = float("inf")
+        x1 = y1 = 0
+        for start, count, _, _ in self.runs:
+            first_y, first_x = divmod(start, width)
+            last_y, last_x = divmod(start + count - 1, width)
+            if first_y != last_y:
+                first_x, last_x = 0, width - 1  # The run wraps over whole rows
+            x0, y0 = min(x0, first_x), min(y0, first_y)
+            x1, y1 = max(x1, last_x + 1), max(y1, last_y + 1)
+        return x0, y0, x1, y1
+
+
+class History:
+    """Undo/redo journal of deltas, capped in memory by dropping the oldest entries.
+
+    Every entry is a list of deltas undone and redone together, so a whole
+    drag can be grouped into one step with begin_group and end_group.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.nbytes = 0
+        self.group = None
+
+    def begin_group(self):
+        self.group = []
+
+    def end_group(self):
+        group, self.group = self.group, None
+        if group:
+            self.push(group)
+
+    def record(self, delta):
+        """Add an edit that was just applied to the board."""
+        if not delta:
+            return
+        if self.group is not None:
+            self.group.append(delta)
+        else:
+            self.push([delta])
+
+    def push(self, entry):
+        self.undo_stack.append(entry)
+        self.nbytes += sum(delta.nbytes for delta in entry)
+        # A new edit makes the undone ones unreachable
+        self.nbytes -= sum(delta.nbytes for undone in self.redo_stack for delta in undone)
+        self.redo_stack.clear()
+        while self.nbytes > self.max_bytes and len(self.undo_stack) > 1:
+            self.nbytes -= sum(delta.nbytes for delta in self.undo_stack.popleft())
+
+    def undo(self, board):
+        """Undo the latest entry and return the box of cells to redraw, or None if there is nothing to undo."""
+        self.end_group()
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        for delta in reversed(entry):
+            delta.apply(board, undo=True)
+        self.redo_stack.append(entry)
+        return self._bbox(entry, board.width)
+
+    def redo(self, board):
+        """Redo the latest undone entry and return the box of cells to redraw, or None if there is nothing to redo."""
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        for delta in entry:
+            delta.apply(board)
+        self.undo_stack.append(entry)
+        return self._bbox(entry, board.width)
+
+    @staticmethod
+    def _bbox(entry, width):
+        boxes = [delta.bbox(width) for delta in entry]
+        return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+                max(box[2] for box in boxes), max(box[3] for box in boxes))
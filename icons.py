@@ -0,0 +1,86 @@
+import json
+import os
+
+from PIL import Image, ImageTk
+from PIL.PngImagePlugin import PngInfo
+
+from render import tint_icon
+
+
+ICON_DIR = "Icons"
+ATLAS_PATH = os.path.join(ICON_DIR, "atlas.png")  # Rebuilt from the icons whenever one of them is newer
+SELECTED_COLOR = "#646464"  # Tint of the button of the active tool
+
+
+def build_atlas(files, directory=ICON_DIR, selected=SELECTED_COLOR):
+    """Return one image with the icons side by side, normal on the top row and tinted with selected below."""
+    icons = [Image.open(os.path.join(directory, f"{name}.png")).convert("RGBA") for name in files]
+    width = max(icon.width for icon in icons)
+    height = max(icon.height for icon in icons)
+    atlas = Image.new("RGBA", (width * len(icons), height * 2), (0, 0, 0, 0))
+    for i, (name, icon) in enumerate(zip(files, icons)):
+        atlas.paste(icon, (i * width, 0))
+        atlas.paste(tint_icon(os.path.join(directory, f"{name}.png"), selected), (i * width, height))
+    return atlas
+
+
+class IconAtlas:
+    """The toolbar icons, read from one prebuilt image instead of decoding and tinting every file.
+
+    icons maps each icon's key to its file name in directory, without the
+    extension. The atlas remembers which files it holds and in what tint,
+    and is rebuilt (and saved again if possible) when that changed or an
+    icon file is newer. Photos are only made the first time a button asks
+    for them, and tints other than the selected one on first use too.
+    """
+
+    def __init__(self, icons, directory=ICON_DIR, path=ATLAS_PATH, make_photo=ImageTk.PhotoImage):
+        self.icons = dict(icons)
+        self.directory = directory
+        self.path = path
+        self.make_photo = make_photo
+        self.files = sorted(set(self.icons.values()))
+        self.atlas = self.load()
+        self.width = self.atlas.width // len(self.files)
+        self.height = self.atlas.height // 2
+        self.photos = {}  # (key, selected or color) -> photo
+
+    def source(self, name):
+        return os.path.join(self.directory, f"{name}.png")
+
+    def load(self):
+        info = json.dumps({"files": self.files, "selected": SELECTED_COLOR})
+        try:
+            newest = max(os.path.getmtime(self.source(name)) for name in self.files)
+            if os.path.getmtime(self.path) >= newest:
+                with Image.open(self.path) as atlas:
+                    if atlas.text.get("icons") == info:
+                        atlas.load()
+                        return atlas
+        except OSError:
+            pass
+        atlas = build_atlas(self.files, self.directory)
+        meta = PngInfo()
+        meta.add_text("icons", info)
+        try:
+            atlas.save(self.path, pnginfo=meta)
+        except OSError:
+            pass  # A read-only install rebuilds it on every start instead
+        return atlas
+
+    def get(self, key, selected=False):
+        """Return the photo of an icon, in the selected tint or as drawn."""
+        photo = self.photos.get((key, selected))
+        if photo is None:
+            x = self.files.index(self.icons[key]) * self.width
+            y = self.height if selected else 0
+            photo = self.photos[(key, selected)] = self.make_photo(
+                self.atlas.crop((x, y, x + self.width, y + self.height)))
+        return photo
+
+    def tinted(self, key, color):
+        """Return the photo of an icon with its black pixels in any color, made on first use."""
+        photo = self.photos.get((key, color))
+        if photo is None:
+            photo = self.photos[(key, color)] = self.make_photo(tint_icon(self.source(self.icons[key]), color))
+        return photo
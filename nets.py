@@ -0,0 +1,222 @@
+from array import array
+
+from board import CELL_TYPE, EMPTY
+from tools import find_value, run_end, run_start
+
+
+_ZERO = bytes(array('I', [0]).itemsize)
+
+
+def _has_zero(labels):
+    """Tell whether an array of net ids holds an unlabeled cell, searching its bytes rather than its items."""
+    with memoryview(labels).cast('B') as view:
+        return find_value(view, 0, len(labels), _ZERO) != -1
+
+
+class Nets:
+    """Electrical connectivity of the wires on a board, kept up to date as cells change.
+
+    A net is a group of painted cells of the same color connected through
+    their edges (or corners too with connectivity 8). Every cell carries the
+    id of its net in a label row, so finding the net under a cell is one
+    lookup, and every net keeps its cells as (y, x0, x1) spans, so it can be
+    highlighted without searching the board.
+
+    After an edit, only the nets that lost cells are taken apart and labeled
+    again; painted cells are labeled from scratch and merged into the nets
+    they touch, relabeling the smaller nets into the largest one.
+    """
+
+    def __init__(self, board, connectivity=4):
+        self.board = board
+        self.reach = 1 if connectivity == 8 else 0
+        self.labels = {}  # y -> array of net ids, only for rows that ever held a net
+        self.values = {}  # net -> palette index of its cells
+        self.spans = {}   # net -> [(y, x0, x1)] covering exactly its cells
+        self.sizes = {}   # net -> cell count
+        self.next_net = 1
+        self.zeros = array('I', [0]) * board.width  # Compared against as a whole, unlike array.count
+        self.rebuild()
+
+    def __len__(self):
+        return len(self.spans)
+
+    def rebuild(self):
+        """Label the whole board from scratch."""
+        self.labels.clear()
+        self.values.clear()
+        self.spans.clear()
+        self.sizes.clear()
+        width = self.board.width
+        self._grow([(y, 0, width) for y in range(self.board.height)], {})
+
+
+    def net_at(self, x, y):
+        """Return the id of the net under a cell, or 0 if the cell is empty."""
+        labels = self.labels.get(y)
+        return labels[x] if labels is not None else 0
+
+    def net_spans(self, net):
+        """Return the cells of a net as (y, x0, x1) spans."""
+        return self.spans.get(net, [])
+
+    def net_cells(self, net):
+        """Return the cells of a net as (x, y) tuples."""
+        return [(x, y) for y, x0, x1 in self.net_spans(net) for x in range(x0, x1)]
+
+    def net_size(self, net):
+        return self.sizes.get(net, 0)
+
+
+    def update_cells(self, cells):
+        """Follow a change to some (x, y) cells."""
+        self.update_spans([(y, x, x + 1) for x, y in cells])
+
+    def update_rect(self, x0, y0, x1, y1):
+        """Follow a change to every cell in a rectangle."""
+        self.update_spans([(y, x0, x1) for y in range(y0, y1)])
+
+    def update_spans(self, spans):
+        """Follow a change to the cells of some (y, x0, x1) spans, once the board holds their new values."""
+        rows = {}
+        broken = set()
+        for y, x0, x1 in spans:
+            labels = self.labels.get(y)
+            if labels is None:
+                continue
+            old = labels[x0:x1]
+            if old == self.zeros[:x1 - x0]:
+                continue
+            values = self._row(rows, y)[x0:x1]
+            for net in set(old) - {0}:
+                # A net that lost a cell may have been split in two
+                value = self.values[net]
+                if any(label == net and current != value for label, current in zip(old, values)):
+                    broken.add(net)
+
+        seeds = list(spans)
+        for net in broken:
+            for y, x0, x1 in self.spans.pop(net):
+                self.labels[y][x0:x1] = array('I', [0]) * (x1 - x0)
+                seeds.append((y, x0, x1))
+            del self.values[net], self.sizes[net]
+        self._grow(seeds, rows)
+
+
+    def _row(self, rows, y):
+        """Return the palette indices of a row, read once per update."""
+        row = rows.get(y)
+        if row is None:
+            row = rows[y] = self.board.get_row(y)
+        return row
+
+    def _label_row(self, y):
+        labels = self.labels.get(y)
+        if labels is None:
+            labels = self.labels[y] = array('I', [0]) * self.board.width
+        return labels
+
+    def _grow(self, seeds, rows):
+        """Label every unlabeled painted cell of the (y, x0, x1) seed spans, with the nets it joins."""
+        runs = {}  # palette index -> row of it, to step over runs of one color at a time
+        for y, x0, x1 in seeds:
+            values = self._row(rows, y)
+            x = x0
+            while x < x1:
+                value = values[x]
+                same = runs.get(value)
+                if same is None:
+                    same = runs[value] = array(CELL_TYPE, [value]) * self.board.width
+                end = run_end(values, x, x1, same)
+                if value != EMPTY:
+                    labels = self.labels.get(y)
+                    if labels is None or _has_zero(labels[x:end]):
+                        self._discover(x, y, rows)
+                x = end
+
+    def _discover(self, x, y, rows):
+        """Label the unlabeled cells connected to (x, y) as a new net, then merge it with the nets it touches."""
+        board = self.board
+        width, height, reach = board.width, board.height, self.reach
+        value = self._row(rows, y)[x]
+        same = array(CELL_TYPE, [value]) * width
+        needle = same[:1].tobytes()
+        net = self.next_net
+        self.next_net += 1
+        mine = array('I', [net]) * width
+        spans = []
+        touching = set()
+        seeds = [(x, y)]
+        while seeds:
+            sx, sy = seeds.pop()
+            values = self._row(rows, sy)
+            labels = self._label_row(sy)
+            x0 = run_start(values, sx, 0, same)
+            x1 = run_end(values, sx, width, same)
+            old = labels[x0:x1]
+            if not _has_zero(old):
+                continue  # Already labeled through another seed
+            if old != self.zeros[:x1 - x0]:
+                touching.update(old)
+            spans.extend(self._claim(labels, sy, x0, x1, old, net))
+
+            lo, hi = max(x0 - reach, 0), min(x1 + reach, width)
+            for ny in (sy - 1, sy + 1):
+                if not 0 <= ny < height:
+                    continue
+                nvalues = self._row(rows, ny)
+                nlabels = self.labels.get(ny)
+                with memoryview(nvalues).cast('B') as view:
+                    i = lo
+                    while i < hi:
+                        j = find_value(view, i, hi, needle)
+                        if j == -1:
+                            break
+                        i = run_end(nvalues, j, hi, same)
+                        if nlabels is None:
+                            seeds.append((j, ny))
+                            continue
+                        near = nlabels[j:i]
+                        if _has_zero(near):
+                            seeds.append((j, ny))
+                        if near != self.zeros[:i - j] and near != mine[:i - j]:
+                            touching.update(near)
+
+        touching.discard(0)
+        touching.discard(net)
+        self.values[net] = value
+        self.spans[net] = spans
+        self.sizes[net] = sum(x1 - x0 for _, x0, x1 in spans)
+        if touching:
+            self._merge([net, *touching])
+
+    def _claim(self, labels, y, x0, x1, old, net):
+        """Label the unlabeled cells of a run, returning them as spans."""
+        if old == self.zeros[:x1 - x0]:
+            labels[x0:x1] = array('I', [net]) * (x1 - x0)
+            return [(y, x0, x1)]
+        spans = []
+        i, end = 0, len(old)
+        while i < end:
+            if old[i]:
+                i += 1
+                continue
+            start = i
+            while i < end and not old[i]:
+                i += 1
+            labels[x0 + start:x0 + i] = array('I', [net]) * (i - start)
+            spans.append((y, x0 + start, x0 + i))
+        return spans
+
+    def _merge(self, nets):
+        """Relabel every net into the largest of them, so merging costs the size of the smaller ones."""
+        target = max(nets, key=self.sizes.__getitem__)
+        spans = self.spans[target]
+        for net in nets:
+            if net == target:
+                continue
+            for y, x0, x1 in self.spans.pop(net):
+                self.labels[y][x0:x1] = array('I', [target]) * (x1 - x0)
+                spans.append((y, x0, x1))
+            self.sizes[target] += self.sizes.pop(net)
+            del self.values[net]
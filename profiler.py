@@ -0,0 +1,207 @@
+import json
+import time
+from collections import deque
+
+
+# App methods timed while profiling: the event handlers, then what they spend their time in
+HANDLERS = ("left_mouse_click", "left_mouse_release", "left_mouse_hold", "mid_mouse_click", "mid_mouse_release",
+            "mid_mouse_hold", "right_mouse_click", "right_mouse_hold", "scroll_action", "mouse_move", "undo", "redo")
+ROUTINES = ("update_canvas", "draw_background", "set_cells", "draw_stroke", "fill_area", "replace_color",
+            "preview_line", "draw_line", "move_background", "follow_view", "save_image", "draw_chunks")
+RENDERER_ROUTINES = ("redraw", "show", "draw_rect", "draw_cells", "draw_spans")
+BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 133, 266, float("inf"))  # Histogram upper bounds in ms
+
+
+class Stats:
+    """Latency histogram of one profiled function, with recent samples for percentiles."""
+
+    def __init__(self, keep=2048):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=keep)
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.recent.append(ms)
+        for i, bound in enumerate(BUCKETS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, p):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def summary(self):
+        return {"count": self.count, "mean_ms": self.total / self.count if self.count else 0.0,
+                "p50_ms": self.percentile(50), "p99_ms": self.percentile(99), "max_ms": self.max,
+                "histogram": dict(zip((str(bound) for bound in BUCKETS), self.buckets))}
+
+
+class Profiler:
+    """Opt-in timing of the app's handlers and render routines.
+
+    While enabled, the profiled methods are replaced on the app (and its
+    renderer) by timing wrappers and the event bindings are redone so Tk
+    calls the wrappers. Disabled, the wrappers are removed again, so
+    nothing is left in the way of a normal event.
+
+    A handler called from outside any other profiled call is one frame: its
+    time, the canvas items afterwards and the cells its renderer calls
+    touched are what the on-screen readout and the trace show.
+    """
+
+    REFRESH_MS = 500
+    MAX_EVENTS = 200_000  # Trace events kept for export, oldest dropped first
+
+    def __init__(self, app):
+        self.app = app
+        self.enabled = False
+        self.visible = False
+        self.stats = {}  # name -> Stats
+        self.frames = Stats()
+        self.events = deque(maxlen=self.MAX_EVENTS)
+        self.depth = 0
+        self.cells = 0  # Cells touched by renderer calls in the current frame
+        self.counting = False  # Inside a renderer call whose cells are already counted
+        self.items = 0  # Canvas items at the last readout
+        self.wrapped = []  # (object, name) of every installed wrapper
+        self.start = time.perf_counter()
+        self.job = None
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        for name in HANDLERS + ROUTINES:
+            self.wrap(self.app, name)
+        self.wrap_renderer()
+        self.app.bind_events()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for target, name in self.wrapped:
+            target.__dict__.pop(name, None)
+        self.wrapped = []
+        self.app.bind_events()
+        self.hide()
+
+    def toggle(self, event=None):
+        """Turn profiling and its on-screen readout on or off together."""
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+            self.show()
+
+
+    def wrap(self, target, name, cells=None):
+        """Replace a method of target by a timing wrapper, on the instance only."""
+        method = getattr(target, name)
+        profiler = self
+
+        def wrapper(*args, **kwargs):
+            counting = cells is not None and not profiler.counting
+            if counting:
+                # Renderers call each other, e.g. draw_cells through draw_rect: count the outer call only
+                profiler.cells += cells(*args)
+                profiler.counting = True
+            profiler.depth += 1
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                profiler.depth -= 1
+                if counting:
+                    profiler.counting = False
+                profiler.record(name, start, end)
+
+        target.__dict__[name] = wrapper
+        self.wrapped.append((target, name))
+
+    def wrap_renderer(self):
+        renderer = self.app.renderer
+        counters = {"draw_rect": lambda x0, y0, x1, y1: max(x1 - x0, 0) * max(y1 - y0, 0),
+                    "draw_cells": len,
+                    "draw_spans": lambda spans: sum(x1 - x0 for _, x0, x1 in spans),
+                    "redraw": lambda pixel_size, area: max(area[2] - area[0], 0) * max(area[3] - area[1], 0),
+                    "show": lambda area: max(area[2] - area[0], 0) * max(area[3] - area[1], 0)}
+        for name in RENDERER_ROUTINES:
+            self.wrap(renderer, name, counters[name])
+
+    def record(self, name, start, end):
+        ms = (end - start) * 1000
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = Stats()
+        stats.add(ms)
+        event = {"name": name, "ph": "X", "ts": (start - self.start) * 1e6, "dur": (end - start) * 1e6,
+                 "pid": 1, "tid": 1}
+        if self.depth == 0:
+            # A whole frame: the handler Tk called
+            self.frames.add(ms)
+            event["args"] = {"cells": self.cells}
+            self.cells = 0
+            if not any(target is self.app.renderer for target, _ in self.wrapped):
+                self.wrap_renderer()  # A project was opened, with a new renderer
+        self.events.append(event)
+
+
+    def show(self):
+        self.visible = True
+        self.refresh()
+
+    def hide(self):
+        self.visible = False
+        if self.job is not None:
+            self.app.root.after_cancel(self.job)
+            self.job = None
+        self.app.canvas.delete("profiler")
+
+    def refresh(self):
+        """Redraw the readout with fresh numbers, then come back for the next one."""
+        self.items = self.app.canvas_item_count()
+        self.events.append({"name": "canvas items", "ph": "C", "ts": (time.perf_counter() - self.start) * 1e6,
+                            "pid": 1, "args": {"items": self.items}})
+        self.draw()
+        self.job = self.app.root.after(self.REFRESH_MS, self.refresh)
+
+    def draw(self):
+        """Draw the readout in the top left corner of the view, on a dark box so it reads over any board."""
+        canvas = self.app.canvas
+        canvas.delete("profiler")
+        text = canvas.create_text(canvas.canvasx(8), canvas.canvasy(8), anchor="nw", text=self.readout(),
+                                  fill="#ffffff", font=("Courier", 10), tags="profiler")
+        x0, y0, x1, y1 = canvas.bbox(text)
+        box = canvas.create_rectangle(x0 - 4, y0 - 4, x1 + 4, y1 + 4, fill="#202020", outline="", tags="profiler")
+        canvas.tag_lower(box, text)
+        canvas.tag_raise("profiler")
+
+    def readout(self):
+        frames = self.frames
+        slowest = sorted(self.stats.items(), key=lambda entry: -entry[1].percentile(99))[:3]
+        lines = [f"frame p50 {frames.percentile(50):6.2f} ms  p99 {frames.percentile(99):6.2f} ms  "
+                 f"({frames.count} frames)",
+                 f"canvas items {self.items}"]
+        lines.extend(f"{name:<16} p99 {stats.percentile(99):6.2f} ms  x{stats.count}" for name, stats in slowest)
+        return "\n".join(lines)
+
+
+    def summary(self):
+        return {"frames": self.frames.summary(), "calls": {name: stats.summary() for name, stats in self.stats.items()},
+                "canvas_items": self.items}
+
+    def export_trace(self, path):
+        """Write the recorded calls as a Chrome trace (chrome://tracing or Perfetto)."""
+        with open(path, "w") as file:
+            json.dump({"traceEvents": list(self.events), "displayTimeUnit": "ms",
+                       "otherData": {"summary": self.summary()}}, file)
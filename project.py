@@ -0,0 +1,273 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from board import CELL_TYPE, CHUNK_SIZE, Palette, make_board
+
+
+# File layout, all little-endian:
+#   header | chunk and metadata blobs, in any order | chunk index
+# The header points at the index and at the metadata blob. The index holds one
+# (offset, length) entry per chunk, row-major, with length 0 for empty chunks.
+# Chunks are zlib-compressed 16 bit palette indices; metadata is zlib-compressed
+# JSON with the palette the indices point into, components and anything else
+# that is not cells.
+MAGIC = b"CPLN"
+VERSION = 2
+HEADER = struct.Struct("<4sHHIIQIQI")
+INDEX_ENTRY = struct.Struct("<QI")
+COMPRESSION_LEVEL = 6
+
+
+class ProjectError(Exception):
+    """Raised when a project file cannot be read."""
+
+
+def encode_chunk(values):
+    if values.count(0) == len(values):
+        return b""
+    if sys.byteorder != 'little':
+        values = array(CELL_TYPE, values)
+        values.byteswap()
+    return zlib.compress(values.tobytes(), COMPRESSION_LEVEL)
+
+
+def decode_chunk(data, count=CHUNK_SIZE * CHUNK_SIZE):
+    """Decode a chunk of count cells, raising ProjectError if it is damaged or not that size."""
+    try:
+        data = zlib.decompress(data)
+    except zlib.error as error:
+        raise ProjectError(f"damaged chunk: {error}") from error
+    if len(data) != count * array(CELL_TYPE).itemsize:
+        raise ProjectError(f"chunk of {len(data)} bytes, expected {count} cells")
+    values = array(CELL_TYPE)
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _write_tail(file, width, height, meta, index):
+    """Append the metadata and index, then point the header at them."""
+    meta_data = zlib.compress(json.dumps(meta).encode(), COMPRESSION_LEVEL)
+    meta_offset = file.tell()
+    file.write(meta_data)
+    index_offset = file.tell()
+    file.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in index))
+    index_length = file.tell() - index_offset
+    # Everything the header points at must be on disk before the header is
+    file.flush()
+    os.fsync(file.fileno())
+    file.seek(0)
+    file.write(HEADER.pack(MAGIC, VERSION, CHUNK_SIZE, width, height,
+                           index_offset, index_length, meta_offset, len(meta_data)))
+    file.seek(0, os.SEEK_END)
+
+
+def write_project(path, width, height, chunks, meta):
+    """Write a whole project from its encoded chunks, row-major, under a temporary name renamed into place.
+
+    Returns (index, size) of the new file.
+    """
+    temp_path = path + ".tmp"
+    index = []
+    with open(temp_path, "wb") as file:
+        file.write(b"\0" * HEADER.size)
+        for data in chunks:
+            index.append((file.tell() if data else 0, len(data)))
+            file.write(data)
+        _write_tail(file, width, height, meta, index)
+        file.flush()
+        os.fsync(file.fileno())
+        size = file.seek(0, os.SEEK_END)
+    os.replace(temp_path, path)
+    return index, size
+
+
+class ProjectFile:
+    """A project on disk, saved incrementally and loaded lazily.
+
+    After a first full write, save appends only the chunks that changed since
+    the last save plus a new index and metadata, then repoints the header. The
+    space taken by replaced blobs is reclaimed by a full rewrite once it
+    outgrows the live data.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = None  # [(offset, length)] per chunk, as stored in the file
+        self.size = 0
+        self.garbage = 0
+        self.saved_generation = -1  # Board generation at the last save or load
+        self.board_size = None
+        self.file = None
+        self.map = None
+
+    @classmethod
+    def open(cls, path):
+        """Read a project's header, index and metadata, and map it for lazy chunk loading.
+
+        Returns (project, board, meta). The board starts out empty: chunks are
+        loaded on demand with load_chunk, usually through a ChunkLoader.
+        """
+        project = cls(path)
+        project.file = open(path, "rb")
+        try:
+            project.map = mmap.mmap(project.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(project.map) < HEADER.size:
+                raise ProjectError(f"{path} is not a CircuiPlanner project")
+            magic, version, chunk_size, width, height, index_offset, index_length, meta_offset, meta_length = \
+                HEADER.unpack_from(project.map, 0)
+            if magic != MAGIC or version != VERSION or chunk_size != CHUNK_SIZE:
+                raise ProjectError(f"{path} is not a CircuiPlanner project this version can read")
+            meta = json.loads(zlib.decompress(project.map[meta_offset:meta_offset + meta_length]))
+            # Chunks hold indices into the saved palette, so it must be in place before any is loaded
+            board = make_board(width, height, Palette(meta.get("palette", [])))
+            if index_length != len(board.chunk_generations) * INDEX_ENTRY.size:
+                raise ProjectError(f"{path} has a damaged chunk index")
+            project.index = [INDEX_ENTRY.unpack_from(project.map, index_offset + i * INDEX_ENTRY.size)
+                             for i in range(len(board.chunk_generations))]
+        except (ValueError, zlib.error, struct.error) as error:
+            project.close()
+            raise ProjectError(f"{path} could not be read: {error}") from error
+        except BaseException:
+            project.close()
+            raise
+
+        project.size = len(project.map)
+        live = HEADER.size + index_length + meta_length + sum(length for _, length in project.index)
+        project.garbage = project.size - live
+        project.board_size = (width, height)
+        project.saved_generation = board.generation
+        return project, board, meta
+
+    def load_chunk(self, board, cx, cy):
+        """Decode one chunk from the mapped file into the board, without marking it as changed.
+
+        Raises ProjectError if the chunk is damaged, leaving it empty on the board.
+        """
+        offset, length = self.index[cy * board.chunk_cols + cx]
+        if length:
+            x0, y0, x1, y1 = board.chunk_rect(cx, cy)
+            try:
+                values = decode_chunk(self.map[offset:offset + length], (x1 - x0) * (y1 - y0))
+            except ProjectError as error:
+                raise ProjectError(f"{self.path}: chunk ({cx}, {cy}) could not be read, {error}") from error
+            if max(values) >= len(board.palette.colors):
+                raise ProjectError(f"{self.path}: chunk ({cx}, {cy}) uses colors missing from the palette")
+            board.set_chunk(cx, cy, values, touch=False)
+
+    def close(self):
+        """Release the mapped file. Chunks can no longer be loaded after this."""
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def save(self, board, meta):
+        """Write the board and metadata, rewriting only the chunks that changed since the last save.
+
+        The board's palette is saved as meta["palette"], overriding any given.
+        """
+        meta = dict(meta, palette=board.palette.colors[1:])
+        # The file cannot be extended while it is mapped on every platform
+        self.close()
+        incremental = (self.index is not None and self.board_size == (board.width, board.height)
+                       and os.path.exists(self.path))
+        if incremental and self.garbage > self.size - self.garbage:
+            incremental = False  # Compact the file
+        if incremental:
+            self._save_changed(board, meta)
+        else:
+            self._save_all(board, meta)
+        self.board_size = (board.width, board.height)
+        self.saved_generation = board.generation
+
+    def _save_all(self, board, meta):
+        chunks = (encode_chunk(board.get_chunk(cx, cy)) for cy in range(board.chunk_rows)
+                  for cx in range(board.chunk_cols))
+        self.index, self.size = write_project(self.path, board.width, board.height, chunks, meta)
+        self.garbage = 0
+
+    def _save_changed(self, board, meta):
+        index = list(self.index)
+        old_meta_length, old_index_length = self._tail_lengths()
+        with open(self.path, "r+b") as file:
+            file.seek(0, os.SEEK_END)
+            for cx, cy in board.changed_chunks(self.saved_generation):
+                i = cy * board.chunk_cols + cx
+                data = encode_chunk(board.get_chunk(cx, cy))
+                self.garbage += index[i][1]
+                index[i] = (file.tell() if data else 0, len(data))
+                file.write(data)
+            self.garbage += old_meta_length + old_index_length
+            # The header is written last, so a crash before it leaves the old save intact
+            _write_tail(file, board.width, board.height, meta, index)
+            file.flush()
+            os.fsync(file.fileno())
+            self.size = file.seek(0, os.SEEK_END)
+        self.index = index
+
+    def _tail_lengths(self):
+        with open(self.path, "rb") as file:
+            header = HEADER.unpack(file.read(HEADER.size))
+        return header[8], header[6]
+
+
+class ChunkLoader:
+    """Load a project's chunks on demand, then the rest in small background batches.
+
+    A damaged chunk is left empty and its ProjectError kept in errors, so the
+    rest of the project still loads and the caller can report it once.
+    """
+
+    def __init__(self, project, board):
+        self.project = project
+        self.board = board
+        # Non-empty chunks not loaded yet, background loading goes through them in order
+        self.order = [(cx, cy) for cy in range(board.chunk_rows) for cx in range(board.chunk_cols)
+                      if project.index[cy * board.chunk_cols + cx][1]]
+        self.order.reverse()
+        self.pending = set(self.order)
+        self.errors = []
+
+    @property
+    def done(self):
+        return not self.pending
+
+    def ensure(self, x0, y0, x1, y1):
+        """Load every pending chunk overlapping a rectangle of cells, so it can be shown or edited."""
+        loaded = []
+        for cy in range(max(y0, 0) // CHUNK_SIZE, (min(y1, self.board.height) - 1) // CHUNK_SIZE + 1):
+            for cx in range(max(x0, 0) // CHUNK_SIZE, (min(x1, self.board.width) - 1) // CHUNK_SIZE + 1):
+                if (cx, cy) in self.pending and self.load((cx, cy)):
+                    loaded.append((cx, cy))
+        return loaded
+
+    def load_some(self, count):
+        """Load up to count pending chunks and return them as (cx, cy)."""
+        loaded = []
+        while self.order and len(loaded) < count:
+            chunk = self.order.pop()
+            if chunk in self.pending and self.load(chunk):
+                loaded.append(chunk)
+        return loaded
+
+    def finish(self):
+        return self.load_some(len(self.pending))
+
+    def load(self, chunk):
+        """Load one chunk, returning False if it is damaged."""
+        self.pending.discard(chunk)
+        try:
+            self.project.load_chunk(self.board, *chunk)
+        except ProjectError as error:
+            self.errors.append(error)
+            return False
+        return True
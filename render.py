@@ -0,0 +1,500 @@
+import math
+from collections import OrderedDict
+from functools import lru_cache
+
+from PIL import Image, ImageChops, ImageColor, ImageTk
+
+from board import CHUNK_SIZE
+from components import footprint_image
+from tools import cells_bbox, spans_bbox
+
+
+CHECKER_COLORS = ((211, 211, 211), (255, 255, 255))  # Light gray on even cells, white on odd ones
+ABOVE_CELLS = ("components", "overlay", "selection", "profiler")  # Canvas tags stacked over the board, bottom first
+
+
+def checkerboard(width, height):
+    """Return an RGB checkerboard image with one square per cell."""
+    # Build the two alternating rows once and repeat them, instead of setting pixels one by one
+    pair = bytes(CHECKER_COLORS[0] + CHECKER_COLORS[1])
+    even_row = (pair * ((width + 1) // 2))[:width * 3]
+    odd_row = (pair[3:] + pair * (width // 2 + 1))[:width * 3]
+    data = (even_row + odd_row) * (height // 2) + (even_row if height % 2 else b"")
+    return Image.frombytes("RGB", (width, height), data)
+
+
+def _scaled(cells, pixel_size):
+    """Screen pixels taken by a number of cells at a zoom, at least one."""
+    return max(math.ceil(cells * pixel_size), 1)
+
+
+@lru_cache(maxsize=128)
+def tint_icon(path, color):
+    """Return the icon at path with its black pixels replaced by color, keeping their alpha.
+
+    The result is cached and shared, so callers must not modify it.
+    """
+    image = Image.open(path).convert("RGBA")
+    red, green, blue, alpha = image.split()
+    # 255 where the pixel is pure black, 0 everywhere else
+    mask = ImageChops.lighter(ImageChops.lighter(red, green), blue).point(lambda value: 255 if value == 0 else 0)
+    tinted = Image.new("RGBA", image.size, ImageColor.getrgb(color)[:3])
+    tinted.putalpha(alpha)
+    return Image.composite(tinted, image, mask)
+
+
+class ItemRenderer:
+    """Draw the board as one retained canvas rectangle per painted cell."""
+
+    def __init__(self, canvas, board, make_photo=None):
+        # make_photo is unused, renderers share one signature
+        self.canvas = canvas
+        self.board = board
+        self.pixel_size = 1
+        # Canvas rectangle of every painted cell, keyed by (x, y)
+        self.cell_items = {}
+
+    def redraw(self, pixel_size, area=None):
+        """Throw away every cell item and draw the whole board again. Items stay valid anywhere, so area is unused."""
+        self.pixel_size = pixel_size
+        self.canvas.delete("cells")
+        self.cell_items = {}
+        for x, y, color in self.board.painted():
+            self.draw_cell(x, y, color)
+
+    def show(self, area):
+        """Every painted cell already has its item, panning needs nothing new."""
+
+    def draw_cell(self, x, y, color=False):
+        """Bring the canvas in line with the board for one cell."""
+        if color is False:
+            color = self.board.get(x, y)
+        item = self.cell_items.get((x, y))
+        if color is None:
+            # Delete the cell's rectangle so the background shows through
+            if item:
+                self.canvas.delete(item)
+                del self.cell_items[(x, y)]
+        elif item:
+            # Recolor the existing rectangle instead of stacking a new one
+            self.canvas.itemconfig(item, fill=color, outline=color)
+        else:
+            size = self.pixel_size
+            self.cell_items[(x, y)] = self.canvas.create_rectangle(
+                x * size, y * size,
+                (x + 1) * size, (y + 1) * size,
+                fill=color, outline=color, tags="cells"
+            )
+
+    def draw_rect(self, x0, y0, x1, y1):
+        """Bring the canvas in line with the board for a rectangle of cells."""
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                self.draw_cell(x, y)
+        self.raise_layers()
+
+    def draw_cells(self, cells):
+        """Bring the canvas in line with the board for some (x, y) cells."""
+        for x, y in cells:
+            self.draw_cell(x, y)
+        self.raise_layers()
+
+    def draw_spans(self, spans):
+        """Bring the canvas in line with the board for some (y, x0, x1) spans of cells."""
+        for y, x0, x1 in spans:
+            for x in range(x0, x1):
+                self.draw_cell(x, y)
+        self.raise_layers()
+
+    def raise_layers(self):
+        # New rectangles are created on top, so put the layers above the board back over them
+        for tag in ABOVE_CELLS:
+            self.canvas.tag_raise(tag)
+
+
+def mip_level(pixel_size):
+    """Return the mipmap level shown at a zoom: 0 from one pixel per cell up, k at 1 / 2**k of a pixel."""
+    level = 0
+    while pixel_size * 2 ** level < 1:
+        level += 1
+    return level
+
+
+class Mipmaps:
+    """The board as RGBA images at 1/2, 1/4, 1/8... of a pixel per cell, for zoomed-out views.
+
+    Level k averages 2**k x 2**k cells into each pixel, and is kept in square
+    tiles of TILE pixels, each built from the board the first time it is
+    shown, a band of rows at a time so no large image of the board is ever
+    made. Tiles over unpainted parts of the board are not stored, so a huge
+    mostly empty board costs as little here as it does in cells. From then on
+    every change to the board is folded into the tiles built so far, where
+    it happened.
+    """
+
+    TILE = 256
+
+    def __init__(self, board):
+        self.board = board
+        self.tiles = {}  # (level, tx, ty) -> image, None where nothing is painted
+
+    def size(self, level):
+        """Return the (width, height) of a level in pixels."""
+        factor = 2 ** level
+        return -(-self.board.width // factor), -(-self.board.height // factor)
+
+    def image(self, level, x0, y0, x1, y1):
+        """Return the pixels (x0, y0) to (x1, y1) of a level, exclusive at the far end, from its tiles."""
+        size = self.TILE
+        image = Image.new("RGBA", (x1 - x0, y1 - y0), (0, 0, 0, 0))
+        for ty in range(y0 // size, (y1 - 1) // size + 1):
+            for tx in range(x0 // size, (x1 - 1) // size + 1):
+                tile = self.tile(level, tx, ty)
+                if tile is not None:
+                    image.paste(tile, (tx * size - x0, ty * size - y0))
+        return image
+
+    def tile(self, level, tx, ty):
+        key = (level, tx, ty)
+        if key in self.tiles:
+            return self.tiles[key]
+        size, factor = self.TILE, 2 ** level
+        width, height = self.size(level)
+        x0, y0 = tx * size, ty * size
+        x1, y1 = min(x0 + size, width), min(y0 + size, height)
+        if self.board.painted_in(x0 * factor, y0 * factor, x1 * factor, y1 * factor):
+            tile = self.reduced(level, x0, y0, x1, y1)
+        else:
+            tile = None
+        self.tiles[key] = tile
+        return tile
+
+    def reduced(self, level, x0, y0, x1, y1):
+        """Make the pixels (x0, y0) to (x1, y1) of a level from the board, one band of chunk rows at a time."""
+        board, factor = self.board, 2 ** level
+        image = Image.new("RGBA", (x1 - x0, y1 - y0), (0, 0, 0, 0))
+        left, right = x0 * factor, min(x1 * factor, board.width)
+        band = CHUNK_SIZE // factor
+        for y in range(y0, y1, band):
+            top, bottom = y * factor, min(min(y + band, y1) * factor, board.height)
+            if board.painted_in(left, top, right, bottom):
+                image.paste(board.to_image(left, top, right, bottom).reduce(factor), (0, y - y0))
+        return image
+
+    def update(self, x0, y0, x1, y1):
+        """Bring every tile built so far up to date with a rectangle of cells."""
+        size = self.TILE
+        for level in {key[0] for key in self.tiles}:
+            factor = 2 ** level
+            width, height = self.size(level)
+            px0, py0 = x0 // factor, y0 // factor
+            px1, py1 = min(-(-x1 // factor), width), min(-(-y1 // factor), height)
+            for ty in range(py0 // size, (py1 - 1) // size + 1):
+                for tx in range(px0 // size, (px1 - 1) // size + 1):
+                    key = (level, tx, ty)
+                    if key not in self.tiles:
+                        continue
+                    left, top = tx * size, ty * size
+                    tile = self.tiles[key]
+                    if tile is None:
+                        tile = self.tiles[key] = Image.new(
+                            "RGBA", (min(size, width - left), min(size, height - top)), (0, 0, 0, 0))
+                    a, b = max(px0, left), max(py0, top)
+                    c, d = min(px1, left + size), min(py1, top + size)
+                    tile.paste(self.reduced(level, a, b, c, d), (a - left, b - top))
+
+
+class BitmapRenderer:
+    """Draw the board around the view as one transparent image and re-blit only dirty rectangles.
+
+    Only an area of cells chosen by the app, the view and a margin around it,
+    is ever rendered, so a redraw costs as much as the window is large
+    whatever the size of the board. Below one pixel per cell the image comes
+    from the matching mipmap level. Fractional zooms must be 1 / 2**k, with
+    areas starting on a multiple of 2**k cells.
+    """
+
+    def __init__(self, canvas, board, make_photo=ImageTk.PhotoImage):
+        self.canvas = canvas
+        self.board = board
+        self.make_photo = make_photo
+        self.pixel_size = 1
+        self.area = (0, 0, 0, 0)  # (x0, y0, x1, y1) cells the image covers
+        self.mipmaps = Mipmaps(board)
+        self.photo = None
+        self.item = None
+
+    def redraw(self, pixel_size, area):
+        """Rebuild the image at the given zoom, for an (x0, y0, x1, y1) area of cells."""
+        self.pixel_size = pixel_size
+        self.show(area)
+
+    def show(self, area):
+        """Rebuild the image for another area of cells, at the current zoom."""
+        self.area = area
+        self.photo = self.item = None
+        self.canvas.delete("cells")
+        x0, y0, x1, y1 = area
+        if x0 >= x1 or y0 >= y1:
+            return
+        size = self.pixel_size
+        if size < 1:
+            level = mip_level(size)
+            factor = 2 ** level
+            image = self.mipmaps.image(level, x0 // factor, y0 // factor, -(-x1 // factor), -(-y1 // factor))
+        else:
+            image = self.board.to_image(x0, y0, x1, y1).resize(((x1 - x0) * size, (y1 - y0) * size), Image.NEAREST)
+        self.photo = self.make_photo(image)
+        self.item = self.canvas.create_image(x0 * size, y0 * size, anchor="nw", image=self.photo, tags="cells")
+        for tag in ABOVE_CELLS:
+            self.canvas.tag_raise(tag)
+
+    def draw_cell(self, x, y, color=False):
+        self.draw_rect(x, y, x + 1, y + 1)
+
+    def draw_rect(self, x0, y0, x1, y1):
+        """Copy a rectangle of cells from the board into the displayed image, as far as it shows it."""
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.board.width), min(y1, self.board.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        self.mipmaps.update(x0, y0, x1, y1)
+        if self.photo is None:
+            return
+        left, top, right, bottom = self.area
+        x0, y0, x1, y1 = max(x0, left), max(y0, top), min(x1, right), min(y1, bottom)
+        if x0 >= x1 or y0 >= y1:
+            return
+        size = self.pixel_size
+        if size < 1:
+            level = mip_level(size)
+            factor = 2 ** level
+            x0, y0, x1, y1 = x0 // factor, y0 // factor, -(-x1 // factor), -(-y1 // factor)
+            left, top = left // factor, top // factor
+            patch = self.mipmaps.image(level, x0, y0, x1, y1)
+            size = 1
+        else:
+            patch = self.board.to_image(x0, y0, x1, y1).resize(((x1 - x0) * size, (y1 - y0) * size), Image.NEAREST)
+        patch = self.make_photo(patch)
+        # "set" replaces the pixels outright, so erased cells become transparent again
+        self.canvas.tk.call(str(self.photo), "copy", str(patch),
+                            "-to", (x0 - left) * size, (y0 - top) * size, "-compositingrule", "set")
+
+    def draw_cells(self, cells):
+        """Re-blit the bounding box of some (x, y) cells in one go."""
+        if cells:
+            self.draw_rect(*cells_bbox(cells))
+
+    def draw_spans(self, spans):
+        """Re-blit the bounding box of some (y, x0, x1) spans in one go."""
+        if spans:
+            self.draw_rect(*spans_bbox(spans))
+
+
+class Overlay:
+    """Temporary cells drawn above the board, such as a line preview, without touching the board.
+
+    Only the cells that differ from the previous call to set are redrawn.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.pixel_size = 1
+        self.cells = {}  # (x, y) -> color
+        self.items = {}  # (x, y) -> canvas rectangle
+
+    def set(self, cells):
+        """Show exactly the given {(x, y): color} cells."""
+        for cell in self.cells.keys() - cells.keys():
+            self.canvas.delete(self.items.pop(cell))
+        for cell, color in cells.items():
+            if self.cells.get(cell) == color:
+                continue
+            item = self.items.get(cell)
+            if item:
+                self.canvas.itemconfig(item, fill=color, outline=color)
+            else:
+                self.items[cell] = self.create(cell, color)
+        self.cells = dict(cells)
+
+    def clear(self):
+        self.set({})
+
+    def redraw(self, pixel_size):
+        """Draw every overlay cell again at a new zoom."""
+        self.pixel_size = pixel_size
+        self.canvas.delete("overlay")
+        self.items = {cell: self.create(cell, color) for cell, color in self.cells.items()}
+
+    def create(self, cell, color):
+        x, y = cell
+        size = self.pixel_size
+        return self.canvas.create_rectangle(
+            x * size, y * size,
+            (x + 1) * size, (y + 1) * size,
+            fill=color, outline=color, tags="overlay"
+        )
+
+
+class SelectionView:
+    """The selection outline, plus the lifted block while a selection is being dragged."""
+
+    OUTLINE = "#0078d7"
+
+    def __init__(self, canvas, make_photo=ImageTk.PhotoImage):
+        self.canvas = canvas
+        self.make_photo = make_photo
+        self.pixel_size = 1
+        self.box = None  # (x0, y0, x1, y1) cells outlined
+        self.block = None  # Block shown at the top left of box while dragged
+        self.photo = None
+
+    def show(self, box, block=None):
+        """Outline a box of cells, drawing block in it if given. The block's image is only made when it changes."""
+        if block is not self.block:
+            self.photo = None
+        self.box, self.block = box, block
+        self.draw()
+
+    def clear(self):
+        self.show(None)
+
+    def redraw(self, pixel_size):
+        if pixel_size != self.pixel_size:
+            self.photo = None
+        self.pixel_size = pixel_size
+        self.draw()
+
+    def draw(self):
+        self.canvas.delete("selection")
+        if self.box is None:
+            return
+        size = self.pixel_size
+        x0, y0, x1, y1 = (value * size for value in self.box)
+        if self.block is not None:
+            if self.photo is None:
+                image = self.block.image()
+                self.photo = self.make_photo(image.resize((max(round(image.width * size), 1),
+                                                           max(round(image.height * size), 1)), Image.NEAREST))
+            self.canvas.create_image(x0, y0, anchor="nw", image=self.photo, tags="selection")
+        self.canvas.create_rectangle(x0, y0, x1, y1, outline=self.OUTLINE, dash=(4, 2), tags="selection")
+
+
+class ComponentView:
+    """Draw placed components as canvas images above the board, one item per placement.
+
+    Each orientation of a footprint is turned into a PhotoImage once per zoom
+    level and shared by every placement that uses it.
+    """
+
+    def __init__(self, canvas, components, make_photo=ImageTk.PhotoImage):
+        self.canvas = canvas
+        self.components = components
+        self.make_photo = make_photo
+        self.pixel_size = 1
+        self.photos = {}  # (footprint name, rotation, mirror) -> PhotoImage at the current zoom
+        self.items = {}   # placement id -> canvas image
+
+    def photo(self, placement):
+        key = (placement.footprint.name, placement.rotation, placement.mirror)
+        photo = self.photos.get(key)
+        if photo is None:
+            image = footprint_image(placement.footprint, placement.rotation, placement.mirror, self.pixel_size)
+            photo = self.photos[key] = self.make_photo(image)
+        return photo
+
+    def redraw(self, pixel_size):
+        """Draw every placement again at a new zoom."""
+        if pixel_size != self.pixel_size:
+            self.photos = {}
+        self.pixel_size = pixel_size
+        self.canvas.delete("components")
+        self.items = {}
+        for placement in self.components:
+            self.draw(placement)
+
+    def draw(self, placement):
+        """Draw a placement where it is now, creating its item if needed."""
+        size = self.pixel_size
+        item = self.items.get(placement.id)
+        if item is None:
+            self.items[placement.id] = self.canvas.create_image(
+                placement.x * size, placement.y * size, anchor="nw", image=self.photo(placement), tags="components")
+        else:
+            self.canvas.coords(item, placement.x * size, placement.y * size)
+            self.canvas.itemconfig(item, image=self.photo(placement))
+
+    def delete(self, placement):
+        item = self.items.pop(placement.id, None)
+        if item is not None:
+            self.canvas.delete(item)
+
+
+class BackgroundCache:
+    """Bounded LRU cache of checkerboard backgrounds for areas of the board, ready to display.
+
+    Backgrounds are pasted together from one small tile per zoom level. A
+    tile is CHUNK_SIZE cells across (more when zoomed out, so it stays a
+    whole number of pixels) and starts on a multiple of its size on the
+    board, so areas of the same size whose corners fall at the same place
+    in a tile look alike: photos are keyed by zoom, that place and the size,
+    and panning to a new area mostly finds one ready. Tiles and photos share
+    one budget, the least recently used are evicted past max_pixels pixels.
+    """
+
+    def __init__(self, load, max_pixels=32_000_000, make_photo=ImageTk.PhotoImage):
+        self.load = load  # Returns the unscaled background for (cols, rows)
+        self.max_pixels = max_pixels
+        self.make_photo = make_photo
+        self.entries = OrderedDict()  # (pixel_size,) -> ((tile, cells across), pixels), longer keys -> (photo, pixels)
+        self.pixels = 0
+
+    def tile(self, pixel_size):
+        entry = self.entries.get((pixel_size,))
+        if entry is not None:
+            self.entries.move_to_end((pixel_size,))
+            return entry[0]
+        cells = CHUNK_SIZE * max(1, round(1 / pixel_size))
+        size = _scaled(cells, pixel_size)
+        tile = (self.load(cells, cells).resize((size, size), Image.NEAREST), cells)
+        self.add((pixel_size,), tile, size * size)
+        return tile
+
+    def get(self, x0, y0, x1, y1, pixel_size):
+        """Return the background of an (x0, y0, x1, y1) area of cells at a zoom, as a photo."""
+        tile, cells = self.tile(pixel_size)
+        key = (pixel_size, x0 % cells, y0 % cells, x1 - x0, y1 - y0)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry[0]
+        image = Image.new("RGB", (_scaled(x1 - x0, pixel_size), _scaled(y1 - y0, pixel_size)))
+        step = tile.width
+        left, top = -int(x0 % cells * pixel_size), -int(y0 % cells * pixel_size)
+        for y in range(top, image.height, step):
+            for x in range(left, image.width, step):
+                image.paste(tile, (x, y))
+        photo = self.make_photo(image)
+        self.add(key, photo, image.width * image.height)
+        return photo
+
+    def add(self, key, value, pixels):
+        self.entries[key] = (value, pixels)
+        self.pixels += pixels
+        # Always keep the newest entry, even if it alone is over budget
+        while self.pixels > self.max_pixels and len(self.entries) > 1:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.pixels -= evicted
+
+    def prewarm(self, pixel_sizes):
+        """Scale the tiles of some zoom levels ahead of time.
+
+        Pre-warmed tiles are the first to go, so they never push out a visited zoom level.
+        """
+        for pixel_size in pixel_sizes:
+            if (pixel_size,) not in self.entries:
+                self.tile(pixel_size)
+                self.entries.move_to_end((pixel_size,), last=False)
+
+
+RENDERERS = {"items": ItemRenderer, "bitmap": BitmapRenderer}
@@ -0,0 +1,62 @@
+import time
+
+
+class FrameScheduler:
+    """Coalesce bursts of input events and handle them at most once per frame.
+
+    Events are posted under a key. Events posted under the same key before the
+    next frame are merged: either all their samples are kept (for strokes,
+    where the path matters) or only the latest one (for hover and panning).
+    On each frame, every handler is called once with its list of samples.
+    """
+
+    def __init__(self, widget, fps=60):
+        self.widget = widget
+        self.fps = fps
+        self.pending = {}  # key -> (handler, samples)
+        self.job = None
+        self.last_flush = 0.0
+
+        # Counters for checking how much work coalescing saves
+        self.received = 0  # Events posted
+        self.merged = 0    # Events folded into one already waiting for the frame
+        self.dropped = 0   # Merged events whose sample was thrown away for a newer one
+        self.frames = 0    # Flushes that ran at least one handler
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps
+
+    def post(self, key, handler, sample, keep_all=False):
+        """Queue a sample for handler, to be handled on the next frame."""
+        self.received += 1
+        entry = self.pending.get(key)
+        if entry is None:
+            self.pending[key] = (handler, [sample])
+        else:
+            self.merged += 1
+            if keep_all:
+                entry[1].append(sample)
+            else:
+                self.dropped += 1
+                entry[1][-1] = sample
+
+        if self.job is None:
+            # Wait out the rest of the current frame, so flushes are at least one frame apart
+            delay = self.last_flush + self.interval - time.perf_counter()
+            self.job = self.widget.after(max(int(delay * 1000), 0), self.flush)
+
+    def flush(self):
+        """Handle everything queued right away, e.g. before a click that must come after it."""
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+        pending, self.pending = self.pending, {}
+        for handler, samples in pending.values():
+            handler(samples)
+        if pending:
+            self.frames += 1
+        self.last_flush = time.perf_counter()
+
+    def stats(self):
+        return {"received": self.received, "merged": self.merged, "dropped": self.dropped, "frames": self.frames}
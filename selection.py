@@ -0,0 +1,96 @@
+from array import array
+
+from PIL import Image
+
+from board import CELL_TYPE, EMPTY
+from history import Delta
+
+
+def clip_box(box, width, height):
+    """Cut an (x0, y0, x1, y1) box of cells to a width x height board, None if nothing is left."""
+    x0, y0, x1, y1 = max(box[0], 0), max(box[1], 0), min(box[2], width), min(box[3], height)
+    return (x0, y0, x1, y1) if x0 < x1 and y0 < y1 else None
+
+
+class Block:
+    """A rectangle of palette indices lifted out of a board, kept as one flat row-major array.
+
+    Every transformation works on whole rows or columns as array slices, and
+    writing a block back is one slice assignment per row.
+    """
+
+    def __init__(self, width, height, cells, palette):
+        self.width = width
+        self.height = height
+        self.cells = cells
+        self.palette = palette  # What the indices point into
+
+    @classmethod
+    def from_board(cls, board, x0, y0, x1, y1):
+        cells = array(CELL_TYPE)
+        for row in board.get_rect(x0, y0, x1, y1):
+            cells.extend(row)
+        return cls(x1 - x0, y1 - y0, cells, board.palette)
+
+    @classmethod
+    def empty(cls, width, height, palette):
+        return cls(width, height, array(CELL_TYPE, [EMPTY]) * (width * height), palette)
+
+    def rows(self):
+        width = self.width
+        return [self.cells[i:i + width] for i in range(0, len(self.cells), width)]
+
+    def rotated(self, clockwise=True):
+        """Return the block turned by 90 degrees, each new row being an old column read as one stride slice."""
+        width, cells = self.width, self.cells
+        rotated = array(CELL_TYPE)
+        if clockwise:
+            for x in range(width):
+                rotated.extend(cells[x::width][::-1])
+        else:
+            for x in reversed(range(width)):
+                rotated.extend(cells[x::width])
+        return Block(self.height, width, rotated, self.palette)
+
+    def mirrored(self, vertical=False):
+        """Return the block flipped left to right, or top to bottom if vertical."""
+        rows = self.rows()
+        if vertical:
+            rows.reverse()
+        else:
+            rows = [row[::-1] for row in rows]
+        cells = array(CELL_TYPE)
+        for row in rows:
+            cells.extend(row)
+        return Block(self.width, self.height, cells, self.palette)
+
+    def for_board(self, board):
+        """Return the block with its indices pointing into a board's palette, e.g. when pasting into another project."""
+        if self.palette is board.palette:
+            return self
+        intern = board.palette.intern
+        table = [intern(color) if color is not None else EMPTY for color in self.palette.colors]
+        return Block(self.width, self.height, array(CELL_TYPE, map(table.__getitem__, self.cells)), board.palette)
+
+    def write(self, board, x, y):
+        """Write the block with its top left corner at cell (x, y), cut to the board.
+
+        Returns (delta, box): the applied change, to record for undo, and the
+        (x0, y0, x1, y1) cells it covers, or (None, None) if it is off the board.
+        """
+        block = self.for_board(board)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + self.width, board.width), min(y + self.height, board.height)
+        if x0 >= x1 or y0 >= y1:
+            return None, None
+        width, cells = self.width, block.cells
+        rows = [cells[(row - y) * width + x0 - x:(row - y) * width + x1 - x] for row in range(y0, y1)]
+        delta = Delta.from_rows(board, x0, y0, rows)
+        board.set_rect(x0, y0, rows)
+        return delta, (x0, y0, x1, y1)
+
+    def image(self):
+        """Return the block as an RGBA image with one pixel per cell."""
+        rgba = self.palette.rgba
+        return Image.frombuffer("RGBA", (self.width, self.height), b"".join(map(rgba.__getitem__, self.cells)),
+                                "raw", "RGBA", 0, 1)
@@ -1,2 +1,651 @@
-for i in range(20, 4):
-    print(i)
\ No newline at end of file
+"""Checks of the board algorithms and the app's helpers, mostly against slow, obviously correct references.
+
+Run with pytest. Random boards come from seeded generators, so a failure
+names the trial that reproduces it.
+"""
+import os
+import random
+import time
+import zlib
+from collections import Counter, deque
+
+from PIL import Image
+import pytest
+
+import autosave
+import batch_export
+import benchmarks
+import export
+from autosave import Autosaver
+from board import Board, EMPTY, SparseBoard
+from components import Components, LIBRARY, ROTATIONS, SpatialGrid
+from export import PngExporter
+from history import Delta, History
+from nets import Nets
+from project import ChunkLoader, ProjectError, ProjectFile
+from render import Mipmaps
+from scheduler import FrameScheduler
+from selection import Block
+from text import FONT_3X5, glyph, label_cells, labels_cells, PilFont
+from tools import bresenham, flood_fill, line_cells
+
+
+COLORS = ("#111111", "#222222", "#333333", None)
+
+
+def random_board(rng, cls, width, height, colors=COLORS):
+    board = cls(width, height)
+    for _ in range(rng.randint(0, width * height)):
+        board.set(rng.randrange(width), rng.randrange(height), rng.choice(colors))
+    return board
+
+
+def snapshot(board):
+    return [board.get_row(y) for y in range(board.height)]
+
+
+def neighbours(x, y, connectivity):
+    yield from ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1))
+    if connectivity == 8:
+        yield from ((x + 1, y + 1), (x + 1, y - 1), (x - 1, y + 1), (x - 1, y - 1))
+
+
+def region(board, x, y, connectivity):
+    """Return the cells of the same value connected to (x, y), by breadth-first search."""
+    value = board.value(x, y)
+    seen = {(x, y)}
+    queue = deque(seen)
+    while queue:
+        for cell in neighbours(*queue.popleft(), connectivity):
+            if cell not in seen and board.in_bounds(*cell) and board.value(*cell) == value:
+                seen.add(cell)
+                queue.append(cell)
+    return seen
+
+
+@pytest.mark.parametrize("cls", [Board, SparseBoard])
+@pytest.mark.parametrize("connectivity", [4, 8])
+def test_flood_fill(cls, connectivity):
+    rng = random.Random(connectivity)
+    for trial in range(30):
+        width, height = rng.randint(1, 140), rng.randint(1, 140)
+        board = random_board(rng, cls, width, height)
+        x, y = rng.randrange(width), rng.randrange(height)
+        expected = region(board, x, y, connectivity)
+        before = snapshot(board)
+        color = rng.choice(COLORS + ("#ff0000",))
+        spans = flood_fill(board, x, y, color, connectivity)
+        value = board.palette.find(color)
+        if before[y][x] == value:
+            assert spans == [] and snapshot(board) == before, trial
+            continue
+        filled = [(x, y) for y, x0, x1 in spans for x in range(x0, x1)]
+        assert sorted(filled) == sorted(expected), trial
+        for y in range(height):
+            for x in range(width):
+                assert board.value(x, y) == (value if (x, y) in expected else before[y][x]), (trial, x, y)
+
+
+def test_line_cells_snap_like_the_original_tool():
+    x, y = 5, 7
+    for dx in range(-12, 13):
+        for dy in range(-12, 13):
+            across, down = abs(dx), abs(dy)
+            step_x, step_y = (1 if dx >= 0 else -1), (1 if dy >= 0 else -1)
+            # The thresholds of the Line tool before it worked in cells
+            if across < down and across < abs(across - down):
+                expected = [(x, y + i * step_y) for i in range(down + 1)]
+            elif down < across and down < abs(across - down):
+                expected = [(x + i * step_x, y) for i in range(across + 1)]
+            else:
+                expected = [(x + i * step_x, y + i * step_y) for i in range((across + down) // 2 + 1)]
+            assert line_cells((x, y), (x + dx, y + dy)) == expected, (dx, dy)
+
+
+def test_bresenham():
+    rng = random.Random(8)
+    for trial in range(500):
+        start = (rng.randint(-20, 20), rng.randint(-20, 20))
+        end = (rng.randint(-20, 20), rng.randint(-20, 20))
+        cells = bresenham(start, end)
+        assert line_cells(start, end, snap=False) == cells
+        assert cells[0] == start and cells[-1] == end, trial
+        assert len(cells) == max(abs(end[0] - start[0]), abs(end[1] - start[1])) + 1, trial
+        assert all(max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1 for a, b in zip(cells, cells[1:])), trial
+        # Every cell is within half a cell of the ideal line, across its major axis
+        dx, dy = end[0] - start[0], end[1] - start[1]
+        for cx, cy in cells:
+            if abs(dx) >= abs(dy) and dx:
+                assert abs(start[1] + (cx - start[0]) * dy / dx - cy) <= 0.5, trial
+            elif dy:
+                assert abs(start[0] + (cy - start[1]) * dx / dy - cx) <= 0.5, trial
+
+
+class FakeWidget:
+    """Runs after() callbacks in turn, in place of the Tk event loop."""
+
+    def __init__(self):
+        self.jobs = []  # (job, function, args)
+        self.next_job = 1
+
+    def after(self, delay, function, *args):
+        job = f"after#{self.next_job}"
+        self.next_job += 1
+        self.jobs.append((job, function, args))
+        return job
+
+    def after_cancel(self, job):
+        self.jobs = [entry for entry in self.jobs if entry[0] != job]
+
+    def run(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while self.jobs and time.monotonic() < deadline:
+            _, function, args = self.jobs.pop(0)
+            function(*args)
+            time.sleep(0.001)
+
+
+def test_frame_scheduler_coalesces_events():
+    widget = FakeWidget()
+    scheduler = FrameScheduler(widget, fps=60)
+    calls = []
+    for i in range(5):
+        scheduler.post("stroke", lambda samples: calls.append(("stroke", samples)), i, keep_all=True)
+        scheduler.post("hover", lambda samples: calls.append(("hover", samples)), i)
+    assert len(widget.jobs) == 1 and calls == []
+    widget.run()
+    assert calls == [("stroke", [0, 1, 2, 3, 4]), ("hover", [4])]
+    assert scheduler.stats() == {"received": 10, "merged": 8, "dropped": 4, "frames": 1}
+
+    # A flush ahead of the frame handles the events at once and cancels the frame
+    scheduler.post("hover", lambda samples: calls.append(("hover", samples)), 5)
+    scheduler.flush()
+    assert calls[-1] == ("hover", [5]) and not widget.jobs
+    scheduler.flush()
+    assert scheduler.stats() == {"received": 11, "merged": 8, "dropped": 4, "frames": 2}
+
+
+def test_history_undo_redo():
+    rng = random.Random(3)
+    board = random_board(rng, Board, 70, 50)
+    history = History()
+    states = [snapshot(board)]
+    for step in range(30):
+        # A step of several edits is grouped into one entry, like a drag
+        grouped = rng.random() < 0.5
+        if grouped:
+            history.begin_group()
+        for _ in range(rng.randint(1, 3) if grouped else 1):
+            if rng.random() < 0.5:
+                cells = [(rng.randrange(70), rng.randrange(50)) for _ in range(rng.randint(1, 40))]
+                delta = Delta.from_cells(board, cells, rng.choice(COLORS))
+                delta.apply(board)
+            else:
+                x, y = rng.randrange(70), rng.randrange(50)
+                old = board.value(x, y)
+                spans = flood_fill(board, x, y, rng.choice(COLORS), rng.choice([4, 8]))
+                delta = Delta.from_spans(board, spans, old, board.palette.colors[board.value(x, y)])
+            history.record(delta)
+        history.end_group()
+        if len(history.undo_stack) == len(states):
+            states.append(snapshot(board))  # A fill that changed nothing records no entry
+
+    # Undo all the way back, redo half, then branch off with a new edit
+    for state in reversed(states[:-1]):
+        assert history.undo(board) is not None
+        assert snapshot(board) == state
+    assert history.undo(board) is None
+    half = len(states) // 2
+    for state in states[1:half + 1]:
+        assert history.redo(board) is not None
+        assert snapshot(board) == state
+    delta = Delta.from_cells(board, [(0, 0), (1, 0)], "#ff0000")
+    delta.apply(board)
+    history.record(delta)
+    assert history.redo(board) is None
+    history.undo(board)
+    assert snapshot(board) == states[half]
+
+
+def test_history_drops_oldest():
+    board = Board(64, 64)
+    history = History(max_bytes=Delta.RUN_OVERHEAD * 3)
+    for x in range(10):
+        delta = Delta.from_cells(board, [(x, 0)], "#111111")
+        delta.apply(board)
+        history.record(delta)
+    while history.undo(board) is not None:
+        pass
+    assert [board.value(x, 0) != 0 for x in range(10)] == [True] * 7 + [False] * 3
+
+
+@pytest.mark.parametrize("cls", [Board, SparseBoard])
+def test_project_save_open(tmp_path, cls):
+    rng = random.Random(4)
+    path = str(tmp_path / "test.cpl")
+    board = random_board(rng, cls, 150, 100)
+    board.fill_rect(64, 0, 128, 64, None)  # An empty chunk
+    project = ProjectFile(path)
+    project.save(board, {"name": "test"})
+
+    for step in range(4):
+        opened, loaded, meta = ProjectFile.open(path)
+        loader = ChunkLoader(opened, loaded)
+        loader.finish()
+        assert loader.errors == [] and loader.done
+        assert meta["name"] == "test"
+        assert [[loaded.get(x, y) for x in range(150)] for y in range(100)] == \
+               [[board.get(x, y) for x in range(150)] for y in range(100)]
+        opened.close()
+        # Change a few chunks and save incrementally
+        for _ in range(rng.randint(1, 20)):
+            board.set(rng.randrange(150), rng.randrange(100), rng.choice(COLORS + ("#ff0000",)))
+        project.save(board, {"name": "test"})
+
+
+def test_project_damaged_chunk(tmp_path):
+    path = str(tmp_path / "damaged.cpl")
+    board = Board(150, 100)
+    board.fill_rect(0, 0, 150, 100, "#111111")
+    ProjectFile(path).save(board, {})
+    project, _, _ = ProjectFile.open(path)
+    offset, length = project.index[1]
+    project.close()
+    with open(path, "r+b") as file:
+        file.seek(offset + length // 2)
+        file.write(b"\xff" * 4)
+
+    project, loaded, _ = ProjectFile.open(path)
+    with pytest.raises(ProjectError):
+        project.load_chunk(loaded, 1, 0)
+    loader = ChunkLoader(project, loaded)
+    assert (1, 0) not in loader.finish()
+    assert len(loader.errors) == 1 and "(1, 0)" in str(loader.errors[0])
+    assert loaded.get(0, 0) == "#111111" and loaded.get(100, 10) is None
+    project.close()
+
+    with open(path, "wb") as file:
+        file.write(zlib.compress(b"not a project"))
+    with pytest.raises(ProjectError):
+        ProjectFile.open(path)
+
+
+def test_png_exporter_reports_every_file(tmp_path, monkeypatch):
+    widget = FakeWidget()
+    exporter = PngExporter(widget)
+    done = {}
+    image = Image.new("RGBA", (3, 2), (255, 0, 0, 255))
+    written, missing = str(tmp_path / "written.png"), str(tmp_path / "missing" / "file.png")
+    exporter.export(image, written, scale=4, on_done=done.__setitem__)
+    exporter.export(image, missing, on_done=done.__setitem__)
+    widget.run()
+    assert exporter.running == 0 and not widget.jobs
+    assert done[written] is None and isinstance(done[missing], OSError)
+    with Image.open(written) as png:
+        assert png.size == (12, 8) and png.convert("RGBA").getpixel((11, 7)) == (255, 0, 0, 255)
+
+    def out_of_memory(*args):
+        raise MemoryError
+    monkeypatch.setattr(export, "write_png", out_of_memory)
+    exporter.export(image, written, on_done=done.__setitem__)
+    widget.run()
+    assert exporter.running == 0 and isinstance(done[written], MemoryError)
+
+
+def check_palette(board):
+    """Compare the palette's counts, boxes and spans with a scan of every cell."""
+    palette = board.palette
+    rows = snapshot(board)
+    counts = Counter(value for row in rows for value in row)
+    for index, color in enumerate(palette.colors):
+        assert palette.counts[index] == counts[index], color
+        if index == EMPTY:
+            continue
+        cells = [(x, y) for y, row in enumerate(rows) for x, value in enumerate(row) if value == index]
+        if not cells:
+            assert palette.boxes[index] is None and board.color_box(color) is None, color
+            continue
+        x0, y0, x1, y1 = board.color_box(color)
+        assert all(x0 <= x < x1 and y0 <= y < y1 for x, y in cells), color
+        assert sorted(cell for y, a, b in board.color_spans(color) for cell in ((x, y) for x in range(a, b))) == \
+               sorted(cells), color
+    assert board.palette.used() == sorted(((palette.colors[index], count) for index, count in counts.items()
+                                           if index != EMPTY), key=lambda entry: -entry[1])
+
+
+@pytest.mark.parametrize("cls", [Board, SparseBoard])
+def test_palette_follows_edits(cls):
+    rng = random.Random(9)
+    width, height = 90, 70
+    board = cls(width, height)
+    history = History()
+    for step in range(150):
+        kind = rng.randrange(6)
+        color = rng.choice(COLORS)
+        if kind == 0:
+            board.set(rng.randrange(width), rng.randrange(height), color)
+        elif kind == 1:
+            cells = [(rng.randrange(width), rng.randrange(height)) for _ in range(rng.randint(1, 50))]
+            delta = Delta.from_cells(board, cells, color)
+            delta.apply(board)
+            history.record(delta)
+        elif kind == 2:
+            x0, y0 = rng.randrange(width), rng.randrange(height)
+            board.fill_rect(x0, y0, rng.randint(x0 + 1, width), rng.randint(y0 + 1, height), color)
+        elif kind == 3:
+            x, y = rng.randrange(width), rng.randrange(height)
+            old = board.value(x, y)
+            spans = flood_fill(board, x, y, color, rng.choice([4, 8]))
+            history.record(Delta.from_spans(board, spans, old, color))
+        elif kind == 4:
+            history.undo(board)
+        else:
+            history.redo(board)
+        check_palette(board)
+    board.clear()
+    check_palette(board)
+
+
+def partition(board, connectivity):
+    """Return the painted regions of a board as a set of frozensets of cells."""
+    regions = set()
+    seen = set()
+    for y in range(board.height):
+        for x in range(board.width):
+            if (x, y) not in seen and board.value(x, y):
+                cells = region(board, x, y, connectivity)
+                seen |= cells
+                regions.add(frozenset(cells))
+    return regions
+
+
+def net_partition(nets, board):
+    """Return the nets as a set of frozensets of cells, checking labels and spans agree."""
+    regions = {}
+    for y in range(board.height):
+        for x in range(board.width):
+            net = nets.net_at(x, y)
+            assert (net != 0) == (board.value(x, y) != 0), (x, y)
+            if net:
+                regions.setdefault(net, set()).add((x, y))
+    for net, cells in regions.items():
+        assert sorted(nets.net_cells(net)) == sorted(cells), net
+        assert nets.net_size(net) == len(cells), net
+    assert len(nets) == len(regions)
+    return {frozenset(cells) for cells in regions.values()}
+
+
+@pytest.mark.parametrize("cls", [Board, SparseBoard])
+@pytest.mark.parametrize("connectivity", [4, 8])
+def test_nets_follow_edits(cls, connectivity):
+    rng = random.Random(connectivity + 1)
+    for trial in range(10):
+        width, height = rng.randint(1, 80), rng.randint(1, 80)
+        board = random_board(rng, cls, width, height, COLORS[:2] + (None,))
+        nets = Nets(board, connectivity)
+        assert net_partition(nets, board) == partition(board, connectivity), trial
+        for edit in range(20):
+            color = rng.choice(COLORS[:2] + (None,))
+            kind = rng.randrange(3)
+            if kind == 0:
+                cells = [(rng.randrange(width), rng.randrange(height)) for _ in range(rng.randint(1, 10))]
+                board.set_many(cells, color)
+                nets.update_cells(cells)
+            elif kind == 1:
+                x0, y0 = rng.randrange(width), rng.randrange(height)
+                x1, y1 = rng.randint(x0 + 1, width), rng.randint(y0 + 1, height)
+                board.fill_rect(x0, y0, x1, y1, color)
+                nets.update_rect(x0, y0, x1, y1)
+            else:
+                spans = flood_fill(board, rng.randrange(width), rng.randrange(height), color, connectivity)
+                nets.update_spans(spans)
+            assert net_partition(nets, board) == partition(board, connectivity), (trial, edit)
+
+
+def test_spatial_grid():
+    rng = random.Random(10)
+    grid = SpatialGrid(size=8)
+    boxes = {}
+    for step in range(300):
+        key = rng.randrange(40)
+        x0, y0 = rng.randint(-30, 60), rng.randint(-30, 60)
+        box = (x0, y0, x0 + rng.randint(1, 20), y0 + rng.randint(1, 20))
+        if key in boxes and rng.random() < 0.3:
+            grid.remove(key)
+            del boxes[key]
+        elif key in boxes:
+            grid.move(key, box)
+            boxes[key] = box
+        else:
+            grid.insert(key, box)
+            boxes[key] = box
+        assert len(grid) == len(boxes)
+        x, y = rng.randint(-30, 80), rng.randint(-30, 80)
+        assert sorted(grid.at(x, y)) == sorted(key for key, (a, b, c, d) in boxes.items() if a <= x < c and b <= y < d)
+        x0, y0 = rng.randint(-30, 80), rng.randint(-30, 80)
+        query = (x0, y0, x0 + rng.randint(1, 30), y0 + rng.randint(1, 30))
+        assert sorted(grid.overlapping(query)) == sorted(
+            key for key, (a, b, c, d) in boxes.items() if a < query[2] and query[0] < c and b < query[3] and query[1] < d)
+    assert not grid.buckets or all(grid.buckets.values())
+
+
+def test_components_at_and_collisions():
+    rng = random.Random(11)
+    components = Components()
+    footprints = list(LIBRARY.values())
+
+    def placed():
+        return {(x, y): placement for placement in components for x, y in placement.cells()}
+
+    for step in range(200):
+        footprint, rotation, mirror = rng.choice(footprints), rng.choice(ROTATIONS), rng.random() < 0.5
+        x, y = rng.randint(0, 40), rng.randint(0, 40)
+        owners = placed()
+        cells = {(x + cx, y + cy) for cx, cy in footprint.shape(rotation, mirror)}
+        expected = {owners[cell].id for cell in cells if cell in owners}
+        assert {placement.id for placement in components.collisions(footprint, x, y, rotation, mirror)} == expected
+        if not expected:
+            components.add(footprint, x, y, rotation, mirror)
+        elif rng.random() < 0.5:
+            components.remove(owners[next(iter(cells & owners.keys()))])
+        else:
+            # Moving a placement never collides with itself
+            placement = rng.choice(list(components))
+            others = {cell for cell, owner in owners.items() if owner is not placement}
+            new = {(x + cx, y + cy) for cx, cy in placement.footprint.shape(rotation, mirror)}
+            hits = components.collisions(placement.footprint, x, y, rotation, mirror, ignore=placement.id)
+            assert {hit.id for hit in hits} == {owners[cell].id for cell in new & others}
+            if not hits:
+                components.move(placement, x, y, rotation, mirror)
+        owners = placed()
+        for _ in range(20):
+            cell = (rng.randint(-2, 50), rng.randint(-2, 50))
+            found = components.at(*cell)
+            assert (found.id if found else None) == (owners[cell].id if cell in owners else None), cell
+
+
+def test_footprint_orientations():
+    for footprint in LIBRARY.values():
+        grid = [[key != "." for key in row.ljust(footprint.width, ".")] for row in footprint.rows]
+        for mirror in (False, True):
+            turned = [row[::-1] for row in grid] if mirror else grid
+            for rotation in ROTATIONS:
+                cells = {(x, y) for y, row in enumerate(turned) for x, filled in enumerate(row) if filled}
+                assert footprint.shape(rotation, mirror) == cells, (footprint.name, rotation, mirror)
+                assert footprint.size(rotation) == (len(turned[0]), len(turned))
+                turned = [list(row) for row in zip(*turned[::-1])]  # A quarter turn clockwise
+
+
+@pytest.mark.parametrize("option", ["--scale", "--jobs"])
+@pytest.mark.parametrize("count", ["0", "-3", "two"])
+def test_batch_export_rejects_bad_counts(option, count):
+    with pytest.raises(SystemExit) as exit:
+        batch_export.main(["missing.cpl", option, count])
+    assert exit.value.code == 2
+
+
+def reference_label(text, x, y, size):
+    """Return the cells of a 3x5 label, read off the glyph rows one font pixel at a time."""
+    cells = set()
+    for line, chars in enumerate(text.split("\n")):
+        for i, char in enumerate(chars):
+            rows = FONT_3X5.glyphs.get(char.upper(), FONT_3X5.glyphs["?"])
+            for gy, row in enumerate(rows):
+                for gx, key in enumerate(row):
+                    if key == "#":
+                        cells.update((x + (i * 4 + gx) * size + dx, y + (line * 6 + gy) * size + dy)
+                                     for dx in range(size) for dy in range(size))
+    return cells
+
+
+@pytest.mark.parametrize("size", [1, 2, 3])
+def test_label_cells(size):
+    for text in ("HELLO", "a+b=c\n42%", "~`", ""):
+        cells = label_cells(text, 3, -2, FONT_3X5, size)
+        assert len(cells) == len(set(cells)) and set(cells) == reference_label(text, 3, -2, size), text
+
+
+def test_labels_on_the_board():
+    labels = [("AB", -2, 1, "#ff0000", FONT_3X5, 1), ("8", 2, 0, "#00ff00", FONT_3X5, 2)]
+    groups = labels_cells(labels, 12, 8)
+    owner = {}
+    for text, x, y, color, font, size in labels:
+        owner.update((cell, color) for cell in reference_label(text, x, y, size)
+                     if 0 <= cell[0] < 12 and 0 <= cell[1] < 8)
+    assert {cell: color for color, cells in groups.items() for cell in cells} == owner
+
+    # Stamped as one undo step
+    app = benchmarks.make_app(12, 8, 10)
+    app.stamp_labels(labels)
+    assert {(x, y): app.board.get(x, y) for y in range(8) for x in range(12) if app.board.get(x, y)} == owner
+    app.undo()
+    assert not any(app.board.get(x, y) for y in range(8) for x in range(12))
+
+
+def test_pil_font_glyphs():
+    font = PilFont()
+    cells, advance = glyph(font, "W", 12)
+    assert cells and advance > 0
+    assert glyph(font, "W", 12) is glyph(font, "W", 12)
+    assert set(cells) == set(font.cells("W", 12)[0])
+    assert glyph(font, " ", 12)[0] == ()
+
+
+def wait_saved(autosaver, saved, count, timeout=10):
+    deadline = time.monotonic() + timeout
+    while len(saved) < count and time.monotonic() < deadline:
+        autosaver.report()
+        time.sleep(0.001)
+    assert len(saved) == count
+
+
+def test_autosave_round_trip_and_prune(tmp_path, monkeypatch):
+    rng = random.Random(6)
+    directory = str(tmp_path)
+    saved = []
+    autosaver = Autosaver(FakeWidget(), directory, keep=2, on_saved=lambda path, error: saved.append((path, error)))
+    board = random_board(rng, SparseBoard, 150, 100)
+    for step in range(4):
+        for _ in range(rng.randint(1, 20) if step else 0):
+            board.set(rng.randrange(150), rng.randrange(100), rng.choice(COLORS))
+        # One file per save, as if a second went by between them
+        monkeypatch.setattr(autosaver, "path", lambda name: os.path.join(directory, f"{name}-20260101-00000{step}.cpl"))
+        assert autosaver.save(board, {"name": "test"}, "test")
+        wait_saved(autosaver, saved, step + 1)
+        path, error = saved[-1]
+        assert error is None
+        project, loaded, meta = ProjectFile.open(path)
+        ChunkLoader(project, loaded).finish()
+        assert meta["name"] == "test"
+        assert [[loaded.get(x, y) for x in range(150)] for y in range(100)] == \
+               [[board.get(x, y) for x in range(150)] for y in range(100)]
+        project.close()
+    assert sorted(os.listdir(directory)) == ["test-20260101-000002.cpl", "test-20260101-000003.cpl"]
+    assert not autosaver.save(board, {"name": "test"}, "test")  # Nothing changed since
+
+
+def test_autosave_keeps_going_after_an_error(tmp_path, monkeypatch):
+    saved = []
+    autosaver = Autosaver(FakeWidget(), str(tmp_path), keep=None, on_saved=lambda path, error: saved.append(error))
+    board = SparseBoard(150, 100)
+    board.set(1, 1, "#111111")
+
+    def broken(*args):
+        raise RuntimeError("broken")
+    write_project = autosave.write_project
+    monkeypatch.setattr(autosave, "write_project", broken)
+    autosaver.save(board, {}, "test")
+    wait_saved(autosaver, saved, 1)
+    assert isinstance(saved[0], RuntimeError)
+
+    monkeypatch.setattr(autosave, "write_project", write_project)
+    board.set(100, 90, "#222222")
+    autosaver.save(board, {}, "test")
+    wait_saved(autosaver, saved, 2)
+    assert saved[1] is None
+    path, = [os.path.join(str(tmp_path), entry) for entry in os.listdir(str(tmp_path))]
+    project, loaded, _ = ProjectFile.open(path)
+    ChunkLoader(project, loaded).finish()
+    assert loaded.get(1, 1) == "#111111" and loaded.get(100, 90) == "#222222"
+    project.close()
+
+    with pytest.raises(ValueError):
+        Autosaver(FakeWidget(), str(tmp_path), keep=0)
+
+
+@pytest.mark.parametrize("cls", [Board, SparseBoard])
+def test_mipmaps_follow_edits(cls, monkeypatch):
+    monkeypatch.setattr(Mipmaps, "TILE", 16)  # Many tiles on a small board
+    rng = random.Random(12)
+    width, height = 230, 150
+    board = cls(width, height)
+    board.fill_rect(10, 10, 60, 40, "#ff0000")
+    mipmaps = Mipmaps(board)
+    levels = (1, 2, 3)
+    for level in levels:
+        mipmaps.image(level, 0, 0, *mipmaps.size(level))
+    for step in range(40):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = rng.randint(x0 + 1, min(x0 + 40, width)), rng.randint(y0 + 1, min(y0 + 40, height))
+        board.fill_rect(x0, y0, x1, y1, rng.choice(COLORS))
+        mipmaps.update(x0, y0, x1, y1)
+        level = rng.choice(levels)
+        fresh = Mipmaps(board)
+        assert mipmaps.image(level, 0, 0, *mipmaps.size(level)).tobytes() == \
+               fresh.image(level, 0, 0, *fresh.size(level)).tobytes(), step
+    for level in levels:
+        assert mipmaps.image(level, 0, 0, *mipmaps.size(level)).tobytes() == \
+               board.to_image().reduce(2 ** level).tobytes(), level
+
+
+def grid_of(block):
+    return [list(row) for row in block.rows()]
+
+
+def test_block_rotate_mirror():
+    rng = random.Random(5)
+    for trial in range(50):
+        width, height = rng.randint(1, 12), rng.randint(1, 12)
+        board = random_board(rng, Board, width, height)
+        block = Block.from_board(board, 0, 0, width, height)
+        grid = grid_of(block)
+        clockwise = block.rotated()
+        assert (clockwise.width, clockwise.height) == (height, width)
+        assert grid_of(clockwise) == [[grid[height - 1 - x][y] for x in range(height)] for y in range(width)], trial
+        assert grid_of(block.rotated(clockwise=False)) == \
+               [[grid[x][width - 1 - y] for x in range(height)] for y in range(width)], trial
+        assert grid_of(block.mirrored()) == [row[::-1] for row in grid], trial
+        assert grid_of(block.mirrored(vertical=True)) == grid[::-1], trial
+        assert grid_of(clockwise.rotated().rotated().rotated()) == grid, trial
+
+        target = Board(width + 4, height + 4)
+        x, y = rng.randint(-3, 4), rng.randint(-3, 4)
+        delta, box = block.write(target, x, y)
+        for ty in range(target.height):
+            for tx in range(target.width):
+                inside = 0 <= tx - x < width and 0 <= ty - y < height
+                expected = board.get(tx - x, ty - y) if inside else None
+                assert target.get(tx, ty) == expected, (trial, tx, ty)
+        if delta is not None:
+            delta.apply(target, undo=True)
+            assert not any(target.get(tx, ty) for ty in range(target.height) for tx in range(target.width))
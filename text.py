@@ -0,0 +1,123 @@
+from functools import lru_cache
+
+from PIL import ImageFont
+
+
+class BitmapFont:
+    """A fixed-width font drawn as rows of characters, "#" for a set cell and "." for an empty one.
+
+    Each glyph is its rows joined by "/". Lowercase letters use the uppercase
+    glyphs and characters without a glyph are drawn as fallback.
+    """
+
+    def __init__(self, name, glyphs, fallback="?"):
+        self.name = name
+        self.glyphs = {char: rows.split("/") for char, rows in glyphs.items()}
+        self.width = max(len(row) for rows in self.glyphs.values() for row in rows)
+        self.height = max(len(rows) for rows in self.glyphs.values())
+        self.fallback = fallback
+
+    def __repr__(self):
+        return f"BitmapFont({self.name!r})"
+
+    def line_height(self, size):
+        return (self.height + 1) * size
+
+    def cells(self, char, size):
+        """Return the set cells of a character, each font pixel size cells across, and its advance."""
+        rows = self.glyphs.get(char) or self.glyphs.get(char.upper()) or self.glyphs[self.fallback]
+        cells = [(x * size + dx, y * size + dy) for y, row in enumerate(rows) for x, key in enumerate(row)
+                 if key == "#" for dy in range(size) for dx in range(size)]
+        return cells, (self.width + 1) * size
+
+
+class PilFont:
+    """A TrueType (or PIL's default) font rasterized at one cell per pixel, keeping pixels at least half covered."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.fonts = {}  # size -> ImageFont
+
+    def __repr__(self):
+        return f"PilFont({self.path!r})"
+
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = self.fonts[size] = (ImageFont.truetype(self.path, size) if self.path
+                                       else ImageFont.load_default(size))
+        return font
+
+    def line_height(self, size):
+        ascent, descent = self.font(size).getmetrics()
+        return ascent + descent
+
+    def cells(self, char, size):
+        font = self.font(size)
+        mask = font.getmask(char, mode="L")
+        left, top = font.getbbox(char)[:2]
+        width, height = mask.size
+        cells = [(left + x, top + y) for y in range(height) for x in range(width) if mask.getpixel((x, y)) >= 128]
+        return cells, round(font.getlength(char))
+
+
+FONT_3X5 = BitmapFont("3x5", {
+    " ": ".../.../.../.../...", "A": ".#./#.#/###/#.#/#.#", "B": "##./#.#/##./#.#/##.", "C": ".##/#../#../#../.##",
+    "D": "##./#.#/#.#/#.#/##.", "E": "###/#../##./#../###", "F": "###/#../##./#../#..", "G": ".##/#../#.#/#.#/.##",
+    "H": "#.#/#.#/###/#.#/#.#", "I": "###/.#./.#./.#./###", "J": "..#/..#/..#/#.#/.#.", "K": "#.#/#.#/##./#.#/#.#",
+    "L": "#../#../#../#../###", "M": "#.#/###/###/#.#/#.#", "N": "##./#.#/#.#/#.#/#.#", "O": ".#./#.#/#.#/#.#/.#.",
+    "P": "##./#.#/##./#../#..", "Q": ".#./#.#/#.#/##./.##", "R": "##./#.#/##./#.#/#.#", "S": ".##/#../.#./..#/##.",
+    "T": "###/.#./.#./.#./.#.", "U": "#.#/#.#/#.#/#.#/.##", "V": "#.#/#.#/#.#/.#./.#.", "W": "#.#/#.#/###/###/#.#",
+    "X": "#.#/#.#/.#./#.#/#.#", "Y": "#.#/#.#/.#./.#./.#.", "Z": "###/..#/.#./#../###",
+    "0": "###/#.#/#.#/#.#/###", "1": ".#./##./.#./.#./###", "2": "##./..#/.#./#../###", "3": "##./..#/.#./..#/##.",
+    "4": "#.#/#.#/###/..#/..#", "5": "###/#../##./..#/##.", "6": ".##/#../###/#.#/###", "7": "###/..#/.#./#../#..",
+    "8": "###/#.#/###/#.#/###", "9": "###/#.#/###/..#/##.",
+    ".": "..././.../.../.#.", ",": ".../.../.../.#./#..", ":": ".../.#./.../.#./...", "-": ".../.../###/.../...",
+    "+": ".../.#./###/.#./...", "=": ".../###/.../###/...", "/": "..#/..#/.#./#../#..", "_": ".../.../.../.../###",
+    "(": ".#./#../#../#../.#.", ")": ".#./..#/..#/..#/.#.", "!": ".#./.#./.#./.../.#.", "?": "##./..#/.#./.../.#.",
+    "%": "#.#/..#/.#./#../#.#", "'": ".#./.#./.../.../...", "#": "#.#/###/#.#/###/#.#", "<": "..#/.#./#../.#./..#",
+    ">": "#../.#./..#/.#./#..", "*": "#.#/.#./#.#/.../...",
+})
+FONTS = {"3x5": FONT_3X5, "default": PilFont()}
+
+
+@lru_cache(maxsize=4096)
+def glyph(font, char, size):
+    """Return the cells of a character as (x, y) offsets, and how far it moves the pen.
+
+    Glyphs are rasterized once per font, character and size and then shared.
+    Color is applied when the cells are written, as one palette index for the
+    whole label, so it does not multiply the cache.
+    """
+    cells, advance = font.cells(char, size)
+    return tuple(cells), advance
+
+
+def label_cells(text, x, y, font=FONT_3X5, size=1):
+    """Return the cells of a label with its top left corner at cell (x, y), one line per line of text."""
+    cells = []
+    line_height = font.line_height(size)
+    for row, line in enumerate(text.split("\n")):
+        pen_x, pen_y = x, y + row * line_height
+        for char in line:
+            offsets, advance = glyph(font, char, size)
+            cells.extend((pen_x + dx, pen_y + dy) for dx, dy in offsets)
+            pen_x += advance
+    return cells
+
+
+def labels_cells(labels, width, height):
+    """Lay out many labels at once, grouping the cells inside a width x height board by color.
+
+    labels are (text, x, y, color, font, size) tuples. A cell covered by
+    labels of different colors goes to the last of them.
+    """
+    owner = {}  # (x, y) -> color
+    for text, x, y, color, font, size in labels:
+        for cell in label_cells(text, x, y, font, size):
+            if 0 <= cell[0] < width and 0 <= cell[1] < height:
+                owner[cell] = color
+    groups = {}
+    for cell, color in owner.items():
+        groups.setdefault(color, []).append(cell)
+    return groups
@@ -0,0 +1,341 @@
+from array import array
+
+from board import CELL_TYPE, CHUNK_SIZE, EMPTY, SparseBoard
+
+
+def run_end(cells, start, stop, same):
+    """Return the first index in [start, stop) whose value differs from same[0], or stop.
+
+    Blocks of doubling size are compared as whole array slices, so the scan
+    runs in C and only takes a logarithmic number of Python steps.
+    """
+    if cells[start:stop] == same[:stop - start]:
+        return stop  # The common case for large fills: the run reaches the end
+    i, block = start, 1
+    while i < stop:
+        size = min(block, stop - i)
+        if cells[i:i + size] == same[:size]:
+            i += size
+            block *= 2
+            continue
+        # The first mismatch lies in [lo, hi)
+        lo, hi = i, i + size
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if cells[lo:mid] == same[:mid - lo]:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+    return stop
+
+
+def run_start(cells, start, stop, same):
+    """Return the smallest index in [stop, start] from which every value up to start equals same[0]."""
+    if cells[stop:start + 1] == same[:start + 1 - stop]:
+        return stop
+    i, block = start + 1, 1
+    while i > stop:
+        size = min(block, i - stop)
+        if cells[i - size:i] == same[:size]:
+            i -= size
+            block *= 2
+            continue
+        # The last mismatch lies in [lo, hi)
+        lo, hi = i - size, i
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if cells[mid:hi] == same[:hi - mid]:
+                hi = mid
+            else:
+                lo = mid
+        return hi
+    return stop
+
+
+def find_value(view, start, stop, needle):
+    """Return the first index in [start, stop) holding the value packed in needle, or -1.
+
+    view is a byte view of the cell array, searched with bytes.find rather
+    than array.index, which compares item by item as Python objects.
+    """
+    itemsize = len(needle)
+    data = view[start * itemsize:stop * itemsize].tobytes()
+    pos = data.find(needle)
+    while pos % itemsize and pos != -1:
+        pos = data.find(needle, pos + 1)  # Skip matches that straddle two cells
+    return -1 if pos == -1 else start + pos // itemsize
+
+
+def _match_table(value):
+    """Return, for each byte of a packed cell, a bytes.translate table mapping that byte of value to 1, others to 0."""
+    tables = []
+    for byte in array(CELL_TYPE, [value]).tobytes():
+        table = bytearray(256)
+        table[byte] = 1
+        tables.append(bytes(table))
+    return tables
+
+
+def _match_row(cells, start, width, tables):
+    """Return one byte per cell of cells[start:start + width], 1 where it holds the value tables match.
+
+    Each byte position of the packed cells is translated on its own and the
+    results are combined as one big integer, so the whole row is done in C.
+    """
+    data = cells[start:start + width].tobytes()
+    step = len(tables)
+    match = -1
+    for i, table in enumerate(tables):
+        match &= int.from_bytes(data[i::step].translate(table), "little")
+    return bytearray(match.to_bytes(width, "little"))
+
+
+def _scanline(cells, stride, width, height, seeds, target, value, reach):
+    """Scanline fill over a flat array of rows stride cells apart, of which the first width are used.
+
+    Fills every run of target cells reachable from the (x, y) seeds with
+    value and returns the filled spans as (y, x0, x1) tuples. Each row the
+    fill reaches is turned once into a byte mask of its target cells, so
+    finding run ends and the runs next to a span are bytes.find calls.
+    """
+    fill_row = array(CELL_TYPE, [value]) * width
+    blank = bytes(width)
+    tables = _match_table(target)
+    # Row y -> mask of its cells still to fill, with an empty row past both ends (at -1 and height)
+    masks = [None] * height + [blank]
+    spans = []
+    pop, push = seeds.pop, seeds.append
+    while seeds:
+        sx, sy = pop()
+        mask = masks[sy]
+        if mask is None:
+            mask = masks[sy] = _match_row(cells, sy * stride, width, tables)
+        if not mask[sx]:
+            continue  # Already filled through another seed
+        x0 = mask.rfind(0, 0, sx) + 1
+        x1 = mask.find(0, sx)
+        if x1 == -1:
+            x1 = width
+        row = sy * stride
+        cells[row + x0:row + x1] = fill_row[:x1 - x0]
+        mask[x0:x1] = blank[:x1 - x0]
+        spans.append((sy, x0, x1))
+
+        # Queue one seed per run of target cells in the rows above and below
+        lo = x0 - reach if x0 > reach else 0
+        hi = x1 + reach if x1 + reach < width else width
+        for ny in (sy - 1, sy + 1):
+            near = masks[ny]
+            if near is None:
+                near = masks[ny] = _match_row(cells, ny * stride, width, tables)
+            i = near.find(1, lo, hi)
+            while i != -1:
+                push((i, ny))
+                i = near.find(0, i, hi)
+                if i == -1:
+                    break
+                i = near.find(1, i, hi)
+    return spans
+
+
+def flood_fill(board, x, y, color, connectivity=4):
+    """Fill the region of same-colored cells around (x, y) with color.
+
+    Works span by span (scanline), so it uses no recursion and its cost grows
+    with the filled area. Returns the filled spans as (y, x0, x1) tuples with
+    x1 exclusive, or an empty list if nothing changed.
+    """
+    value = board.palette.intern(color)
+    target = board.value(x, y)
+    if target == value:
+        return []
+    # With 8-connectivity, spans also touch the cells diagonally next to their ends
+    reach = 1 if connectivity == 8 else 0
+    if isinstance(board, SparseBoard):
+        spans = _flood_fill_tiles(board, x, y, target, value, reach)
+    else:
+        width = board.width
+        spans = _scanline(board.cells, width, width, board.height, [(x, y)], target, value, reach)
+        board.touch_spans(spans)
+    # The cells were written behind the board's back, so settle the palette counts here
+    board.palette.replace(target, value, sum(x1 - x0 for _, x0, x1 in spans))
+    if value != EMPTY:
+        board.palette.grow(value, *spans_bbox(spans))
+    return spans
+
+
+def _flood_fill_tiles(board, x, y, target, value, reach):
+    """Flood fill a SparseBoard tile by tile, handing seeds over at tile borders.
+
+    Unallocated tiles are only visited when filling empty cells, and tiles
+    holding nothing but the target are filled whole without scanning them.
+    After a tile, each of its edges is compared as a byte mask with the
+    facing edge of the next tile, which gets one seed per run of target
+    cells next to a cell just filled, so tiles already done are not
+    scanned again. Spans that meet at tile borders are joined at the end.
+    """
+    size = CHUNK_SIZE
+    tiles = board.tiles
+    tables = _match_table(target)
+    pending = {(x // size, y // size): [(x % size, y % size)]}
+    spans = []
+
+    def hand_over(key, seeds):
+        if seeds:
+            pending.setdefault(key, []).extend(seeds)
+
+    def corner(filled, tx, ty, cx, cy):
+        # With 8-connectivity, a filled corner cell touches the corner of the diagonal tile
+        if filled and 0 <= tx < board.chunk_cols and 0 <= ty < board.chunk_rows:
+            near = tiles.get((tx, ty))
+            if (near[cy * size + cx] if near is not None else EMPTY) == target:
+                hand_over((tx, ty), [(cx, cy)])
+
+    while pending:
+        (tx, ty), seeds = pending.popitem()
+        left, top = tx * size, ty * size
+        width, height = min(size, board.width - left), min(size, board.height - top)
+        tile = tiles.get((tx, ty))
+        if tile is None and target != EMPTY:
+            continue
+        if tile is None or (width == height == size and tile.count(target) == len(tile)):
+            # A tile holding nothing but the target is filled whole, without scanning it
+            tile = board._tile(tx, ty)
+            fill_row = array(CELL_TYPE, [value]) * width
+            for row in range(height):
+                tile[row * size:row * size + width] = fill_row
+            tile_spans = [(row, 0, width) for row in range(height)]
+        else:
+            tile_spans = _scanline(tile, size, width, height, seeds, target, value, reach)
+            board._release(tx, ty)
+        if not tile_spans:
+            continue
+        board.touch(left, top, left + width, top + height)
+
+        # Cells of each edge of the tile filled just now
+        left_edge, right_edge = bytearray(height), bytearray(height)
+        top_edge, bottom_edge = bytearray(width), bytearray(width)
+        ones = b"\1" * width
+        for sy, x0, x1 in tile_spans:
+            spans.append((top + sy, left + x0, left + x1))
+            if x0 == 0:
+                left_edge[sy] = 1
+            if x1 == width:
+                right_edge[sy] = 1
+            if sy == 0:
+                top_edge[x0:x1] = ones[:x1 - x0]
+            if sy == height - 1:
+                bottom_edge[x0:x1] = ones[:x1 - x0]
+
+        if tx > 0:
+            near = tiles.get((tx - 1, ty))
+            line = near[size - 1::size][:height] if near is not None else None
+            hand_over((tx - 1, ty), [(size - 1, i) for i in _edge_runs(left_edge, line, target, reach, tables)])
+        if tx + 1 < board.chunk_cols:
+            near = tiles.get((tx + 1, ty))
+            line = near[::size][:height] if near is not None else None
+            hand_over((tx + 1, ty), [(0, i) for i in _edge_runs(right_edge, line, target, reach, tables)])
+        if ty > 0:
+            near = tiles.get((tx, ty - 1))
+            line = near[(size - 1) * size:(size - 1) * size + width] if near is not None else None
+            hand_over((tx, ty - 1), [(i, size - 1) for i in _edge_runs(top_edge, line, target, reach, tables)])
+        if ty + 1 < board.chunk_rows:
+            near = tiles.get((tx, ty + 1))
+            line = near[:width] if near is not None else None
+            hand_over((tx, ty + 1), [(i, 0) for i in _edge_runs(bottom_edge, line, target, reach, tables)])
+        if reach:
+            corner(top_edge[0], tx - 1, ty - 1, size - 1, size - 1)
+            corner(top_edge[-1], tx + 1, ty - 1, 0, size - 1)
+            corner(bottom_edge[0], tx - 1, ty + 1, size - 1, 0)
+            corner(bottom_edge[-1], tx + 1, ty + 1, 0, 0)
+    return _join_spans(spans)
+
+
+def _edge_runs(edge, line, target, reach, tables):
+    """Return where the runs of target cells start in the facing edge of the next tile, among those touching edge.
+
+    edge has one byte per cell of a tile's edge, 1 where a cell was just
+    filled; line holds the facing cells, or is None for an unallocated tile.
+    """
+    if line is None and target != EMPTY:
+        return []
+    count = len(edge)
+    touched = int.from_bytes(edge, "little")
+    if reach:
+        touched |= touched << 8 | touched >> 8  # Diagonal neighbours along the edge
+    match = _match_row(line, 0, count, tables) if line is not None else b"\1" * count
+    mask = (touched & int.from_bytes(match, "little")).to_bytes(count, "little")
+    starts = []
+    i = mask.find(1)
+    while i != -1:
+        starts.append(i)
+        i = mask.find(0, i)
+        if i == -1:
+            break
+        i = mask.find(1, i)
+    return starts
+
+
+def _join_spans(spans):
+    """Sort (y, x0, x1) spans and join the ones that continue each other on a row."""
+    spans.sort()
+    joined = []
+    for span in spans:
+        if joined and joined[-1][0] == span[0] and joined[-1][2] == span[1]:
+            joined[-1] = (span[0], joined[-1][1], span[2])
+        else:
+            joined.append(span)
+    return joined
+
+
+def bresenham(start, end):
+    """Return the cells of a straight line from start to end (both included), in integer steps."""
+    x, y = start
+    x1, y1 = end
+    dx, dy = abs(x1 - x), -abs(y1 - y)
+    step_x, step_y = (1 if x < x1 else -1), (1 if y < y1 else -1)
+    error = dx + dy
+    cells = [(x, y)]
+    while (x, y) != (x1, y1):
+        double = 2 * error
+        if double >= dy:
+            error += dy
+            x += step_x
+        if double <= dx:
+            error += dx
+            y += step_y
+        cells.append((x, y))
+    return cells
+
+
+def line_cells(start, end, snap=True):
+    """Return the cells of a line between two cells, start included.
+
+    With snap, the line is bent to the closest of horizontal, vertical or 45°
+    like the Line tool does; without it, it is a plain Bresenham line.
+    """
+    if not snap:
+        return bresenham(start, end)
+    x, y = start
+    dx, dy = end[0] - x, end[1] - y
+    if abs(dy) > 2 * abs(dx):  # Vertical line
+        return [(x, y + i) for i in range(0, dy + (1 if dy >= 0 else -1), 1 if dy >= 0 else -1)]
+    if abs(dx) > 2 * abs(dy):  # Horizontal line
+        return [(x + i, y) for i in range(0, dx + (1 if dx >= 0 else -1), 1 if dx >= 0 else -1)]
+    # Diagonal line, as long as the average of both distances
+    step_x, step_y = (1 if dx >= 0 else -1), (1 if dy >= 0 else -1)
+    return [(x + i * step_x, y + i * step_y) for i in range((abs(dx) + abs(dy)) // 2 + 1)]
+
+
+def cells_bbox(cells):
+    """Return the (x0, y0, x1, y1) bounding box of some (x, y) cells, exclusive at the far end."""
+    xs = [cell[0] for cell in cells]
+    ys = [cell[1] for cell in cells]
+    return (min(xs), min(ys), max(xs) + 1, max(ys) + 1)
+
+
+def spans_bbox(spans):
+    """Return the (x0, y0, x1, y1) bounding box of some spans, exclusive at the far end."""
+    ys = [span[0] for span in spans]
+    return (min(span[1] for span in spans), min(ys), max(span[2] for span in spans), max(ys) + 1)